@@ -0,0 +1,1032 @@
+"""Async entry point serving the same /api/* and /auth/* routes as main.py.
+
+Run with an ASGI server, for example:
+    uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 4
+
+Mongo goes through Motor, outbound email through aiosmtplib and Google OAuth
+through authlib's httpx client, so slow I/O never pins a worker thread.
+Request validation and document shaping come from services.py and are shared
+with the Flask app. One-off maintenance commands (create-indexes,
+migrate-images, reindex-search, rebuild-impact, rebuild-similar,
+geocode-products, expire-inquiries, refresh-oidc, outbox-worker) stay on
+the Flask CLI.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import contextlib
+from datetime import datetime
+from functools import wraps, partial
+from urllib import parse as urllib_parse
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from gridfs.errors import NoFile
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, RedirectResponse, StreamingResponse
+from starlette.routing import Route
+from authlib.integrations.starlette_client import OAuth
+
+from config import (
+    MONGODB_URI, MONGODB_DB, JWT_SECRET, FRONTEND_ORIGIN,
+    GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_DISCOVERY_URL, GOOGLE_USERINFO_URL, OIDC_CACHE_PATH, OIDC_CACHE_TTL,
+    IMAGE_STORE_BACKEND, IMAGE_STORE_PATH, MAX_IMAGE_BYTES,
+    SMTP_HOST, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD,
+    USER_CACHE_URL, USER_CACHE_TTL, USER_CACHE_SIZE,
+    RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL, ADMIN_EMAILS,
+    EMAIL_WORKERS, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE_SECONDS,
+    BULK_IMPORT_CHUNK_SIZE, BULK_IMPORT_MAX_ERRORS, EXPORT_BATCH_SIZE, SLOW_REQUEST_MS, METRICS_TOKEN,
+    COMPRESS_MIN_BYTES, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY, STREAM_JSON_MIN_ITEMS,
+    RATE_LIMIT_ENABLED, RATE_LIMIT_URL, RATE_LIMITS, RATE_LIMIT_MAX_KEYS, TRUSTED_PROXY_COUNT,
+    LIVE_FEED_MODE, LIVE_FEED_POLL_SECONDS, LIVE_FEED_POLL_OVERLAP_SECONDS, LIVE_FEED_BUFFER_SIZE, LIVE_FEED_QUEUE_SIZE,
+    LIVE_FEED_MAX_SUBSCRIBERS, LIVE_FEED_HEARTBEAT_SECONDS, LIVE_FEED_CATCH_UP_LIMIT, READINESS_TIMEOUT_MS,
+    SIMILAR_INDEX_PATH, SIMILAR_MAX_QUERY_TERMS, SIMILAR_MIN_SCORE, MONGO_CREATE_INDEXES
+)
+from services import (
+    ServiceError, DEFAULT_IMPACT_STATS, IMPACT_FIELDS, PRODUCT_PROJECTION,
+    PRODUCT_REQUIRED_FIELDS, INQUIRY_REQUIRED_FIELDS, SOLD_PROJECTION, SOLD_CHECK_PROJECTION,
+    impact_rollup_updates, impact_credit_updates, impact_summary_params, summarize_impact,
+    product_list_params, finish_product_page, require_fields, image_fields, new_product, public_product,
+    product_update, search_text_missing, apply_search_terms, sold_filter, sold_update, sold_failure,
+    check_inquiry_product, new_inquiry, inquiry_email_payload, build_inquiry_email,
+    bearer_token, decode_token, create_jwt_for_user, oauth_user_upsert, public_user, userinfo_identity,
+    PRODUCT_SORT, EXPORT_FORMATS, ImportDecoder, ImportBatch, import_format, import_product,
+    import_image_fields, bulk_insert_errors, export_filter, export_header, export_line,
+    dumps_bytes, json_array_parts, seller_dashboard_params, seller_dashboard,
+    SIMILAR_SOURCE_PROJECTION, SIMILAR_PROJECTION, UNSOLD, similar_limit, similar_candidates, rank_similar,
+    similar_fallback_filter, duplicate_inquiry_filter, public_inquiry, inquiry_list_params, finish_inquiry_page,
+    INQUIRY_PROJECTION
+)
+from outbox import AsyncEmailOutbox, AsyncSMTPConnection, STATUS_HELD, STATUS_QUEUED
+from usercache import LocalUserCache, RedisUserCache
+from responsecache import ResponseCache
+from metrics import Metrics, MetricsMiddleware
+from compression import CompressionMiddleware, negotiate, compressible, compress
+from oidc import ProviderMetadataCache, fetch_json
+from livefeed import FeedHub, FeedFull, AsyncLiveFeed, AsyncSubscriber, format_event, parse_categories, RESET_EVENT, HEARTBEAT
+from similar import SimilarityIndex, SimilarItems
+from mongo import client_options, ensure_indexes_async, indexes_version, is_current, pool_status, SCHEMA_COLLECTION
+from ratelimit import LocalRateLimiter, RedisRateLimiter, load_policies, client_ip, retry_after_header
+from blobstore import LocalDiskBlobStore, decode_image, make_thumbnails, image_meta, needs_thumbnails, DATA_URL_PREFIX
+
+logger = logging.getLogger("ecowave.asgi")
+
+# Per-process caches behave exactly as in the Flask app. The Redis user cache
+# client is synchronous, so its calls go through user_cache_call.
+if USER_CACHE_URL:
+    user_cache = RedisUserCache(USER_CACHE_URL, ttl=USER_CACHE_TTL)
+else:
+    user_cache = LocalUserCache(ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE)
+
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL)
+metrics = Metrics(slow_request_seconds=SLOW_REQUEST_MS / 1000, logger=logger)
+
+rate_limiter = None
+if RATE_LIMIT_ENABLED:
+    if RATE_LIMIT_URL:
+        rate_limiter = RedisRateLimiter(RATE_LIMIT_URL, load_policies(RATE_LIMITS), logger=logger)
+    else:
+        rate_limiter = LocalRateLimiter(load_policies(RATE_LIMITS), max_keys=RATE_LIMIT_MAX_KEYS)
+
+oauth = OAuth()
+google = oauth.register(
+    name="google",
+    client_id=GOOGLE_CLIENT_ID,
+    client_secret=GOOGLE_CLIENT_SECRET,
+    server_metadata_url=GOOGLE_DISCOVERY_URL,
+    client_kwargs={"scope": "openid email profile"},
+)
+
+
+def fetch_oidc_json(url: str) -> dict:
+    with metrics.external_call("oauth", "discovery"):
+        return fetch_json(url)
+
+
+# Shares the Flask app's disk cache; a cold cache is fetched in a worker thread
+oidc_cache = ProviderMetadataCache(GOOGLE_DISCOVERY_URL, OIDC_CACHE_PATH, ttl=OIDC_CACHE_TTL, fetch=fetch_oidc_json, logger=logger)
+
+
+def create_client() -> AsyncIOMotorClient:
+    # Same pool sizing, timeouts and local/Atlas TLS detection as main.py
+    return AsyncIOMotorClient(MONGODB_URI, **client_options(MONGODB_URI, [metrics.command_listener(), metrics.pool_listener()]))
+
+
+class AsyncBlobStore:
+    """Blob store access that never blocks the event loop"""
+
+    def __init__(self, db):
+        if IMAGE_STORE_BACKEND == "gridfs":
+            # Same bucket layout as GridFSBlobStore, so both modes share blobs
+            self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name="images")
+            self.disk = None
+        else:
+            self.bucket = None
+            self.disk = LocalDiskBlobStore(IMAGE_STORE_PATH)
+
+    async def put(self, digest: str, data: bytes) -> None:
+        if self.disk is not None:
+            await run_in_threadpool(self.disk.put, digest, data)
+            return
+        async for _ in self.bucket.find({"filename": digest}, limit=1):
+            return
+        await self.bucket.upload_from_stream(digest, data)
+
+    async def read(self, digest: str):
+        if self.disk is not None:
+            path = self.disk.open(digest)
+            if path is None:
+                return None
+            return await run_in_threadpool(_read_file, path)
+        try:
+            stream = await self.bucket.open_download_stream_by_name(digest)
+        except NoFile:
+            return None
+        return await stream.read()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def store_blob(state, data: bytes, content_type: str, **meta) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    # Identical uploads share one blob and one metadata row
+    if await state.images_col.find_one({"hash": digest}, {"_id": 1}) is None:
+        await state.image_store.put(digest, data)
+        await state.images_col.update_one(
+            {"hash": digest},
+            {"$setOnInsert": image_meta(digest, data, content_type, **meta)},
+            upsert=True
+        )
+    return digest
+
+
+async def store_product_image(state, image: str) -> dict:
+    """Async counterpart of main.store_product_image; decoding and resizing run in a thread"""
+    try:
+        content_type, data, digest = await run_in_threadpool(decode_image, image, MAX_IMAGE_BYTES)
+        existing = await state.images_col.find_one({"hash": digest}, {"_id": 0, "thumbnails": 1})
+        if not needs_thumbnails(existing):
+            return image_fields({"hash": digest, "thumbnails": existing.get("thumbnails", {})})
+        thumbnails = await run_in_threadpool(make_thumbnails, data)
+    except ValueError as e:
+        raise ServiceError(str(e))
+
+    await store_blob(state, data, content_type)
+    stored = {"hash": digest, "thumbnails": {}}
+    for name, thumb in thumbnails.items():
+        stored["thumbnails"][name] = await store_blob(state, thumb, "image/jpeg", source=digest)
+    if stored["thumbnails"]:
+        await state.images_col.update_one({"hash": digest}, {"$set": {"thumbnails": stored["thumbnails"]}})
+    return image_fields(stored)
+
+
+# Response helpers
+def jsonify(body, status: int = 200) -> Response:
+    # Same bytes as Flask's jsonify: sorted keys, compact separators, trailing newline
+    return Response(dumps_bytes(body) + b"\n", status_code=status, media_type="application/json")
+
+
+async def read_json(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/").strip('"') == etag for tag in candidates)
+
+
+def parse_byte_range(header: str, size: int):
+    """Parse a single 'bytes=a-b' range into inclusive (start, end), or None to send everything"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].partition("-")
+    try:
+        if start:
+            start, end = int(start), int(end) if end else size - 1
+        else:
+            start, end = max(size - int(end), 0), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def api_handler(action: str):
+    """Map ServiceError and unexpected failures to the Flask handlers' JSON errors"""
+    def wrap(f):
+        @wraps(f)
+        async def decorated(request, *args, **kwargs):
+            try:
+                return await f(request, *args, **kwargs)
+            except ServiceError as e:
+                return jsonify({"success": False, "error": e.message}, e.status)
+            except Exception as e:
+                logger.error(f"Error {action}: {e}")
+                return jsonify({"success": False, "error": str(e)}, 500)
+        return decorated
+    return wrap
+
+
+async def user_cache_call(method, *args):
+    """Run a user cache method; Redis round trips go to the threadpool, off the event loop"""
+    if USER_CACHE_URL:
+        return await run_in_threadpool(method, *args)
+    return method(*args)
+
+
+async def cached_user(email: str):
+    """The cached user document, or None on a miss; a cache outage is treated as a miss"""
+    try:
+        return await user_cache_call(user_cache.get, email)
+    except Exception as e:
+        logger.warning(f"User cache read failed, loading from Mongo: {e}")
+        return None
+
+
+async def cache_user(email: str, user: dict) -> None:
+    try:
+        await user_cache_call(user_cache.set, email, user)
+    except Exception as e:
+        logger.warning(f"User cache write failed: {e}")
+
+
+async def uncache_users(*emails) -> None:
+    """Drop cached user documents; on a cache outage they stay stale until USER_CACHE_TTL"""
+    try:
+        await user_cache_call(user_cache.invalidate, *emails)
+    except Exception as e:
+        logger.warning(f"User cache invalidation failed: {e}")
+
+
+def token_required(f):
+    @wraps(f)
+    async def decorated(request, *args, **kwargs):
+        token = bearer_token(request.headers.get('Authorization'))
+        if not token:
+            return jsonify({'message': 'Token is missing!'}, 401)
+
+        try:
+            email = decode_token(token)['email']
+        except Exception as e:
+            return jsonify({'message': 'Token is invalid!', 'error': str(e)}, 401)
+
+        current_user = await cached_user(email)
+        if current_user is None:
+            current_user = await request.app.state.users_col.find_one({"email": email})
+            if not current_user:
+                return jsonify({'message': 'User not found!'}, 401)
+            await cache_user(email, current_user)
+
+        return await f(request, current_user, *args, **kwargs)
+
+    return decorated
+
+
+def admin_required(f):
+    @wraps(f)
+    @token_required
+    async def decorated(request, current_user, *args, **kwargs):
+        if current_user.get("email") not in ADMIN_EMAILS:
+            return jsonify({'message': 'Admin access required!'}, 403)
+        return await f(request, current_user, *args, **kwargs)
+
+    return decorated
+
+
+async def request_ip(request: Request):
+    remote_addr = request.client.host if request.client else None
+    return client_ip(remote_addr, request.headers.get("x-forwarded-for"), TRUSTED_PROXY_COUNT)
+
+
+async def request_subject(request: Request):
+    """Email in the caller's JWT, or None; the signature is checked but the user is not loaded"""
+    token = bearer_token(request.headers.get('Authorization'))
+    if not token:
+        return None
+    try:
+        return decode_token(token).get('email')
+    except Exception:
+        return None
+
+
+async def rate_limit_hit(policy: str, key: str) -> tuple:
+    """rate_limiter.hit(); the Redis limiter's script call runs in the threadpool, off the event loop"""
+    if RATE_LIMIT_URL:
+        return await run_in_threadpool(rate_limiter.hit, policy, key)
+    return rate_limiter.hit(policy, key)
+
+
+async def rate_limit_response(policy: str, key: str):
+    """A 429 response if key has used up its bucket for policy, otherwise None"""
+    if rate_limiter is None or not key:
+        return None
+    allowed, retry_after = await rate_limit_hit(policy, key)
+    if allowed:
+        return None
+    metrics.record_rate_limited(policy)
+    response = jsonify({"success": False, "error": "Too many requests, please try again later"}, 429)
+    response.headers["Retry-After"] = retry_after_header(retry_after)
+    return response
+
+
+async def over_soft_limit(policy: str, key: str) -> bool:
+    """Take from key's bucket for a policy that changes how a request is handled rather than refusing it"""
+    if rate_limiter is None or not key or (await rate_limit_hit(policy, key))[0]:
+        return False
+    metrics.record_rate_limited(policy)
+    return True
+
+
+def rate_limited(*limits):
+    """Check (policy, key function) pairs before the handler runs; a None key skips its policy"""
+    def decorator(f):
+        @wraps(f)
+        async def decorated(request, *args, **kwargs):
+            for policy, key in limits:
+                limited = await rate_limit_response(policy, await key(request))
+                if limited is not None:
+                    return limited
+            return await f(request, *args, **kwargs)
+        return decorated
+    return decorator
+
+
+def cached_response(f):
+    """Serve catalogue reads from the response cache with weak ETags"""
+    @wraps(f)
+    async def decorated(request, *args, **kwargs):
+        key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+        entry = response_cache.get(key)
+        if entry is None:
+            generation = response_cache.generation
+            response = await f(request, *args, **kwargs)
+            # Streamed (very long) listings are passed through uncached
+            if response.status_code != 200 or isinstance(response, StreamingResponse):
+                return response
+            entry = response_cache.set(key, response.body, response.media_type, generation)
+        headers = {"ETag": f'W/"{entry.etag}"'}
+        if etag_matches(request.headers.get("If-None-Match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+
+        # Compressed variants are cached alongside the entry, so hits never recompress
+        encoding = None
+        if len(entry.body) >= COMPRESS_MIN_BYTES and compressible(entry.mimetype):
+            encoding = negotiate(request.headers.get("accept-encoding"))
+        if encoding:
+            encode = partial(compress, encoding=encoding, gzip_level=COMPRESS_GZIP_LEVEL, brotli_quality=COMPRESS_BROTLI_QUALITY)
+            headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+            return Response(response_cache.encoded(key, entry, encoding, encode), media_type=entry.mimetype, headers=headers)
+        return Response(entry.body, media_type=entry.mimetype, headers=headers)
+
+    return decorated
+
+
+# Auth routes
+async def upsert_oauth_user(state, email: str, name: str = None, provider: str = "google") -> dict:
+    query, update = oauth_user_upsert(email, name, provider)
+    await state.users_col.update_one(query, update, upsert=True)
+    await uncache_users(email)
+    return public_user(await state.users_col.find_one(query))
+
+
+async def auth_google(request: Request):
+    redirect_uri = str(request.url_for("auth_google_callback"))
+    logger.info("auth_google redirect_uri: %s", redirect_uri)
+    await run_in_threadpool(oidc_cache.apply, google)
+    return await google.authorize_redirect(request, redirect_uri)
+
+
+async def auth_google_callback(request: Request):
+    await run_in_threadpool(oidc_cache.apply, google)
+    with metrics.external_call("oauth", "token"):
+        token = await google.authorize_access_token(request)
+    # authlib has verified the ID token against the cached JWKS; its claims are in token["userinfo"]
+    email, name = userinfo_identity(token.get("userinfo") or {})
+    if not email:
+        with metrics.external_call("oauth", "userinfo"):
+            email, name = userinfo_identity((await google.get(GOOGLE_USERINFO_URL, token=token)).json())
+    if not email:
+        return jsonify({"error": "No email returned"}, 400)
+    user = await upsert_oauth_user(request.app.state, email=email, name=name, provider="google")
+    jwt_token = create_jwt_for_user(user)
+    redirect_url = FRONTEND_ORIGIN.rstrip("/") + "/auth-callback?token=" + urllib_parse.quote(jwt_token)
+    return RedirectResponse(redirect_url, status_code=302)
+
+
+# Image routes
+async def get_image(request: Request):
+    """Serve stored image bytes by content hash"""
+    state = request.app.state
+    digest = request.path_params["digest"]
+    meta = await state.images_col.find_one({"hash": digest}, {"_id": 0, "content_type": 1})
+    data = await state.image_store.read(digest) if meta else None
+    if data is None:
+        return jsonify({"success": False, "error": "Image not found"}, 404)
+
+    # The hash is the content, so it doubles as a strong ETag and never changes
+    headers = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if etag_matches(request.headers.get("If-None-Match"), digest):
+        return Response(status_code=304, headers=headers)
+    try:
+        byte_range = parse_byte_range(request.headers.get("Range"), len(data))
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+    if byte_range is None:
+        return Response(data, media_type=meta["content_type"], headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+    return Response(data[start:end + 1], status_code=206, media_type=meta["content_type"], headers=headers)
+
+
+# Product API Endpoints
+@cached_response
+@api_handler("fetching products")
+async def get_products(request: Request):
+    """Fetch a page of products from the database with optional filtering"""
+    params = product_list_params(request.query_params)
+    if "pipeline" in params:
+        products = await request.app.state.products_col.aggregate(params["pipeline"]).to_list(length=params["limit"])
+    else:
+        products = await (
+            request.app.state.products_col.find(params["filter"], params["projection"])
+            .sort(params["sort"])
+            .limit(params["limit"])
+            .to_list(length=params["limit"])
+        )
+    return jsonify(finish_product_page(products, params))
+
+
+@cached_response
+@api_handler("fetching product")
+async def get_product(request: Request):
+    """Fetch a single product by ID"""
+    product = await request.app.state.products_col.find_one({"id": request.path_params["product_id"]}, PRODUCT_PROJECTION)
+    if not product:
+        return jsonify({"success": False, "error": "Product not found"}, 404)
+    return jsonify({"success": True, "product": product})
+
+
+async def load_similar_index(state) -> None:
+    """Same steps as main.load_similar_index, with the CPU-bound parts off the event loop"""
+    items = state.similar_items
+    try:
+        index = await run_in_threadpool(SimilarityIndex.load, SIMILAR_INDEX_PATH)
+        if index is None:
+            logger.info("No similar-items snapshot, building one in this worker; run `flask rebuild-similar`")
+            built_at = datetime.utcnow()
+            products = await state.products_col.find({"status": UNSOLD}, SIMILAR_SOURCE_PROJECTION).to_list(length=None)
+            index = await run_in_threadpool(SimilarityIndex.build, products, built_at)
+        changed = await state.products_col.find({"updated_at": {"$gte": index.built_at}}, SIMILAR_SOURCE_PROJECTION).to_list(length=None)
+        items.install(index, changed)
+    except Exception as e:
+        items.fail(e)
+
+
+def similar_index(state):
+    """This worker's SimilarityIndex, or None while it loads in the background"""
+    if state.similar_items.begin():
+        state.live_feed.start()
+        state.similar_loader = asyncio.get_running_loop().create_task(load_similar_index(state))
+    return state.similar_items.index
+
+
+@cached_response
+@api_handler("fetching similar products")
+async def get_similar_products(request: Request):
+    """Listings most like this one by title, description, category and material"""
+    state = request.app.state
+    limit = similar_limit(request.query_params)
+    product = await state.products_col.find_one({"id": request.path_params["product_id"]}, SIMILAR_SOURCE_PROJECTION)
+    if not product:
+        return jsonify({"success": False, "error": "Product not found"}, 404)
+    index = similar_index(state)
+    if index is not None:
+        # Over-fetch, since some matches may have sold since the index last heard of them
+        matches = await run_in_threadpool(index.similar, product, limit * 2, SIMILAR_MIN_SCORE, SIMILAR_MAX_QUERY_TERMS)
+        found = await state.products_col.find(similar_candidates(matches), SIMILAR_PROJECTION).to_list(length=None)
+        products = rank_similar(found, matches, limit)
+        source = "index"
+    else:
+        products = await (
+            state.products_col.find(similar_fallback_filter(product), SIMILAR_PROJECTION)
+            .sort(PRODUCT_SORT)
+            .limit(limit)
+            .to_list(length=limit)
+        )
+        source = "category"
+    return jsonify({"success": True, "products": products, "source": source})
+
+
+@rate_limited(("product_create_ip", request_ip), ("product_create_user", request_subject))
+@api_handler("creating product")
+async def create_product(request: Request):
+    """Create a new product listing"""
+    state = request.app.state
+    data = await read_json(request)
+    require_fields(data, PRODUCT_REQUIRED_FIELDS)
+    product = new_product(data, await store_product_image(state, data["image"]))
+
+    await state.products_col.insert_one(product)
+    response_cache.invalidate()
+
+    return jsonify({"success": True, "product": public_product(product)}, 201)
+
+
+@rate_limited(("inquiry_ip", request_ip), ("inquiry_user", request_subject))
+@api_handler("creating inquiry")
+async def create_inquiry(request: Request):
+    """Handle buyer inquiry about a product"""
+    state = request.app.state
+    data = await read_json(request)
+    require_fields(data, INQUIRY_REQUIRED_FIELDS)
+
+    # Get product details
+    product = await state.products_col.find_one({"id": data["product_id"]}, {"_id": 0})
+    check_inquiry_product(product)
+
+    email_configured = bool(SMTP_EMAIL and SMTP_PASSWORD)
+    if not email_configured:
+        logger.warning("SMTP credentials not configured, skipping email")
+
+    # Save to database, unless this is a resubmission of an inquiry already sent
+    inquiry = new_inquiry(data, product, email_configured)
+    existing = await state.inquiries_col.find_one(duplicate_inquiry_filter(inquiry), INQUIRY_PROJECTION)
+    if existing is None:
+        # Caps how much inquiry mail any one seller is sent; past it the inquiry still reaches their inbox
+        if email_configured and await over_soft_limit("inquiry_seller", product.get("seller_email")):
+            inquiry["status"] = STATUS_HELD
+        try:
+            await state.inquiries_col.insert_one(inquiry)
+        except DuplicateKeyError:
+            # A concurrent copy won the unique idempotency key
+            existing = await state.inquiries_col.find_one({"idempotency_key": inquiry["idempotency_key"]}, INQUIRY_PROJECTION)
+    if existing is not None:
+        if existing["status"] == STATUS_QUEUED:
+            # Covers an earlier request that saved the inquiry but failed to queue its email; a no-op otherwise
+            await state.email_outbox.enqueue(existing["inquiry_id"], inquiry_email_payload(existing))
+        return jsonify({"success": True, "inquiry": existing, "email_queued": False, "duplicate": True})
+
+    # Queue email to seller; the outbox tasks send it in the background
+    email_queued = inquiry["status"] == STATUS_QUEUED
+    if email_queued:
+        await state.email_outbox.enqueue(inquiry["inquiry_id"], inquiry_email_payload(inquiry))
+
+    public_inquiry(inquiry)
+
+    return jsonify({
+        "success": True,
+        "inquiry": inquiry,
+        "email_queued": email_queued
+    }, 202)
+
+
+@token_required
+@api_handler("fetching inquiries")
+async def get_inquiries(request: Request, current_user):
+    """A page of inquiries sent to the signed-in seller, newest first, optionally for one listing"""
+    params = inquiry_list_params(current_user["email"], request.query_params)
+    inquiries = await (
+        request.app.state.inquiries_col.find(params["filter"], params["projection"])
+        .sort(params["sort"])
+        .limit(params["limit"])
+        .to_list(length=params["limit"])
+    )
+    return jsonify(finish_inquiry_page(inquiries, params))
+
+
+@cached_response
+@api_handler("fetching seller products")
+async def get_products_by_seller(request: Request):
+    """Fetch all products by seller email"""
+    cursor = request.app.state.products_col.find({"seller_email": request.path_params["email"]}, PRODUCT_PROJECTION).sort("created_at", -1)
+    head = await cursor.to_list(length=STREAM_JSON_MIN_ITEMS + 1)
+    if len(head) <= STREAM_JSON_MIN_ITEMS:
+        return jsonify({"success": True, "products": head})
+
+    # Long listings are streamed from the cursor rather than built as one string
+    prefix, suffix = json_array_parts({"success": True}, "products")
+
+    async def generate():
+        yield prefix
+        separator = b""
+        for product in head:
+            yield separator + dumps_bytes(product)
+            separator = b","
+        async for product in cursor:
+            yield b"," + dumps_bytes(product)
+        yield suffix
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+
+@token_required
+@api_handler("building seller dashboard")
+async def get_seller_dashboard(request: Request, current_user):
+    """Listing counts, impact, inquiry counts and a page of listings, queried concurrently"""
+    state = request.app.state
+    email = request.path_params["email"]
+    if current_user["email"] != email and current_user["email"] not in ADMIN_EMAILS:
+        return jsonify({"success": False, "error": "Unauthorized"}, 403)
+    params = seller_dashboard_params(email, request.query_params)
+    summary, inquiries, products = await asyncio.gather(
+        state.products_col.aggregate(params["summary"]).to_list(None),
+        state.inquiries_col.aggregate(params["inquiries"]).to_list(None),
+        state.products_col.aggregate(params["listings"]).to_list(None)
+    )
+    return jsonify(seller_dashboard(summary, inquiries, products, params["page_size"]))
+
+
+async def stream_lines(request: Request):
+    """Yield the request body line by line as chunks arrive"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8") + "\n"
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+async def flush_import(state, batch: ImportBatch) -> None:
+    docs, rows = batch.take()
+    if not docs:
+        return
+    try:
+        await state.products_col.insert_many(docs, ordered=False)
+        batch.record(len(docs))
+    except BulkWriteError as e:
+        # Unordered inserts keep going past bad rows; report just those
+        batch.record(e.details.get("nInserted", 0), bulk_insert_errors(e.details, rows))
+
+
+@rate_limited(("product_write_ip", request_ip), ("bulk_import_user", request_subject))
+@token_required
+@api_handler("importing products")
+async def bulk_import_products(request: Request, current_user):
+    """Create products from a streamed NDJSON or CSV body, reporting per-row errors"""
+    state = request.app.state
+    decoder = ImportDecoder(import_format(request.headers.get("content-type"), request.query_params.get("format")))
+    batch = ImportBatch(BULK_IMPORT_CHUNK_SIZE, BULK_IMPORT_MAX_ERRORS)
+    is_admin = current_user["email"] in ADMIN_EMAILS
+
+    async def add_rows(rows):
+        for row_number, row in rows:
+            try:
+                if isinstance(row, ServiceError):
+                    raise row
+                require_fields(row, PRODUCT_REQUIRED_FIELDS)
+                stored = import_image_fields(row["image"])
+                if stored is None:
+                    stored = await store_product_image(state, row["image"])
+                batch.add(row_number, import_product(row, current_user["email"], is_admin, stored))
+            except ServiceError as e:
+                batch.fail(row_number, e.message)
+            if batch.full:
+                await flush_import(state, batch)
+
+    async for line in stream_lines(request):
+        await add_rows(decoder.feed(line))
+    await add_rows(decoder.close())
+    await flush_import(state, batch)
+
+    if batch.inserted:
+        response_cache.invalidate()
+    return jsonify(batch.result())
+
+
+@token_required
+async def export_products(request: Request, current_user):
+    """Stream matching products as NDJSON or CSV straight from a server-side cursor"""
+    fmt = request.query_params.get("format", "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"success": False, "error": f"Unsupported format: {fmt}"}, 400)
+
+    cursor = request.app.state.products_col.find(
+        export_filter(request.query_params), PRODUCT_PROJECTION, batch_size=EXPORT_BATCH_SIZE
+    ).sort(PRODUCT_SORT)
+
+    async def generate():
+        try:
+            yield export_header(fmt)
+            async for product in cursor:
+                yield export_line(product, fmt)
+        finally:
+            await cursor.close()
+
+    return StreamingResponse(generate(), media_type=EXPORT_FORMATS[fmt], headers={
+        "Content-Disposition": f'attachment; filename="products.{fmt}"'
+    })
+
+
+async def live_products(request: Request):
+    """Server-Sent Events feed of listing inserts, updates, sales and deletions"""
+    live_feed = request.app.state.live_feed
+    live_feed.start()
+    subscriber = AsyncSubscriber(parse_categories(request.query_params.get("category")), LIVE_FEED_QUEUE_SIZE)
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    try:
+        replay = live_feed.hub.subscribe(subscriber, last_event_id)
+    except FeedFull:
+        response = jsonify({"success": False, "error": "Live feed is at capacity, try again later"}, 503)
+        response.headers["Retry-After"] = "30"
+        return response
+    if replay is None:
+        replay = await live_feed.catch_up(subscriber, last_event_id)
+
+    async def generate():
+        try:
+            yield "retry: 3000\n\n"
+            if replay is None:
+                yield RESET_EVENT
+            for event in replay or ():
+                yield format_event(event)
+            # A dropped subscriber still drains what was queued before it was cut off
+            while True:
+                event = await subscriber.get(0 if subscriber.closed else LIVE_FEED_HEARTBEAT_SECONDS)
+                if event is not None:
+                    yield format_event(event)
+                elif subscriber.closed:
+                    break
+                else:
+                    yield HEARTBEAT
+        finally:
+            live_feed.hub.unsubscribe(subscriber)
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@rate_limited(("product_write_ip", request_ip), ("product_write_user", request_subject))
+@api_handler("updating product")
+async def update_product(request: Request):
+    """Update an existing product"""
+    state = request.app.state
+    product_id = request.path_params["product_id"]
+    data = await read_json(request)
+
+    # Only a freshly uploaded data URL replaces the stored image
+    stored_image_fields = {}
+    if isinstance(data, dict) and str(data.get("image", "")).startswith(DATA_URL_PREFIX):
+        stored_image_fields = await store_product_image(state, data["image"])
+    update_data = product_update(data, stored_image_fields, product_id)
+
+    current = None
+    if search_text_missing(update_data):
+        current = await state.products_col.find_one({"id": product_id}, {"_id": 0, "title": 1, "description": 1})
+        if not current:
+            return jsonify({"success": False, "error": "Product not found"}, 404)
+    apply_search_terms(update_data, current)
+
+    # Update and read back the product in a single round trip
+    updated_product = await state.products_col.find_one_and_update(
+        {"id": product_id},
+        {"$set": update_data},
+        projection=PRODUCT_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated_product:
+        return jsonify({"success": False, "error": "Product not found"}, 404)
+    response_cache.invalidate()
+
+    return jsonify({"success": True, "product": updated_product})
+
+
+@rate_limited(("product_write_ip", request_ip), ("product_write_user", request_subject))
+@api_handler("deleting product")
+async def delete_product(request: Request):
+    """Delete a product"""
+    product = await request.app.state.products_col.find_one_and_delete(
+        {"id": request.path_params["product_id"]}, projection={"_id": 1}
+    )
+    if not product:
+        return jsonify({"success": False, "error": "Product not found"}, 404)
+    response_cache.invalidate()
+
+    return jsonify({"success": True, "message": "Product deleted successfully"})
+
+
+@token_required
+@api_handler("fetching user impact")
+async def get_user_impact(request: Request, current_user):
+    """Get impact stats for the logged-in user"""
+    impact_stats = current_user.get("impact_stats", DEFAULT_IMPACT_STATS)
+    return jsonify({"success": True, "impact": impact_stats})
+
+
+@rate_limited(("product_write_ip", request_ip), ("product_write_user", request_subject))
+@token_required
+@api_handler("marking product sold")
+async def mark_product_sold(request: Request, current_user):
+    """Mark a product as sold and credit impact to buyer/seller"""
+    state = request.app.state
+    product_id = request.path_params["product_id"]
+    data = await read_json(request) or {}
+    buyer_email = data.get("buyer_email")
+
+    sold_at = datetime.utcnow()
+    product = await state.products_col.find_one_and_update(
+        sold_filter(product_id, current_user["email"]),
+        sold_update(buyer_email, sold_at),
+        projection=SOLD_PROJECTION
+    )
+    if not product:
+        # Only the failure path pays for a second read to pick the right error
+        existing = await state.products_col.find_one({"id": product_id}, SOLD_CHECK_PROJECTION)
+        raise sold_failure(existing, current_user["email"])
+    response_cache.invalidate()
+
+    # Seller stats, plus buyer stats if email provided, in one round trip
+    impact = product.get("eco_impact", {})
+    await state.users_col.bulk_write(impact_credit_updates(current_user["email"], buyer_email, impact), ordered=False)
+    try:
+        await state.impact_rollups_col.bulk_write(impact_rollup_updates(product.get("category"), impact, sold_at), ordered=False)
+    except PyMongoError as e:
+        # The listing is already sold; `flask rebuild-impact` recounts the rollups
+        logger.error(f"Impact rollup update failed; run `flask rebuild-impact` to recount: {e}")
+    await uncache_users(current_user["email"], buyer_email)
+
+    return jsonify({"success": True, "message": "Product marked as sold"})
+
+
+@api_handler("fetching impact summary")
+async def get_impact_summary(request: Request):
+    """Platform-wide impact totals and a time series read from the rollups"""
+    state = request.app.state
+    params = impact_summary_params(request.query_params)
+    total_rows = await state.impact_rollups_col.find(params["totals_query"], IMPACT_FIELDS).to_list(length=None)
+    series_rows = await state.impact_rollups_col.find(params["series_query"], IMPACT_FIELDS).sort("bucket", ASCENDING).to_list(length=None)
+    return jsonify(summarize_impact(params["granularity"], total_rows, series_rows))
+
+
+@admin_required
+async def get_cache_stats(request: Request, current_user):
+    """Report response and user cache statistics for this worker"""
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "response_cache": response_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "rate_limiter": rate_limiter.stats() if rate_limiter else None,
+        "oidc": oidc_cache.stats(),
+        "live_feed": request.app.state.live_feed.stats(),
+        "similar": request.app.state.similar_items.stats()
+    })
+
+
+async def healthz(request: Request):
+    """Liveness: the worker is serving requests; never touches Mongo"""
+    return jsonify({"status": "ok", "pid": os.getpid()})
+
+
+async def readyz(request: Request):
+    """Readiness: Mongo answers a ping within READINESS_TIMEOUT_MS and the indexes are current; also reports pool use"""
+    state = request.app.state
+    body = {"pid": os.getpid(), "pool": pool_status(metrics.pool_stats())}
+    try:
+        start = time.perf_counter()
+        await asyncio.wait_for(state.client.admin.command("ping"), READINESS_TIMEOUT_MS / 1000)
+        body["ping_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        applied = await asyncio.wait_for(
+            state.db[SCHEMA_COLLECTION].find_one({"_id": "indexes"}, {"version": 1}), READINESS_TIMEOUT_MS / 1000
+        )
+        body["indexes_current"] = is_current(applied)
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        return jsonify({**body, "status": "unavailable", "error": str(e) or "Timed out"}, 503)
+    if not body["indexes_current"]:
+        # Without them search has no text index and inquiries lose dedup and expiry
+        error = "Indexes are missing or out of date; run `flask create-indexes` or set MONGO_CREATE_INDEXES"
+        return jsonify({**body, "status": "unavailable", "error": error}, 503)
+    return jsonify({**body, "status": "ready"})
+
+
+async def get_metrics(request: Request):
+    """Prometheus scrape endpoint for this worker process"""
+    if METRICS_TOKEN and bearer_token(request.headers.get('Authorization')) != METRICS_TOKEN:
+        return jsonify({'message': 'Invalid metrics token!'}, 401)
+    return Response(metrics.render(os.getpid()), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Clients are created per worker process, after the server has forked.
+    # Indexes come from `flask create-indexes`, run once per deploy, unless MONGO_CREATE_INDEXES is set.
+    client = create_client()
+    db = client[MONGODB_DB]
+    if MONGO_CREATE_INDEXES:
+        try:
+            created = await ensure_indexes_async(db)
+            if created:
+                logger.info(f"Created indexes at version {indexes_version()}: {', '.join(created)}")
+        except PyMongoError as e:
+            # /readyz keeps reporting 503 until the indexes exist
+            logger.error(f"Creating indexes failed: {e}")
+    state = app.state
+    state.client = client
+    state.db = db
+    state.users_col = db['users']
+    state.products_col = db['products']
+    state.inquiries_col = db['inquiries']
+    state.outbox_col = db['email_outbox']
+    state.images_col = db['images']
+    state.impact_rollups_col = db['impact_rollups']
+    state.image_store = AsyncBlobStore(db)
+    state.email_outbox = AsyncEmailOutbox(
+        state.outbox_col,
+        state.inquiries_col,
+        connection_factory=lambda: AsyncSMTPConnection(
+            SMTP_HOST, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD,
+            observe=lambda operation, seconds, failed: metrics.observe_external("smtp", operation, seconds, failed)
+        ),
+        render=build_inquiry_email,
+        logger=logger,
+        workers=EMAIL_WORKERS,
+        max_attempts=EMAIL_MAX_ATTEMPTS,
+        backoff_base=EMAIL_RETRY_BASE_SECONDS
+    )
+    state.email_outbox.start()
+    # The watcher task starts with the first /api/products/live subscriber
+    state.live_feed = AsyncLiveFeed(
+        state.products_col,
+        FeedHub(buffer_size=LIVE_FEED_BUFFER_SIZE, max_subscribers=LIVE_FEED_MAX_SUBSCRIBERS),
+        mode=LIVE_FEED_MODE,
+        poll_interval=LIVE_FEED_POLL_SECONDS,
+        poll_overlap=LIVE_FEED_POLL_OVERLAP_SECONDS,
+        catch_up_limit=LIVE_FEED_CATCH_UP_LIMIT,
+        logger=logger
+    )
+    # Loaded on the first /similar request, then kept current from the live feed
+    state.similar_items = SimilarItems(logger=logger)
+    state.live_feed.hub.add_listener(state.similar_items.on_event)
+    try:
+        yield
+    finally:
+        await state.live_feed.stop()
+        await state.email_outbox.stop()
+        client.close()
+
+
+routes = [
+    Route("/auth/google", auth_google, methods=["GET"]),
+    Route("/auth/google/callback", auth_google_callback, methods=["GET"], name="auth_google_callback"),
+    Route("/api/images/{digest}", get_image, methods=["GET"]),
+    Route("/api/products", get_products, methods=["GET"]),
+    Route("/api/products", create_product, methods=["POST"]),
+    Route("/api/products/bulk", bulk_import_products, methods=["POST"]),
+    Route("/api/products/export", export_products, methods=["GET"]),
+    Route("/api/products/live", live_products, methods=["GET"]),
+    Route("/api/products/seller/{email}", get_products_by_seller, methods=["GET"]),
+    Route("/api/products/{product_id}", get_product, methods=["GET"]),
+    Route("/api/products/{product_id}", update_product, methods=["PUT"]),
+    Route("/api/products/{product_id}", delete_product, methods=["DELETE"]),
+    Route("/api/products/{product_id}/sold", mark_product_sold, methods=["POST"]),
+    Route("/api/products/{product_id}/similar", get_similar_products, methods=["GET"]),
+    Route("/api/inquiries", get_inquiries, methods=["GET"]),
+    Route("/api/inquiries", create_inquiry, methods=["POST"]),
+    Route("/api/sellers/{email}/dashboard", get_seller_dashboard, methods=["GET"]),
+    Route("/api/user/impact", get_user_impact, methods=["GET"]),
+    Route("/api/impact/summary", get_impact_summary, methods=["GET"]),
+    Route("/api/admin/cache", get_cache_stats, methods=["GET"]),
+    Route("/metrics", get_metrics, methods=["GET"]),
+    Route("/healthz", healthz, methods=["GET"]),
+    Route("/readyz", readyz, methods=["GET"]),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        # Outermost, so timings cover CORS and session handling too
+        Middleware(MetricsMiddleware, metrics=metrics),
+        # Inside metrics, so recorded response sizes are bytes on the wire
+        Middleware(CompressionMiddleware, min_bytes=COMPRESS_MIN_BYTES, gzip_level=COMPRESS_GZIP_LEVEL, brotli_quality=COMPRESS_BROTLI_QUALITY),
+        # Allow all origins for development to avoid CORS issues
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(SessionMiddleware, secret_key=JWT_SECRET),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,346 @@
+"""Drive the Flask app through mixed marketplace workloads and record the results.
+
+Usage:
+    python benchmarks/bench_api.py --products 20000 --workload mixed --duration 30 --concurrency 8
+    python benchmarks/bench_api.py --workload read --baseline benchmarks/results/<earlier run>.json
+
+Seeds a throwaway database (ecowave_bench_api on MONGODB_URI, default local
+Mongo) with synthetic products and users. Create requests upload JPEGs of
+realistic base64 size. The app is called in-process through Flask's test
+client from --concurrency threads.
+
+SMTP delivery is swapped for an in-memory connection and Google OAuth for
+locally minted JWTs, so nothing leaves the machine.
+
+Throughput, per-operation p50/p95/p99 latency and process RSS are printed
+and saved as JSON under benchmarks/results/, tagged with the git commit.
+Pass --baseline to print the change against an earlier run.
+
+A real mongod is used rather than mongomock, because search depends on
+$text and the write paths on findAndModify/bulk_write behaviour that
+mongomock does not reproduce.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import itertools
+import subprocess
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+BENCH_DB = "ecowave_bench_api"
+
+sys.path.insert(0, BACKEND_DIR)
+
+CATEGORIES = ["electronics", "clothing", "books", "home", "accessories", "other"]
+WORDS = (
+    "bamboo organic cotton recycled vintage solar lamp bottle steel glass wooden "
+    "notebook jacket denim chair table shelf speaker headphones charger backpack "
+    "tote bag ceramic mug linen shirt wool sweater leather wallet phone case novel "
+    "cookbook planter basket blanket cushion kettle bicycle helmet watch"
+).split()
+QUERIES = ["bamboo", "recycled cotton", "sol", "vintage leather wallet", "kett", "denim jack"]
+
+# Upload sizes roughly matching phone photos after the frontend's resize
+IMAGE_DIMENSIONS = [(480, 360), (800, 600), (1280, 960)]
+
+# Operation weights per workload
+WORKLOADS = {
+    "read": {"list": 45, "page": 15, "get": 25, "seller": 10, "impact": 5},
+    "search": {"search": 80, "list": 20},
+    "write": {"create": 30, "update": 70},
+    "inquiry": {"inquiry": 100},
+    "mixed": {"list": 25, "page": 10, "get": 20, "search": 20, "impact": 5, "update": 8, "create": 4, "inquiry": 8},
+}
+
+
+class NullSMTPConnection:
+    """Stands in for SMTPConnection; counts messages instead of sending them"""
+    sent = itertools.count()
+
+    def send(self, msg) -> None:
+        next(NullSMTPConnection.sent)
+
+    def close(self) -> None:
+        pass
+
+
+def make_images(seed: int) -> list:
+    """Photo-like JPEG data URLs: upscaled noise compresses like a real photo, not like static"""
+    from PIL import Image
+    rng = random.Random(seed)
+    images = []
+    for width, height in IMAGE_DIMENSIONS:
+        small = Image.frombytes("RGB", (width // 8, height // 8), rng.randbytes(width // 8 * height // 8 * 3))
+        out = io.BytesIO()
+        small.resize((width, height), Image.BILINEAR).save(out, format="JPEG", quality=85)
+        images.append("data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode("ascii"))
+    return images
+
+
+def product_payload(rng: random.Random, image: str, seller_email: str) -> dict:
+    return {
+        "title": " ".join(rng.choices(WORDS, k=4)),
+        "description": " ".join(rng.choices(WORDS, k=40)),
+        "price": round(rng.uniform(50, 5000), 2),
+        "badge": rng.choice(["Like New", "Good", "Fair"]),
+        "category": rng.choice(CATEGORIES),
+        "material": rng.choice(["", "cotton", "steel", "glass", "wood"]),
+        "image": image,
+        "seller_email": seller_email,
+        "seller_location": "Bench City",
+    }
+
+
+def load_app(args, image_dir: str):
+    # Configuration is read at import time, so it has to be in place first
+    os.environ["MONGODB_DB"] = BENCH_DB
+    os.environ["IMAGE_STORE_BACKEND"] = "disk"
+    os.environ["IMAGE_STORE_PATH"] = image_dir
+    os.environ["SMTP_EMAIL"] = "bench@example.com"
+    os.environ["SMTP_PASSWORD"] = "bench"
+    os.environ["EMAIL_WORKERS"] = str(args.email_workers)
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_MAX_BYTES"] = "0"
+    import main
+    main.email_outbox.connection_factory = NullSMTPConnection
+    return main
+
+
+def seed(main, args, images: list) -> dict:
+    from services import new_product, create_jwt_for_user, DEFAULT_IMPACT_STATS
+    from mongo import apply_indexes
+    rng = random.Random(args.seed)
+    main.client.drop_database(BENCH_DB)
+    apply_indexes(main.db)
+    main.users_col.create_index("email")
+
+    users = [f"user{i}@example.com" for i in range(args.users)]
+    main.users_col.insert_many([
+        {"email": email, "username": email.split("@")[0], "name": email, "impact_stats": dict(DEFAULT_IMPACT_STATS)}
+        for email in users
+    ])
+
+    # Ingest each image once; seeded products share the stored blobs
+    stored = [main.store_product_image(image) for image in images]
+    now = datetime.utcnow()
+    product_ids, batch = [], []
+    for i in range(args.products):
+        product = new_product(product_payload(rng, "", rng.choice(users)), rng.choice(stored))
+        product["created_at"] = now - timedelta(seconds=i * 7)
+        product_ids.append(product["id"])
+        batch.append(product)
+        if len(batch) == 5000:
+            main.products_col.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        main.products_col.insert_many(batch, ordered=False)
+
+    return {
+        "users": users,
+        "tokens": [create_jwt_for_user({"email": email, "username": email}) for email in users],
+        "product_ids": product_ids,
+    }
+
+
+def run_operation(op: str, client, rng: random.Random, fixtures: dict, images: list) -> int:
+    if op == "list":
+        category = rng.choice(CATEGORIES + ["all"])
+        return client.get(f"/api/products?limit=24&category={category}").status_code
+    if op == "page":
+        first = client.get("/api/products?limit=24").get_json()
+        return client.get(f"/api/products?limit=24&cursor={first['next_cursor']}").status_code
+    if op == "get":
+        return client.get(f"/api/products/{rng.choice(fixtures['product_ids'])}").status_code
+    if op == "seller":
+        return client.get(f"/api/products/seller/{rng.choice(fixtures['users'])}").status_code
+    if op == "search":
+        return client.get(f"/api/products?search={rng.choice(QUERIES)}").status_code
+    if op == "impact":
+        token = rng.choice(fixtures["tokens"])
+        return client.get("/api/user/impact", headers={"Authorization": f"Bearer {token}"}).status_code
+    if op == "create":
+        payload = product_payload(rng, rng.choice(images), rng.choice(fixtures["users"]))
+        return client.post("/api/products", json=payload).status_code
+    if op == "update":
+        product_id = rng.choice(fixtures["product_ids"])
+        return client.put(f"/api/products/{product_id}", json={"price": round(rng.uniform(50, 5000), 2)}).status_code
+    if op == "inquiry":
+        return client.post("/api/inquiries", json={
+            "product_id": rng.choice(fixtures["product_ids"]),
+            "buyer_name": "Bench Buyer",
+            "buyer_email": rng.choice(fixtures["users"]),
+            "buyer_message": "Is this still available?",
+        }).status_code
+    raise ValueError(f"Unknown operation: {op}")
+
+
+def drive(main, args, fixtures: dict, images: list, duration: float, record: bool) -> tuple:
+    ops, weights = zip(*WORKLOADS[args.workload].items())
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index: int):
+        rng = random.Random(args.seed * 1000 + index)
+        client = main.app.test_client()
+        local = []
+        while time.perf_counter() < deadline:
+            op = rng.choices(ops, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = run_operation(op, client, rng, fixtures, images)
+            except Exception:
+                status = 599
+            local.append((op, (time.perf_counter() - start) * 1000, status))
+        with lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    return (samples if record else []), time.perf_counter() - started
+
+
+def summarize(latencies: list, elapsed: float, errors: int) -> dict:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {"requests": 0, "rps": 0.0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 3),
+        "p99_ms": round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)], 3),
+        "errors": errors,
+    }
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return 0.0
+
+
+def git_commit() -> dict:
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain"], cwd=BACKEND_DIR, text=True).strip())
+        return {"commit": sha, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def print_results(results: dict) -> None:
+    print(f"{'operation':>10} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, row in list(results["operations"].items()) + [("TOTAL", results["total"])]:
+        if not row["requests"]:
+            continue
+        print(f"{name:>10} {row['requests']:>9} {row['rps']:>9.1f} {row['p50_ms']:>9.2f} "
+              f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['errors']:>7}")
+    memory = results["memory"]
+    print(f"rss: {memory['rss_before_mb']:.1f} MB -> {memory['rss_after_mb']:.1f} MB (peak {memory['peak_rss_mb']:.1f} MB)")
+
+
+def print_comparison(baseline: dict, results: dict) -> None:
+    print(f"\nvs baseline {baseline.get('commit')} ({baseline.get('timestamp')})")
+    print(f"{'operation':>10} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    rows = dict(results["operations"], TOTAL=results["total"])
+    base_rows = dict(baseline["operations"], TOTAL=baseline["total"])
+    for name, row in rows.items():
+        base = base_rows.get(name)
+        if not base or not base["requests"] or not row["requests"]:
+            continue
+        deltas = [(row[k] - base[k]) / base[k] * 100 if base[k] else 0.0 for k in ("rps", "p50_ms", "p95_ms", "p99_ms")]
+        print(f"{name:>10} " + " ".join(f"{d:>+8.1f}%" for d in deltas))
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--email-workers", type=int, default=2)
+    parser.add_argument("--no-response-cache", action="store_true", help="measure uncached catalogue reads")
+    parser.add_argument("--output", help="results path (default benchmarks/results/<time>-<commit>-<workload>.json)")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database afterwards")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    image_dir = tempfile.mkdtemp(prefix="ecowave-bench-images-")
+    main = load_app(args, image_dir)
+    try:
+        images = make_images(args.seed)
+        start = time.perf_counter()
+        fixtures = seed(main, args, images)
+        seed_seconds = time.perf_counter() - start
+        print(f"seeded {args.products} products, {args.users} users in {seed_seconds:.1f}s; "
+              f"image uploads {', '.join(f'{len(i) // 1024} KB' for i in images)}")
+
+        drive(main, args, fixtures, images, args.warmup, record=False)
+        rss_before = rss_mb()
+        samples, elapsed = drive(main, args, fixtures, images, args.duration, record=True)
+        rss_after = rss_mb()
+
+        operations = {}
+        for op in WORKLOADS[args.workload]:
+            rows = [s for s in samples if s[0] == op]
+            operations[op] = summarize([s[1] for s in rows], elapsed, sum(1 for s in rows if s[2] >= 400))
+        results = {
+            **git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "config": vars(args),
+            "seed_seconds": round(seed_seconds, 2),
+            "image_upload_bytes": [len(i) for i in images],
+            "total": summarize([s[1] for s in samples], elapsed, sum(1 for s in samples if s[2] >= 400)),
+            "operations": operations,
+            "emails_sent": next(NullSMTPConnection.sent),
+            "memory": {
+                "rss_before_mb": round(rss_before, 1),
+                "rss_after_mb": round(rss_after, 1),
+                # ru_maxrss is KB on Linux
+                "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            },
+        }
+        print_results(results)
+
+        output = args.output or os.path.join(
+            RESULTS_DIR, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{results['commit'] or 'nogit'}-{args.workload}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {output}")
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                print_comparison(json.load(f), results)
+    finally:
+        main.email_outbox.stop()
+        if not args.keep:
+            main.client.drop_database(BENCH_DB)
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,87 @@
+"""Measure token_required overhead with and without the user cache.
+
+Usage:
+    python benchmarks/bench_auth.py --requests 20000
+
+Runs JWT decode + user lookup the way token_required does, first hitting
+Mongo every time and then going through LocalUserCache. Uses a throwaway
+database on MONGODB_URI.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+import jwt
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from usercache import LocalUserCache  # noqa: E402
+
+SECRET = "bench_secret"
+
+
+def make_tokens(count: int) -> list:
+    exp = int((datetime.utcnow() + timedelta(hours=1)).timestamp())
+    return [jwt.encode({"email": f"user{i}@example.com", "exp": exp}, SECRET, algorithm="HS256") for i in range(count)]
+
+
+def authenticate(token, users_col, cache=None):
+    data = jwt.decode(token, SECRET, algorithms=["HS256"])
+    if cache is not None:
+        user = cache.get(data["email"])
+        if user is not None:
+            return user
+    user = users_col.find_one({"email": data["email"]})
+    if cache is not None and user:
+        cache.set(data["email"], user)
+    return user
+
+
+def run(tokens, users_col, requests: int, cache=None) -> dict:
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        authenticate(tokens[i % len(tokens)], users_col, cache)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "p50_us": statistics.median(timings),
+        "p99_us": timings[int(len(timings) * 0.99)],
+        "mean_us": statistics.fmean(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/"))
+    db = client["ecowave_bench_auth"]
+    users_col = db["users"]
+    try:
+        users_col.insert_many([
+            {"email": f"user{i}@example.com", "name": f"User {i}", "impact_stats": {"co2_saved": 0.0}}
+            for i in range(args.users)
+        ])
+        users_col.create_index("email")
+        tokens = make_tokens(args.users)
+
+        before = run(tokens, users_col, args.requests)
+        cache = LocalUserCache(ttl=60, max_size=args.users)
+        after = run(tokens, users_col, args.requests, cache)
+
+        print(f"{'mode':>10} {'p50 us':>10} {'p99 us':>10} {'mean us':>10}")
+        for name, result in (("no cache", before), ("cached", after)):
+            print(f"{name:>10} {result['p50_us']:>10.1f} {result['p99_us']:>10.1f} {result['mean_us']:>10.1f}")
+        print(f"cache stats: {cache.stats()}")
+    finally:
+        client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Compare $geoNear on a 2dsphere index with bounding-box scanning for "near me" pages.
+
+Usage:
+    python benchmarks/bench_geo.py --sizes 10000 100000 1000000
+
+Seeds a throwaway database on MONGODB_URI (default local Mongo) with listings
+spread around the gazetteer's cities. It then times the first page of
+listings within --radius km of random cities, two ways:
+  - geonear: the $geoNear pipeline GET /api/products?near= runs
+  - bbox:    a lat/lon bounding-box filter on plain fields, followed by an
+             exact haversine filter and distance sort in Python (the usual
+             approach without a geo index)
+"""
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient, ASCENDING, GEOSPHERE
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from geo import Gazetteer, EARTH_RADIUS_M, point, jitter, haversine_m  # noqa: E402
+from config import GAZETTEER_PATH  # noqa: E402
+
+PAGE_SIZE = 24
+
+
+def seed(col, size: int, cities: list) -> None:
+    col.drop()
+    now = datetime.utcnow()
+    batch = []
+    for i in range(size):
+        lat, lon = random.choice(cities)
+        # Spread listings across the metro area rather than one centroid
+        lat, lon = jitter(lat, lon, f"bench-{i}", 15000)
+        batch.append({
+            "id": f"bench-{i:08d}",
+            "category": random.choice(["electronics", "clothing", "books", "home"]),
+            "created_at": now - timedelta(seconds=i),
+            "location": point(lat, lon),
+            "lat": lat,
+            "lon": lon,
+        })
+        if len(batch) == 5000:
+            col.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        col.insert_many(batch, ordered=False)
+    col.create_index([("location", GEOSPHERE), ("category", ASCENDING)])
+
+
+def geonear(col, lat: float, lon: float, radius_km: float) -> list:
+    return list(col.aggregate([
+        {"$geoNear": {
+            "near": point(lat, lon),
+            "distanceField": "distance",
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+            "key": "location",
+            "query": {}
+        }},
+        {"$limit": PAGE_SIZE},
+        {"$project": {"_id": 0, "id": 1, "distance": 1}}
+    ]))
+
+
+def bbox(col, lat: float, lon: float, radius_km: float) -> list:
+    dlat = math.degrees(radius_km * 1000 / EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    candidates = col.find(
+        {"lat": {"$gte": lat - dlat, "$lte": lat + dlat}, "lon": {"$gte": lon - dlon, "$lte": lon + dlon}},
+        {"_id": 0, "id": 1, "lat": 1, "lon": 1}
+    )
+    within = []
+    for doc in candidates:
+        distance = haversine_m(lat, lon, doc["lat"], doc["lon"])
+        if distance <= radius_km * 1000:
+            within.append({"id": doc["id"], "distance": distance})
+    within.sort(key=lambda doc: doc["distance"])
+    return within[:PAGE_SIZE]
+
+
+def time_queries(fn, col, centres: list, radius_km: float) -> dict:
+    timings = []
+    for lat, lon in centres:
+        start = time.perf_counter()
+        fn(col, lat, lon, radius_km)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {"p50": statistics.median(timings), "p95": timings[int(len(timings) * 0.95)]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius", type=float, default=25)
+    args = parser.parse_args()
+
+    random.seed(11)
+    cities = list(set(Gazetteer.from_csv(GAZETTEER_PATH).places.values()))
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/"))
+    db = client["ecowave_bench_geo"]
+    col = db["products"]
+    try:
+        print(f"{'listings':>10} {'method':>8} {'p50 ms':>10} {'p95 ms':>10}")
+        for size in args.sizes:
+            seed(col, size, cities)
+            centres = [random.choice(cities) for _ in range(args.queries)]
+            for name, fn in (("geonear", geonear), ("bbox", bbox)):
+                fn(col, *centres[0], args.radius)  # warm up
+                result = time_queries(fn, col, centres, args.radius)
+                print(f"{size:>10} {name:>8} {result['p50']:>10.2f} {result['p95']:>10.2f}")
+    finally:
+        client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
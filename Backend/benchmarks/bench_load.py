@@ -0,0 +1,81 @@
+"""Compare the Flask (WSGI) and Starlette (ASGI) servers under concurrent load.
+
+Usage:
+    gunicorn -w 4 -b 127.0.0.1:5001 main:app
+    uvicorn asgi:app --workers 4 --port 5002
+    python benchmarks/bench_load.py --sync http://127.0.0.1:5001 --async http://127.0.0.1:5002 --concurrency 500
+
+Each target gets the same mix of catalogue reads: product pages, single
+products and image fetches. Requests are issued by `--concurrency` async
+clients for `--duration` seconds and throughput plus p50/p95/p99 latency
+are reported per server. Point both servers at the same database.
+"""
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+
+
+async def discover(client: httpx.AsyncClient, base: str) -> list:
+    """Build the request mix from whatever products the server returns"""
+    data = (await client.get(f"{base}/api/products", params={"limit": 50})).json()
+    paths = ["/api/products", "/api/products?limit=20", "/api/products?category=Electronics"]
+    for product in data.get("products", []):
+        paths.append(f"/api/products/{product['id']}")
+        if str(product.get("thumbnail", "")).startswith("/api/images/"):
+            paths.append(product["thumbnail"])
+    return paths
+
+
+async def worker(client: httpx.AsyncClient, base: str, paths: list, deadline: float, timings: list, errors: list):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(base + random.choice(paths))
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        timings.append((time.perf_counter() - start) * 1000)
+
+
+async def run(base: str, concurrency: int, duration: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        paths = await discover(client, base)
+        timings, errors = [], []
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, base, paths, deadline, timings, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        "requests": len(timings),
+        "rps": len(timings) / elapsed,
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95)],
+        "p99_ms": timings[int(len(timings) * 0.99)],
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sync", dest="sync_url", default="http://127.0.0.1:5001")
+    parser.add_argument("--async", dest="async_url", default="http://127.0.0.1:5002")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+
+    print(f"{'server':>8} {'requests':>10} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for name, base in (("wsgi", args.sync_url), ("asgi", args.async_url)):
+        result = asyncio.run(run(base.rstrip("/"), args.concurrency, args.duration))
+        print(f"{name:>8} {result['requests']:>10} {result['rps']:>10.1f} {result['p50_ms']:>10.1f} "
+              f"{result['p95_ms']:>10.1f} {result['p99_ms']:>10.1f} {result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
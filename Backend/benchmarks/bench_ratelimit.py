@@ -0,0 +1,84 @@
+"""Measure the per-request cost of the rate limiter.
+
+Usage:
+    python benchmarks/bench_ratelimit.py --hits 200000 --threads 1 8
+    python benchmarks/bench_ratelimit.py --redis redis://localhost:6379/15
+
+Times LocalRateLimiter.hit() (and RedisRateLimiter.hit() when --redis is
+given) under a few key patterns:
+  - hot:    every hit on one key, mostly rejected once the burst is spent
+  - spread: hits over --keys distinct keys, e.g. one bucket per client IP
+  - churn:  a fresh key per hit, so the local LRU keeps evicting
+Each hit is what one rate-limited request pays before its handler runs.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ratelimit import LocalRateLimiter, RedisRateLimiter, load_policies  # noqa: E402
+
+PATTERNS = {
+    "hot": lambda i, keys: "203.0.113.7",
+    "spread": lambda i, keys: f"10.0.{i % keys // 256}.{i % 256}",
+    "churn": lambda i, keys: f"client-{i}",
+}
+
+
+def run(limiter, pattern, hits: int, threads: int, keys: int) -> dict:
+    key_for = PATTERNS[pattern]
+    per_thread = hits // threads
+    barrier = threading.Barrier(threads + 1)
+    limited = [0] * threads
+
+    def worker(n: int):
+        offset = n * per_thread
+        barrier.wait()
+        for i in range(offset, offset + per_thread):
+            if not limiter.hit("product_write_ip", key_for(i, keys))[0]:
+                limited[n] += 1
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = per_thread * threads
+    return {"us_per_hit": elapsed / total * 1e6, "hits_per_s": total / elapsed, "limited": sum(limited) / total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=200000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--keys", type=int, default=10000)
+    parser.add_argument("--redis", default="", help="Redis URL; its bench keys are deleted afterwards")
+    args = parser.parse_args()
+
+    policies = load_policies()
+    backends = [("local", lambda: LocalRateLimiter(policies, max_keys=args.keys * 2))]
+    if args.redis:
+        backends.append(("redis", lambda: RedisRateLimiter(args.redis, policies, prefix="ecowave:bench:ratelimit:")))
+
+    print(f"{'backend':>8} {'pattern':>8} {'threads':>8} {'us/hit':>9} {'hits/s':>11} {'limited':>8}")
+    for name, make in backends:
+        # Redis round trips dominate, so fewer hits keep its runs short
+        hits = args.hits if name == "local" else min(args.hits, 20000)
+        for pattern in PATTERNS:
+            for threads in args.threads:
+                limiter = make()
+                result = run(limiter, pattern, hits, threads, args.keys)
+                print(f"{name:>8} {pattern:>8} {threads:>8} {result['us_per_hit']:>9.2f} "
+                      f"{result['hits_per_s']:>11.0f} {result['limited']:>8.1%}")
+                if name == "redis":
+                    for key in limiter.redis.scan_iter("ecowave:bench:ratelimit:*"):
+                        limiter.redis.delete(key)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compare regex scan vs indexed search latency on a synthetic catalogue.
+
+Usage:
+    python benchmarks/bench_search.py --sizes 10000 100000 1000000
+
+Seeds a throwaway database on MONGODB_URI (default local Mongo) and drops it
+when done.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search import build_search_query, regex_search_query, search_terms  # noqa: E402
+
+CATEGORIES = ["electronics", "clothing", "books", "home", "accessories", "other"]
+WORDS = (
+    "bamboo organic cotton recycled vintage solar lamp bottle steel glass wooden "
+    "notebook jacket denim chair table shelf speaker headphones charger backpack "
+    "tote bag ceramic mug linen shirt wool sweater leather wallet phone case novel "
+    "cookbook planter basket blanket cushion kettle bicycle helmet watch"
+).split()
+QUERIES = ["bamboo", "recycled cotton", "sol", "vintage leather wallet", "kett", "denim jack"]
+
+
+def make_product(i: int, now: datetime) -> dict:
+    title = " ".join(random.choices(WORDS, k=4))
+    description = " ".join(random.choices(WORDS, k=40))
+    return {
+        "id": f"bench-{i}",
+        "title": title,
+        "description": description,
+        "price": round(random.uniform(50, 5000), 2),
+        "category": random.choice(CATEGORIES),
+        "search_terms": search_terms(title, description),
+        "created_at": now - timedelta(seconds=i),
+        "status": "active",
+    }
+
+
+def seed(col, size: int) -> None:
+    col.drop()
+    now = datetime.utcnow()
+    batch = []
+    for i in range(size):
+        batch.append(make_product(i, now))
+        if len(batch) == 5000:
+            col.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        col.insert_many(batch, ordered=False)
+    col.create_index([("created_at", DESCENDING), ("id", DESCENDING)])
+    col.create_index([("category", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)])
+    col.create_index([("title", TEXT), ("description", TEXT)], weights={"title": 10, "description": 1})
+    col.create_index([("search_terms", ASCENDING), ("created_at", DESCENDING)])
+
+
+def measure(col, build_query, iterations: int, limit: int) -> dict:
+    timings = []
+    for _ in range(iterations):
+        for text in QUERIES:
+            start = time.perf_counter()
+            list(col.find(build_query(text), {"_id": 0, "id": 1, "title": 1})
+                 .sort([("created_at", DESCENDING), ("id", DESCENDING)])
+                 .limit(limit))
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p99": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=24)
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/"))
+    db = client["ecowave_bench_search"]
+    col = db["products"]
+    try:
+        print(f"{'listings':>10} {'path':>8} {'p50 ms':>10} {'p99 ms':>10}")
+        for size in args.sizes:
+            seed(col, size)
+            for name, build_query in (("regex", regex_search_query), ("indexed", build_search_query)):
+                result = measure(col, build_query, args.iterations, args.limit)
+                print(f"{size:>10} {name:>8} {result['p50']:>10.2f} {result['p99']:>10.2f}")
+    finally:
+        client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
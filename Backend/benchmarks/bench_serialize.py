@@ -0,0 +1,119 @@
+"""Measure JSON encoding and compression cost for catalogue responses.
+
+Usage:
+    python benchmarks/bench_serialize.py --repeat 50
+
+Builds synthetic product documents in memory (no database needed) and reports,
+per payload:
+  - CPU time per response and output size for the stdlib and orjson encoders
+  - bytes on the wire and CPU per response for gzip and brotli at a few levels
+  - peak memory of building a long listing as one string vs streaming it with
+    json_array_chunks
+
+The "legacy" payload embeds base64 data-URL images the way products did before
+images moved to the blob store.
+"""
+import os
+import sys
+import time
+import base64
+import random
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import services  # noqa: E402
+from compression import compress, brotli  # noqa: E402
+
+WORDS = (
+    "bamboo organic cotton recycled vintage solar lamp bottle steel glass wooden "
+    "notebook jacket denim chair table shelf speaker headphones charger backpack"
+).split()
+
+
+def make_product(i: int, now: datetime, image: str = None) -> dict:
+    product_id = f"{i:08d}-bench"
+    return {
+        "id": product_id,
+        "title": " ".join(random.choices(WORDS, k=4)),
+        "description": " ".join(random.choices(WORDS, k=60)),
+        "price": round(random.uniform(50, 5000), 2),
+        "badge": "Like New",
+        "image": image or f"/api/images/{i:064x}",
+        "thumbnail": f"/api/images/{i + 1:064x}",
+        "category": "electronics",
+        "material": "steel",
+        "eco_impact": {"co2": 50.0, "water": 100.0, "waste": 1.5},
+        "seller_id": "anonymous",
+        "seller_email": "seller@example.com",
+        "seller_location": "Pune",
+        "seller_phone": "",
+        "created_at": now - timedelta(minutes=i),
+        "updated_at": now,
+        "status": "active",
+    }
+
+
+def payloads() -> dict:
+    now = datetime.utcnow()
+    legacy_image = "data:image/jpeg;base64," + base64.b64encode(random.randbytes(150 * 1024)).decode("ascii")
+    return {
+        "page-24": {"success": True, "products": [make_product(i, now) for i in range(24)], "next_cursor": "abc"},
+        "page-100": {"success": True, "products": [make_product(i, now) for i in range(100)], "next_cursor": "abc"},
+        "seller-2000": {"success": True, "products": [make_product(i, now) for i in range(2000)]},
+        "legacy-24": {"success": True, "products": [make_product(i, now, legacy_image) for i in range(24)]},
+    }
+
+
+def cpu_per_call(fn, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    random.seed(7)
+
+    encoders = [("stdlib", services._stdlib_dumps)]
+    if services.orjson is not None:
+        encoders.append(("orjson", services._orjson_dumps))
+    codecs = [("gzip-1", "gzip", 1, 0), ("gzip-6", "gzip", 6, 0)]
+    if brotli is not None:
+        codecs += [("br-4", "br", 6, 4), ("br-5", "br", 6, 5)]
+
+    for name, body in payloads().items():
+        print(f"\n{name}")
+        print(f"{'encoder':>10} {'cpu ms':>9} {'bytes':>11}")
+        for encoder_name, encode in encoders:
+            size = len(encode(body))
+            print(f"{encoder_name:>10} {cpu_per_call(lambda: encode(body), args.repeat):>9.3f} {size:>11}")
+
+        raw = services.dumps_bytes(body)
+        print(f"{'encoding':>10} {'cpu ms':>9} {'bytes':>11} {'ratio':>7}")
+        print(f"{'identity':>10} {0:>9.3f} {len(raw):>11} {1:>7.2f}")
+        for codec_name, encoding, gzip_level, quality in codecs:
+            data = compress(raw, encoding, gzip_level, quality)
+            cpu = cpu_per_call(lambda: compress(raw, encoding, gzip_level, quality), args.repeat)
+            print(f"{codec_name:>10} {cpu:>9.3f} {len(data):>11} {len(raw) / len(data):>7.2f}")
+
+    # Peak memory of the encoder itself: one string vs streamed chunks
+    listing = payloads()["seller-2000"]
+    products = listing.pop("products")
+    tracemalloc.start()
+    services.dumps_bytes({**listing, "products": products})
+    _, whole_peak = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in services.json_array_chunks(listing, "products", iter(products)):
+        pass
+    _, stream_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"\nseller-2000 encode peak: whole {whole_peak / 1024:.0f} KB, streamed {stream_peak / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Measure the similar-items index: build time, memory and query latency vs catalogue size.
+
+Usage:
+    python benchmarks/bench_similar.py --sizes 1000 10000 100000
+    python benchmarks/bench_similar.py --sizes 10000 --max-terms 8 24 64 --baseline
+
+Generates synthetic listings (category, material and title/description words
+drawn from per-category vocabularies, so neighbours exist) and reports, per
+catalogue size and --max-terms (query terms scored per lookup):
+  - build:   SimilarityIndex.build() over the catalogue, as `flask rebuild-similar` does
+  - save/load: writing the snapshot and memory-mapping it back, as a worker does at startup
+  - query:   index.similar() for random listings, the CPU part of GET /api/products/<id>/similar
+  - upsert:  indexing one new or edited listing from a live feed event
+  - overlap: share of the top --limit results that scoring every query term
+             (an exact TF-IDF cosine) also returns
+With --baseline it also times scoring every listing's term counts against the
+query in pure Python, i.e. computing similarity on demand per request
+(skipped above 20000 listings, where it takes seconds).
+"""
+import os
+import sys
+import math
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from similar import SimilarityIndex, features  # noqa: E402
+
+CATEGORIES = ["electronics", "clothing", "books", "home", "furniture", "sports", "toys", "garden"]
+MATERIALS = ["", "cotton", "steel", "glass", "wood", "plastic", "leather", "bamboo"]
+SHARED_WORDS = ["used", "good", "condition", "vintage", "eco", "reclaimed", "barely", "like", "new", "pickup"]
+BASELINE_MAX_SIZE = 20000
+
+
+def make_catalogue(size: int, rng: random.Random) -> list:
+    # Each category gets its own word pool so similar listings cluster
+    vocabularies = {c: [f"{c[:3]}{i}" for i in range(400)] for c in CATEGORIES}
+    products = []
+    for i in range(size):
+        category = rng.choice(CATEGORIES)
+        words = vocabularies[category]
+        products.append({
+            "id": f"bench-{i:08d}",
+            "title": " ".join(rng.choices(words, k=4)),
+            "description": " ".join(rng.choices(words, k=20) + rng.choices(SHARED_WORDS, k=6)),
+            "category": category,
+            "material": rng.choice(MATERIALS),
+            "status": "active",
+        })
+    return products
+
+
+def percentiles(timings: list) -> dict:
+    timings = sorted(timings)
+    return {"p50": statistics.median(timings), "p95": timings[int(len(timings) * 0.95)]}
+
+
+def time_queries(index, products: list, queries: int, limit: int, max_terms: int, rng: random.Random) -> dict:
+    sample = rng.sample(products, min(queries, len(products)))
+    index.similar(sample[0], limit, max_terms=max_terms)  # warm up
+    timings = []
+    overlap = []
+    for product in sample:
+        start = time.perf_counter()
+        found = index.similar(product, limit, max_terms=max_terms)
+        timings.append((time.perf_counter() - start) * 1000)
+        exact = {product_id for product_id, _ in index.similar(product, limit, max_terms=10 ** 6)}
+        overlap.append(len(exact & {product_id for product_id, _ in found}) / max(1, len(exact)))
+    return {**percentiles(timings), "overlap": statistics.mean(overlap)}
+
+
+def baseline_similar(product: dict, catalogue: list, limit: int) -> list:
+    """Cosine over raw term counts for every listing, with no precomputation"""
+    query = features(product)
+    query_norm = math.sqrt(sum(v * v for v in query.values()))
+    scores = []
+    for other in catalogue:
+        if other["id"] == product["id"]:
+            continue
+        counts = features(other)
+        dot = sum(weight * counts.get(token, 0.0) for token, weight in query.items())
+        if dot:
+            scores.append((dot / (query_norm * math.sqrt(sum(v * v for v in counts.values()))), other["id"]))
+    scores.sort(reverse=True)
+    return scores[:limit]
+
+
+def time_baseline(products: list, queries: int, limit: int, rng: random.Random) -> dict:
+    timings = []
+    for product in rng.sample(products, min(queries, len(products))):
+        start = time.perf_counter()
+        baseline_similar(product, products, limit)
+        timings.append((time.perf_counter() - start) * 1000)
+    return percentiles(timings)
+
+
+def time_upserts(index, count: int, rng: random.Random) -> float:
+    new = make_catalogue(count, rng)
+    for i, product in enumerate(new):
+        product["id"] = f"bench-new-{i:08d}"
+    start = time.perf_counter()
+    for product in new:
+        index.upsert(product)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--max-terms", type=int, nargs="+", default=[24])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=16)
+    parser.add_argument("--upserts", type=int, default=2000)
+    parser.add_argument("--baseline", action="store_true", help="also time on-demand similarity in pure Python")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    directory = tempfile.mkdtemp(prefix="ecowave-bench-similar-")
+    try:
+        print(f"{'listings':>10} {'build s':>8} {'MB':>6} {'save s':>7} {'load ms':>8} {'terms':>6} "
+              f"{'p50 ms':>7} {'p95 ms':>7} {'mmap p50':>9} {'overlap':>8} {'upsert us':>10}")
+        for size in args.sizes:
+            products = make_catalogue(size, rng)
+            start = time.perf_counter()
+            index = SimilarityIndex.build(products)
+            build_s = time.perf_counter() - start
+
+            path = os.path.join(directory, f"similar-{size}")
+            start = time.perf_counter()
+            index.save(path)
+            save_s = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded = SimilarityIndex.load(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            postings_mb = (index.rows.nbytes + index.weights.nbytes) / 1e6
+
+            for max_terms in args.max_terms:
+                query = time_queries(index, products, args.queries, args.limit, max_terms, rng)
+                mapped = time_queries(loaded, products, args.queries, args.limit, max_terms, rng)
+                print(f"{size:>10} {build_s:>8.2f} {postings_mb:>6.1f} {save_s:>7.2f} {load_ms:>8.1f} {max_terms:>6} "
+                      f"{query['p50']:>7.2f} {query['p95']:>7.2f} {mapped['p50']:>9.2f} {query['overlap']:>8.1%}", end="")
+                print(f" {time_upserts(loaded, args.upserts, rng):>10.1f}" if max_terms == args.max_terms[-1] else "")
+            if args.baseline and size <= BASELINE_MAX_SIZE:
+                baseline = time_baseline(products, min(args.queries, 20), args.limit, rng)
+                print(f"{size:>10} {'on-demand (pure Python) p50 ms':>40} {baseline['p50']:>8.2f} p95 {baseline['p95']:.2f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
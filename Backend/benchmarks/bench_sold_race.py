@@ -0,0 +1,117 @@
+"""Race parallel mark-sold requests and count Mongo round trips per write path.
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ python benchmarks/bench_sold_race.py --parallel 32
+
+Drives the real Flask handlers through the test client against a local
+MongoDB. The product and user it creates are removed afterwards.
+"""
+import os
+import sys
+import uuid
+import argparse
+import threading
+from datetime import datetime
+
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Must be registered before main creates its MongoClient
+counter = CommandCounter()
+monitoring.register(counter)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+
+def make_product(seller_email: str) -> str:
+    product_id = f"bench-{uuid.uuid4()}"
+    main.products_col.insert_one({
+        "id": product_id,
+        "title": "Race test lamp",
+        "description": "Solar lamp used for the mark-sold race check",
+        "price": 10.0,
+        "badge": "Used",
+        "category": "home",
+        "eco_impact": main.calculate_impact("home"),
+        "seller_email": seller_email,
+        "search_terms": main.search_terms("Race test lamp", ""),
+        "created_at": datetime.utcnow(),
+        "status": "active",
+    })
+    return product_id
+
+
+def count_round_trips(fn) -> int:
+    before = counter.count
+    fn()
+    return counter.count - before
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parallel", type=int, default=32)
+    args = parser.parse_args()
+
+    seller_email = f"bench-seller-{uuid.uuid4()}@example.com"
+    main.users_col.insert_one({"email": seller_email, "name": "Bench Seller"})
+    token = main.create_jwt_for_user({"user_id": seller_email, "email": seller_email})
+    headers = {"Authorization": f"Bearer {token}"}
+    product_ids = []
+    try:
+        # Exactly one of the parallel requests may win the sale
+        product_id = make_product(seller_email)
+        product_ids.append(product_id)
+        barrier = threading.Barrier(args.parallel)
+        statuses = []
+
+        def sell():
+            client = main.app.test_client()
+            barrier.wait()
+            resp = client.post(f"/api/products/{product_id}/sold", json={"buyer_email": None}, headers=headers)
+            statuses.append(resp.status_code)
+
+        threads = [threading.Thread(target=sell) for _ in range(args.parallel)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        successes = statuses.count(200)
+        user = main.users_col.find_one({"email": seller_email})
+        recycled = user.get("impact_stats", {}).get("items_recycled", 0)
+        print(f"parallel requests: {args.parallel}, succeeded: {successes}, items_recycled: {recycled}")
+        if successes != 1 or recycled != 1:
+            print("FAIL: expected exactly one successful sale")
+            sys.exit(1)
+
+        # Round trips per request for each rewritten write path
+        client = main.app.test_client()
+        product_id = make_product(seller_email)
+        product_ids.append(product_id)
+        print(f"{'path':>10} {'round trips':>12}")
+        print(f"{'update':>10} {count_round_trips(lambda: client.put(f'/api/products/{product_id}', json={'title': 'Lamp', 'description': 'Lamp', 'price': 12})):>12}")
+        print(f"{'sold':>10} {count_round_trips(lambda: client.post(f'/api/products/{product_id}/sold', json={'buyer_email': seller_email}, headers=headers)):>12}")
+        print(f"{'delete':>10} {count_round_trips(lambda: client.delete(f'/api/products/{product_id}')):>12}")
+    finally:
+        main.products_col.delete_many({"id": {"$in": product_ids}})
+        main.users_col.delete_one({"email": seller_email})
+
+
+if __name__ == "__main__":
+    main_()
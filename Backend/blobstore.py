@@ -0,0 +1,161 @@
+import os
+import io
+import base64
+import hashlib
+import binascii
+from datetime import datetime
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are skipped when Pillow is not installed
+    Image = None
+
+# Longest edge (px) of each thumbnail variant generated at ingest
+THUMBNAIL_SIZES = {
+    "thumb": 320,
+    "medium": 800,
+}
+
+DATA_URL_PREFIX = "data:"
+
+
+class LocalDiskBlobStore:
+    """Content-addressed blobs stored as files sharded by hash prefix"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def put(self, digest: str, data: bytes) -> None:
+        path = self._path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a partial blob
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def open(self, digest: str):
+        """Return something Flask's send_file accepts, or None if missing"""
+        path = self._path(digest)
+        return path if os.path.exists(path) else None
+
+
+class GridFSBlobStore:
+    """Content-addressed blobs stored in a GridFS bucket keyed by hash"""
+
+    def __init__(self, db, bucket: str = "images"):
+        import gridfs
+        self.fs = gridfs.GridFS(db, collection=bucket)
+
+    def exists(self, digest: str) -> bool:
+        return self.fs.exists({"filename": digest})
+
+    def put(self, digest: str, data: bytes) -> None:
+        if not self.exists(digest):
+            self.fs.put(data, filename=digest)
+
+    def open(self, digest: str):
+        grid_out = self.fs.find_one({"filename": digest})
+        return io.BytesIO(grid_out.read()) if grid_out else None
+
+
+def decode_data_url(data_url: str):
+    """Split a base64 data URL into (content_type, raw bytes)"""
+    header, sep, payload = data_url.partition(",")
+    if not sep or not header.startswith(DATA_URL_PREFIX) or ";base64" not in header:
+        raise ValueError("Image must be a base64 data URL")
+    content_type = header[len(DATA_URL_PREFIX):].split(";")[0] or "application/octet-stream"
+    if not content_type.startswith("image/"):
+        raise ValueError(f"Unsupported image type: {content_type}")
+    try:
+        return content_type, base64.b64decode(payload, validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image data: {e}")
+
+
+def make_thumbnail(data: bytes, max_edge: int):
+    """Downscale an image so its longest edge is max_edge, returning JPEG bytes"""
+    with Image.open(io.BytesIO(data)) as img:
+        img.thumbnail((max_edge, max_edge))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=85, optimize=True)
+        return out.getvalue()
+
+
+def decode_image(data_url: str, max_bytes: int):
+    """Decode and size-check an upload, returning (content_type, data, digest)"""
+    content_type, data = decode_data_url(data_url)
+    if len(data) > max_bytes:
+        raise ValueError(f"Image exceeds maximum size of {max_bytes} bytes")
+    return content_type, data, hashlib.sha256(data).hexdigest()
+
+
+def make_thumbnails(data: bytes) -> dict:
+    """Render every thumbnail variant; doubles as validation that the upload is an image"""
+    thumbnails = {}
+    if Image is None:
+        return thumbnails
+    for name, max_edge in THUMBNAIL_SIZES.items():
+        try:
+            thumbnails[name] = make_thumbnail(data, max_edge)
+        except Exception as e:
+            raise ValueError(f"Unable to read image: {e}")
+    return thumbnails
+
+
+def image_meta(digest: str, data: bytes, content_type: str, **meta) -> dict:
+    return {
+        "hash": digest,
+        "content_type": content_type,
+        "size": len(data),
+        "created_at": datetime.utcnow(),
+        **meta
+    }
+
+
+def needs_thumbnails(existing) -> bool:
+    """Whether an already-stored image still has thumbnails to generate"""
+    return existing is None or (Image is not None and not existing.get("thumbnails"))
+
+
+def _store_blob(store, images_col, data: bytes, content_type: str, **meta) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    # Identical uploads share one blob and one metadata row
+    if images_col.find_one({"hash": digest}, {"_id": 1}) is None:
+        store.put(digest, data)
+        images_col.update_one(
+            {"hash": digest},
+            {"$setOnInsert": image_meta(digest, data, content_type, **meta)},
+            upsert=True
+        )
+    return digest
+
+
+def ingest_image(store, images_col, data_url: str, max_bytes: int) -> dict:
+    """Decode a data URL once, store it and its thumbnails, and return the hashes"""
+    content_type, data, digest = decode_image(data_url, max_bytes)
+    existing = images_col.find_one({"hash": digest}, {"_id": 0, "thumbnails": 1})
+    if not needs_thumbnails(existing):
+        return {"hash": digest, "thumbnails": existing.get("thumbnails", {})}
+
+    # Build thumbnails before writing anything so undecodable uploads are rejected
+    thumbnails = make_thumbnails(data)
+
+    _store_blob(store, images_col, data, content_type)
+    result = {"hash": digest, "thumbnails": {}}
+    for name, thumb in thumbnails.items():
+        result["thumbnails"][name] = _store_blob(store, images_col, thumb, "image/jpeg", source=digest)
+    if result["thumbnails"]:
+        images_col.update_one({"hash": digest}, {"$set": {"thumbnails": result["thumbnails"]}})
+    return result
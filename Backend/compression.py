@@ -0,0 +1,175 @@
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html"}
+
+# Preferred encoding first when the client weights them equally
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str):
+    """Pick the best supported encoding from an Accept-Encoding header, or None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(mimetype: str) -> bool:
+    return (mimetype or "").split(";")[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+class Compressor:
+    """Incremental gzip/brotli encoder for streamed bodies"""
+
+    def __init__(self, encoding: str, gzip_level: int = 6, brotli_quality: int = 5):
+        self.encoding = encoding
+        if encoding == "br":
+            self._impl = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._impl = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            # Flush per chunk so each streamed piece reaches the client promptly
+            return self._impl.process(data) + self._impl.flush()
+        return self._impl.compress(data) + self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._impl.finish() if self.encoding == "br" else self._impl.flush()
+
+
+def compress(data: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 5) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def vary_accept_encoding(vary: str) -> str:
+    if not vary:
+        return "Accept-Encoding"
+    if "accept-encoding" in vary.lower():
+        return vary
+    return vary + ", Accept-Encoding"
+
+
+class CompressionMiddleware:
+    """ASGI middleware applying the same negotiation and threshold as the Flask hook"""
+
+    def __init__(self, app, min_bytes: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict((k.decode("latin-1").lower(), v.decode("latin-1")) for k, v in scope["headers"])
+        encoding = negotiate(headers.get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if state["compressor"] is None:
+                start = state["start"]
+                response_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in start["headers"]}
+                eligible = (
+                    200 <= start["status"] < 300 and start["status"] not in (204, 206)
+                    and "content-encoding" not in response_headers
+                    and compressible(response_headers.get("content-type"))
+                    # A complete body below the threshold is cheaper to send as is
+                    and (more_body or len(body) >= self.min_bytes)
+                )
+                if not eligible:
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+                state["compressor"] = Compressor(encoding, self.gzip_level, self.brotli_quality)
+                raw = [(k, v) for k, v in start["headers"] if k.lower() not in (b"content-length", b"vary")]
+                raw.append((b"content-encoding", encoding.encode("latin-1")))
+                raw.append((b"vary", vary_accept_encoding(response_headers.get("vary")).encode("latin-1")))
+                if not more_body:
+                    data = compress(body, encoding, self.gzip_level, self.brotli_quality)
+                    raw.append((b"content-length", str(len(data)).encode("latin-1")))
+                    await send({**start, "headers": raw})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                await send({**start, "headers": raw})
+
+            chunk = state["compressor"].compress(body)
+            if not more_body:
+                chunk += state["compressor"].finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def compress_response(response, accept_encoding: str, min_bytes: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+    """Compress a Flask response in place; used as an after_request hook"""
+    if (not 200 <= response.status_code < 300 or response.status_code in (204, 206)
+            or "Content-Encoding" in response.headers or not compressible(response.mimetype)):
+        return response
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        compressor = Compressor(encoding, gzip_level, brotli_quality)
+        source = response.response
+        chunks = response.iter_encoded()
+
+        def generate():
+            try:
+                for chunk in chunks:
+                    yield compressor.compress(chunk)
+                yield compressor.finish()
+            finally:
+                # Close the original iterable so e.g. export cursors are released
+                if hasattr(source, "close"):
+                    source.close()
+
+        response.response = generate()
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        response.set_data(compress(data, encoding, gzip_level, brotli_quality))
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
@@ -0,0 +1,123 @@
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+JWT_SECRET = os.getenv("SECRET_KEY", "dev_jwt_secret")
+JWT_EXP_SECONDS = int(os.getenv("JWT_EXP_SECONDS", 86400))
+FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:8080")
+PORT = int(os.getenv("PORT", 5001))
+MONGODB_DB = os.getenv("MONGODB_DB", "userinfo")
+
+# Google OAuth Configuration
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
+GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+# Discovery document and JWKS are cached here (shared by workers on a host) and refreshed after OIDC_CACHE_TTL
+OIDC_CACHE_PATH = os.getenv("OIDC_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ecowave-google-oidc.json"))
+OIDC_CACHE_TTL = float(os.getenv("OIDC_CACHE_TTL", 21600))
+
+# Pagination Configuration
+PRODUCTS_PAGE_SIZE = int(os.getenv("PRODUCTS_PAGE_SIZE", 24))
+PRODUCTS_MAX_PAGE_SIZE = int(os.getenv("PRODUCTS_MAX_PAGE_SIZE", 100))
+
+# Image Storage Configuration
+IMAGE_STORE_BACKEND = os.getenv("IMAGE_STORE_BACKEND", "disk")  # "disk" or "gridfs"
+IMAGE_STORE_PATH = os.getenv("IMAGE_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_store"))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 5 * 1024 * 1024))
+IMAGE_URL_PREFIX = "/api/images/"
+
+# SMTP Configuration
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_EMAIL = os.getenv("SMTP_EMAIL", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+
+# Authenticated User Cache Configuration (set USER_CACHE_URL to share it across workers via Redis)
+USER_CACHE_URL = os.getenv("USER_CACHE_URL", "")
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+
+# Catalogue Response Cache Configuration
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 30))
+ADMIN_EMAILS = {e.strip() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+# Email Outbox Configuration (with EMAIL_WORKERS=0 web workers only queue, and `flask outbox-worker` must run to send)
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", 2))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+
+# Bulk Import/Export Configuration
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", 500))
+BULK_IMPORT_MAX_ERRORS = int(os.getenv("BULK_IMPORT_MAX_ERRORS", 100))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+
+# Metrics Configuration (SLOW_REQUEST_MS=0 disables the slow-request log; METRICS_TOKEN protects /metrics)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 0))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Response Encoding Configuration ("auto" uses orjson when installed; "stdlib" forces the json module)
+JSON_SERIALIZER = os.getenv("JSON_SERIALIZER", "auto")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 5))
+# Seller listings longer than this are streamed from the cursor instead of built in memory
+STREAM_JSON_MIN_ITEMS = int(os.getenv("STREAM_JSON_MIN_ITEMS", 500))
+
+# Geo Search Configuration (seller locations are geocoded offline against GAZETTEER_PATH)
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv"))
+GEO_JITTER_METERS = float(os.getenv("GEO_JITTER_METERS", 300))
+NEAR_DEFAULT_RADIUS_KM = float(os.getenv("NEAR_DEFAULT_RADIUS_KM", 25))
+NEAR_MAX_RADIUS_KM = float(os.getenv("NEAR_MAX_RADIUS_KM", 500))
+
+# Rate Limiting Configuration (set RATE_LIMIT_URL to share buckets across workers via Redis)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", USER_CACHE_URL)
+# Comma-separated "policy=N/period:burst" overrides of ratelimit.DEFAULT_POLICIES
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+# Number of reverse proxies in front of the app whose X-Forwarded-For entries are trusted
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", 0))
+
+# Live Listing Feed Configuration ("auto" uses a change stream on a replica set and polls updated_at otherwise)
+LIVE_FEED_MODE = os.getenv("LIVE_FEED_MODE", "auto")  # "auto", "change_stream" or "polling"
+LIVE_FEED_POLL_SECONDS = float(os.getenv("LIVE_FEED_POLL_SECONDS", 2))
+# Polling re-reads this far behind the newest updated_at seen, for writes that commit after later-stamped ones
+LIVE_FEED_POLL_OVERLAP_SECONDS = float(os.getenv("LIVE_FEED_POLL_OVERLAP_SECONDS", 30))
+LIVE_FEED_BUFFER_SIZE = int(os.getenv("LIVE_FEED_BUFFER_SIZE", 1000))
+LIVE_FEED_QUEUE_SIZE = int(os.getenv("LIVE_FEED_QUEUE_SIZE", 256))
+LIVE_FEED_MAX_SUBSCRIBERS = int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS", 1000))
+LIVE_FEED_HEARTBEAT_SECONDS = float(os.getenv("LIVE_FEED_HEARTBEAT_SECONDS", 15))
+LIVE_FEED_CATCH_UP_LIMIT = int(os.getenv("LIVE_FEED_CATCH_UP_LIMIT", 1000))
+
+# MongoDB Connection Pool Configuration (per worker process; timeouts fail fast instead of hanging workers)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+MONGO_MAX_CONNECTING = int(os.getenv("MONGO_MAX_CONNECTING", 2))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+READINESS_TIMEOUT_MS = int(os.getenv("READINESS_TIMEOUT_MS", 1000))
+# Create missing indexes when a worker starts, for deploys that do not run `flask create-indexes`
+MONGO_CREATE_INDEXES = os.getenv("MONGO_CREATE_INDEXES", "false").lower() in ("1", "true", "yes")
+
+# Similar Items Configuration (snapshot written by `flask rebuild-similar`, memory-mapped by every worker)
+SIMILAR_INDEX_PATH = os.getenv("SIMILAR_INDEX_PATH", os.path.join(tempfile.gettempdir(), "ecowave-similar"))
+# Heaviest TF-IDF terms of a listing scored per lookup; more is slower but closer to exact
+SIMILAR_MAX_QUERY_TERMS = int(os.getenv("SIMILAR_MAX_QUERY_TERMS", 24))
+SIMILAR_DEFAULT_LIMIT = int(os.getenv("SIMILAR_DEFAULT_LIMIT", 8))
+SIMILAR_MAX_LIMIT = int(os.getenv("SIMILAR_MAX_LIMIT", 24))
+# Cosine similarity below which a listing is not considered related at all
+SIMILAR_MIN_SCORE = float(os.getenv("SIMILAR_MIN_SCORE", 0.05))
+
+# Inquiry Configuration
+# Same buyer, listing and message within this window is treated as a resubmission, not a new inquiry
+INQUIRY_DEDUP_WINDOW_SECONDS = int(os.getenv("INQUIRY_DEDUP_WINDOW_SECONDS", 86400))
+# Inquiries are removed by a TTL index this long after they were sent; 0 keeps them forever
+INQUIRY_RETENTION_DAYS = int(os.getenv("INQUIRY_RETENTION_DAYS", 365))
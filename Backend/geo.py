@@ -0,0 +1,116 @@
+import re
+import csv
+import math
+import hashlib
+import threading
+
+# Earth radius in metres used for jitter offsets and haversine distances
+EARTH_RADIUS_M = 6378100.0
+
+COORDINATES_RE = re.compile(r"^\s*(-?\d{1,3}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+NAME_RE = re.compile(r"[a-z]+")
+
+# Longest place name (in words) tried when scanning free text for a known place
+MAX_NAME_WORDS = 3
+
+
+def normalize(text: str) -> str:
+    """Lowercase a place name and reduce it to space-separated letters only"""
+    return " ".join(NAME_RE.findall((text or "").lower()))
+
+
+def parse_coordinates(text: str):
+    """Parse a 'lat,lon' string into a (lat, lon) tuple, or None"""
+    match = COORDINATES_RE.match(text or "")
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+class Gazetteer:
+    """Offline place-name lookup loaded from a CSV of name,lat,lon,aliases.
+
+    Aliases are '|'-separated. Lookups accept exact names, comma-separated
+    addresses ("Koregaon Park, Pune 411001") and free text containing a known
+    place, matching the longest place name first.
+    """
+
+    def __init__(self, places: dict):
+        self.places = places
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Gazetteer":
+        places = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                point = (float(row["lat"]), float(row["lon"]))
+                for name in [row["name"]] + (row.get("aliases") or "").split("|"):
+                    key = normalize(name)
+                    if key:
+                        places.setdefault(key, point)
+        return cls(places)
+
+    def lookup(self, text: str):
+        """Resolve a location string to (lat, lon), or None if it is unknown"""
+        coordinates = parse_coordinates(text)
+        if coordinates:
+            return coordinates
+        key = normalize(text)
+        if key in self.places:
+            return self.places[key]
+        for part in (text or "").split(","):
+            point = self.places.get(normalize(part))
+            if point:
+                return point
+        words = key.split()
+        for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                point = self.places.get(" ".join(words[start:start + size]))
+                if point:
+                    return point
+        return None
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer(path: str) -> Gazetteer:
+    """Load the gazetteer on first use rather than at import"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer.from_csv(path)
+    return _gazetteer
+
+
+def point(lat: float, lon: float) -> dict:
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def jitter(lat: float, lon: float, seed: str, max_metres: float):
+    """Offset a point by up to max_metres, deterministically per seed.
+
+    Listings geocoded to the same city centroid would otherwise sit at exactly
+    the same distance from every buyer, which breaks keyset pagination on
+    distance. The offset also avoids publishing a precise pickup spot.
+    """
+    if max_metres <= 0:
+        return lat, lon
+    digest = hashlib.sha256(seed.encode("utf-8")).digest()
+    distance = max_metres * int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
+    bearing = 2 * math.pi * int.from_bytes(digest[4:8], "big") / 0xFFFFFFFF
+    dlat = distance * math.cos(bearing) / EARTH_RADIUS_M
+    dlon = distance * math.sin(bearing) / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6))
+    return lat + math.degrees(dlat), lon + math.degrees(dlon)
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
@@ -0,0 +1,503 @@
+import queue
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from collections import deque
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+from services import dumps
+
+# Server error code for $changeStream on a standalone mongod
+CHANGE_STREAM_UNSUPPORTED = 40573
+# Resume point no longer in the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+WATCH_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+    {"$project": {"fullDocument.search_terms": 0, "fullDocumentBeforeChange.search_terms": 0}},
+]
+POLL_SORT = [("updated_at", ASCENDING), ("id", ASCENDING)]
+POLL_PROJECTION = {"_id": 0, "search_terms": 0}
+POLL_BATCH = 500
+
+
+class FeedFull(Exception):
+    pass
+
+
+def watch_options(resume_after=None, pre_images: bool = False) -> dict:
+    options = {"full_document": "updateLookup", "resume_after": resume_after}
+    if pre_images:
+        options["full_document_before_change"] = "whenAvailable"
+    return options
+
+
+# Events are {"id", "type", "category", "product"}; "id" doubles as the SSE event id
+def change_event(change: dict):
+    """Shape a change stream document into a feed event, or None to skip it"""
+    op = change["operationType"]
+    if op == "delete":
+        # Needs pre-images for the product id; without them there is nothing a client can match
+        before = change.get("fullDocumentBeforeChange") or {}
+        if not before.get("id"):
+            return None
+        event_type, product = "delete", {"id": before["id"], "category": before.get("category")}
+    else:
+        product = change.get("fullDocument")
+        if product is None:  # Deleted again before the update was looked up
+            return None
+        product.pop("_id", None)
+        updated = (change.get("updateDescription") or {}).get("updatedFields") or {}
+        if op == "insert":
+            event_type = "insert"
+        elif updated.get("status") == "sold":
+            event_type = "sold"
+        else:
+            event_type = "update"
+    return {"id": change["_id"]["_data"], "type": event_type, "category": product.get("category"), "product": product}
+
+
+def encode_poll_id(product: dict) -> str:
+    ms = int(product["updated_at"].replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return f"p.{ms}.{product['id']}"
+
+
+def decode_poll_id(event_id: str):
+    """(updated_at, product id) from a polling event id, or None if it is not one"""
+    try:
+        prefix, ms, product_id = event_id.split(".", 2)
+        if prefix != "p":
+            return None
+        return datetime.fromtimestamp(int(ms) / 1000, timezone.utc).replace(tzinfo=None), product_id
+    except (ValueError, AttributeError):
+        return None
+
+
+def poll_filter(position) -> dict:
+    """Products changed after (updated_at, id), in the same keyset style as listing cursors"""
+    updated_at, product_id = position
+    return {"$or": [
+        {"updated_at": {"$gt": updated_at}},
+        {"updated_at": updated_at, "id": {"$gt": product_id}}
+    ]}
+
+
+class PollWindow:
+    """What the polling fallback has already published, so each pass can re-read an overlap.
+
+    updated_at is set by the app before the write commits, so a write can
+    become visible after a later-stamped one has been read. Each pass reads
+    from overlap before the newest updated_at seen and skips the
+    (id, updated_at) pairs it already published; a write committing more
+    than overlap after its timestamp is still missed. Like the feed before
+    it, changes stamped before the window started are not published.
+    """
+
+    def __init__(self, overlap: float, start: datetime = None):
+        self.overlap = timedelta(seconds=overlap)
+        self.started = self.newest = start or datetime.utcnow()
+        self.seen = {}
+
+    def start(self) -> tuple:
+        """Keyset position that a pass starts reading after"""
+        return self.newest - self.overlap, ""
+
+    def fresh(self, products: list) -> list:
+        """The products not published before, recorded as published"""
+        fresh = []
+        for product in products:
+            key = (product["id"], product["updated_at"])
+            if key not in self.seen:
+                self.seen[key] = product["updated_at"]
+                if product["updated_at"] >= self.started:
+                    fresh.append(product)
+            self.newest = max(self.newest, product["updated_at"])
+        return fresh
+
+    def end_pass(self) -> None:
+        cutoff = self.newest - self.overlap
+        self.seen = {key: updated_at for key, updated_at in self.seen.items() if updated_at >= cutoff}
+
+
+def poll_event(product: dict) -> dict:
+    if product.get("status") == "sold":
+        event_type = "sold"
+    elif product.get("updated_at") == product.get("created_at"):
+        event_type = "insert"
+    else:
+        event_type = "update"
+    return {"id": encode_poll_id(product), "type": event_type, "category": product.get("category"), "product": product}
+
+
+def format_event(event: dict) -> str:
+    data = dumps({"type": event["type"], "product": event["product"]})
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+# Sent when a client's Last-Event-ID can no longer be caught up; it should reload the listing
+RESET_EVENT = "event: reset\ndata: {}\n\n"
+HEARTBEAT = ": ping\n\n"
+
+
+def parse_categories(value: str):
+    categories = {c.strip() for c in (value or "").split(",") if c.strip() and c.strip() != "all"}
+    return categories or None
+
+
+class Subscriber:
+    """One SSE client's bounded queue of pending events"""
+
+    def __init__(self, categories=None, max_pending: int = 256):
+        self.categories = categories
+        self.queue = queue.Queue(max_pending)
+        self.closed = False
+
+    def matches(self, event: dict) -> bool:
+        return not self.categories or event["category"] is None or event["category"] in self.categories
+
+    def push(self, event: dict) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout: float):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber for the ASGI app; only touched from the event loop"""
+
+    def __init__(self, categories=None, max_pending: int = 256):
+        self.categories = categories
+        self.queue = asyncio.Queue(max_pending)
+        self.closed = False
+
+    def push(self, event: dict) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def get(self, timeout: float):
+        try:
+            if timeout <= 0:
+                return self.queue.get_nowait()
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except (asyncio.TimeoutError, asyncio.QueueEmpty):
+            return None
+
+
+class FeedHub:
+    """Fans one stream of events out to every subscriber in the process.
+
+    Recent events are kept in a ring buffer so a client reconnecting with
+    Last-Event-ID is replayed what it missed. A subscriber whose queue fills up
+    is disconnected rather than allowed to hold up the others; it reconnects
+    and resumes from the buffer.
+    """
+
+    def __init__(self, buffer_size: int = 1000, max_subscribers: int = 1000):
+        self.max_subscribers = max_subscribers
+        self.buffer = deque(maxlen=buffer_size)
+        self.subscribers = set()
+        self.listeners = []
+        self.published = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict) -> None:
+        with self._lock:
+            self.buffer.append(event)
+            self.published += 1
+            for subscriber in list(self.subscribers):
+                if subscriber.matches(event) and not subscriber.push(event):
+                    subscriber.closed = True
+                    self.subscribers.discard(subscriber)
+                    self.dropped += 1
+        # Outside the lock, in publish order; listeners must not raise
+        for listener in self.listeners:
+            listener(event)
+
+    def add_listener(self, listener) -> None:
+        """Call listener(event) for every published event, e.g. to keep a per-process index current"""
+        with self._lock:
+            self.listeners = self.listeners + [listener]
+
+    def subscribe(self, subscriber: Subscriber, last_event_id: str = None):
+        """Register subscriber and return the buffered events it missed.
+
+        Returns [] for a fresh connection and None when last_event_id is older
+        than the buffer. Replay and registration happen under one lock, so no
+        event falls between them.
+        """
+        with self._lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                raise FeedFull()
+            replay = []
+            if last_event_id:
+                ids = [event["id"] for event in self.buffer]
+                if last_event_id in ids:
+                    replay = [e for e in list(self.buffer)[ids.index(last_event_id) + 1:] if subscriber.matches(e)]
+                else:
+                    replay = None
+            self.subscribers.add(subscriber)
+        return replay
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            self.subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self.subscribers), "buffered": len(self.buffer), "published": self.published, "dropped": self.dropped}
+
+
+class LiveFeed:
+    """One products watcher thread per process feeding a FeedHub.
+
+    Uses a change stream when Mongo is a replica set (mode "auto" or
+    "change_stream") and otherwise polls updated_at with an overlap window
+    (see PollWindow). Polling cannot see deletions; clients pick those up on
+    their next full reload.
+    The thread starts on the first subscriber, in the worker process itself,
+    so nothing is inherited across a gunicorn fork.
+    """
+
+    def __init__(self, collection, hub: FeedHub, mode: str = "auto", poll_interval: float = 2, poll_overlap: float = 30,
+                 catch_up_limit: int = 1000, logger: logging.Logger = None):
+        self.collection = collection
+        self.hub = hub
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.poll_overlap = poll_overlap
+        self.catch_up_limit = catch_up_limit
+        self.logger = logger or logging.getLogger("ecowave.livefeed")
+        self.resume_token = None
+        self.pre_images = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        if self.mode != "polling":
+            self.pre_images = pre_images_enabled(self.collection, self.logger)
+        while not self._stop.is_set():
+            try:
+                if self.mode == "polling":
+                    self._poll()
+                else:
+                    self._watch()
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED and self.mode == "auto":
+                    self.logger.info("Change streams need a replica set; live feed is polling updated_at")
+                    self.mode = "polling"
+                    continue
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    self.resume_token = None
+                self.logger.warning(f"Live feed watcher failed, retrying: {e}")
+                self._stop.wait(self.poll_interval)
+            except PyMongoError as e:
+                self.logger.warning(f"Live feed watcher failed, retrying: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def _watch(self) -> None:
+        with self.collection.watch(WATCH_PIPELINE, **watch_options(self.resume_token, self.pre_images)) as stream:
+            while not self._stop.is_set() and stream.alive:
+                # Each empty getMore waits server-side, so this loop does not spin
+                change = stream.try_next()
+                if change is None:
+                    continue
+                self.resume_token = change["_id"]
+                event = change_event(change)
+                if event is not None:
+                    self.hub.publish(event)
+
+    def _poll(self) -> None:
+        window = PollWindow(self.poll_overlap)
+        while not self._stop.is_set():
+            position = window.start()
+            while not self._stop.is_set():
+                products = list(self.collection.find(poll_filter(position), POLL_PROJECTION).sort(POLL_SORT).limit(POLL_BATCH))
+                for product in window.fresh(products):
+                    self.hub.publish(poll_event(product))
+                if len(products) < POLL_BATCH:
+                    break
+                position = (products[-1]["updated_at"], products[-1]["id"])
+            window.end_pass()
+            self._stop.wait(self.poll_interval)
+
+    def catch_up(self, subscriber: Subscriber, last_event_id: str):
+        """Events after last_event_id read straight from Mongo, or None if they cannot be.
+
+        Called after subscribe(), so anything newer is already queued; the
+        overlap may repeat an event, which clients apply idempotently.
+        """
+        events = []
+        try:
+            position = decode_poll_id(last_event_id)
+            if position is not None:
+                cursor = self.collection.find(poll_filter(position), POLL_PROJECTION).sort(POLL_SORT).limit(self.catch_up_limit + 1)
+                events = [poll_event(product) for product in cursor]
+            elif self.mode != "polling":
+                with self.collection.watch(WATCH_PIPELINE, **watch_options({"_data": last_event_id}, self.pre_images)) as stream:
+                    while len(events) <= self.catch_up_limit:
+                        change = stream.try_next()
+                        if change is None:
+                            break
+                        event = change_event(change)
+                        if event is not None:
+                            events.append(event)
+            else:
+                return None
+        except PyMongoError as e:
+            self.logger.info(f"Live feed catch-up from {last_event_id} failed: {e}")
+            return None
+        if len(events) > self.catch_up_limit:
+            return None
+        return [event for event in events if subscriber.matches(event)]
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "running": bool(self._thread and self._thread.is_alive()), **self.hub.stats()}
+
+
+class AsyncLiveFeed:
+    """LiveFeed for the ASGI app, reading the change stream through Motor in a task"""
+
+    def __init__(self, collection, hub: FeedHub, mode: str = "auto", poll_interval: float = 2, poll_overlap: float = 30,
+                 catch_up_limit: int = 1000, logger: logging.Logger = None):
+        self.collection = collection
+        self.hub = hub
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.poll_overlap = poll_overlap
+        self.catch_up_limit = catch_up_limit
+        self.logger = logger or logging.getLogger("ecowave.livefeed")
+        self.resume_token = None
+        self.pre_images = False
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        if self.mode != "polling":
+            self.pre_images = await pre_images_enabled_async(self.collection, self.logger)
+        while True:
+            try:
+                if self.mode == "polling":
+                    await self._poll()
+                else:
+                    await self._watch()
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED and self.mode == "auto":
+                    self.logger.info("Change streams need a replica set; live feed is polling updated_at")
+                    self.mode = "polling"
+                    continue
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    self.resume_token = None
+                self.logger.warning(f"Live feed watcher failed, retrying: {e}")
+                await asyncio.sleep(self.poll_interval)
+            except PyMongoError as e:
+                self.logger.warning(f"Live feed watcher failed, retrying: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _watch(self) -> None:
+        async with self.collection.watch(WATCH_PIPELINE, **watch_options(self.resume_token, self.pre_images)) as stream:
+            async for change in stream:
+                self.resume_token = change["_id"]
+                event = change_event(change)
+                if event is not None:
+                    self.hub.publish(event)
+
+    async def _poll(self) -> None:
+        window = PollWindow(self.poll_overlap)
+        while True:
+            position = window.start()
+            while True:
+                products = await self.collection.find(poll_filter(position), POLL_PROJECTION).sort(POLL_SORT).to_list(POLL_BATCH)
+                for product in window.fresh(products):
+                    self.hub.publish(poll_event(product))
+                if len(products) < POLL_BATCH:
+                    break
+                position = (products[-1]["updated_at"], products[-1]["id"])
+            window.end_pass()
+            await asyncio.sleep(self.poll_interval)
+
+    async def catch_up(self, subscriber: Subscriber, last_event_id: str):
+        """Same contract as LiveFeed.catch_up"""
+        events = []
+        try:
+            position = decode_poll_id(last_event_id)
+            if position is not None:
+                cursor = self.collection.find(poll_filter(position), POLL_PROJECTION).sort(POLL_SORT)
+                events = [poll_event(product) for product in await cursor.to_list(self.catch_up_limit + 1)]
+            elif self.mode != "polling":
+                async with self.collection.watch(WATCH_PIPELINE, **watch_options({"_data": last_event_id}, self.pre_images)) as stream:
+                    while len(events) <= self.catch_up_limit:
+                        change = await stream.try_next()
+                        if change is None:
+                            break
+                        event = change_event(change)
+                        if event is not None:
+                            events.append(event)
+            else:
+                return None
+        except PyMongoError as e:
+            self.logger.info(f"Live feed catch-up from {last_event_id} failed: {e}")
+            return None
+        if len(events) > self.catch_up_limit:
+            return None
+        return [event for event in events if subscriber.matches(event)]
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "running": bool(self._task and not self._task.done()), **self.hub.stats()}
+
+
+def pre_images_enabled(collection, logger: logging.Logger) -> bool:
+    """Whether `flask create-indexes` turned on pre-images, which delete events need for the product id"""
+    try:
+        enabled = bool(collection.options().get("changeStreamPreAndPostImages", {}).get("enabled"))
+    except PyMongoError as e:
+        logger.info(f"Could not read the products collection options: {e}")
+        enabled = False
+    if not enabled:
+        logger.info("Change stream pre-images are off, delete events will be skipped")
+    return enabled
+
+
+async def pre_images_enabled_async(collection, logger: logging.Logger) -> bool:
+    try:
+        enabled = bool((await collection.options()).get("changeStreamPreAndPostImages", {}).get("enabled"))
+    except PyMongoError as e:
+        logger.info(f"Could not read the products collection options: {e}")
+        enabled = False
+    if not enabled:
+        logger.info("Change stream pre-images are off, delete events will be skipped")
+    return enabled
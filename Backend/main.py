@@ -1,124 +1,365 @@
+import io
 import os
 import time
+import itertools
+from functools import partial
 import threading
 import requests
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 from functools import wraps
 from urllib import parse as urllib_parse
-from flask import Flask, jsonify, request, redirect, url_for, session
+from flask import Flask, Response, g, jsonify, request, redirect, url_for, session, send_file, make_response
 from flask_cors import CORS
-from pymongo import MongoClient, ASCENDING
-from dotenv import load_dotenv
-import jwt
+from flask.json.provider import DefaultJSONProvider
+from pymongo import MongoClient, ASCENDING, ReturnDocument, timeout as mongo_timeout
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
 from authlib.integrations.flask_client import OAuth
 from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from dateutil.relativedelta import relativedelta
-import certifi
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import uuid 
-
-load_dotenv()
-
-MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
-JWT_SECRET = os.getenv("SECRET_KEY", "dev_jwt_secret")
-JWT_EXP_SECONDS = int(os.getenv("JWT_EXP_SECONDS", 86400))
-FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:8080")
-PORT = int(os.getenv("PORT", 5001))
-
-# SMTP Configuration
-SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
-SMTP_EMAIL = os.getenv("SMTP_EMAIL", "")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+from config import (
+    MONGODB_URI, MONGODB_DB, JWT_SECRET, FRONTEND_ORIGIN, PORT,
+    GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_DISCOVERY_URL, GOOGLE_USERINFO_URL, OIDC_CACHE_PATH, OIDC_CACHE_TTL,
+    IMAGE_STORE_BACKEND, IMAGE_STORE_PATH, MAX_IMAGE_BYTES,
+    SMTP_HOST, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD,
+    USER_CACHE_URL, USER_CACHE_TTL, USER_CACHE_SIZE,
+    RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL, ADMIN_EMAILS,
+    EMAIL_WORKERS, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_BASE_SECONDS,
+    BULK_IMPORT_CHUNK_SIZE, BULK_IMPORT_MAX_ERRORS, EXPORT_BATCH_SIZE, SLOW_REQUEST_MS, METRICS_TOKEN,
+    COMPRESS_MIN_BYTES, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY, STREAM_JSON_MIN_ITEMS,
+    RATE_LIMIT_ENABLED, RATE_LIMIT_URL, RATE_LIMITS, RATE_LIMIT_MAX_KEYS, TRUSTED_PROXY_COUNT,
+    LIVE_FEED_MODE, LIVE_FEED_POLL_SECONDS, LIVE_FEED_POLL_OVERLAP_SECONDS, LIVE_FEED_BUFFER_SIZE, LIVE_FEED_QUEUE_SIZE,
+    LIVE_FEED_MAX_SUBSCRIBERS, LIVE_FEED_HEARTBEAT_SECONDS, LIVE_FEED_CATCH_UP_LIMIT, READINESS_TIMEOUT_MS,
+    SIMILAR_INDEX_PATH, SIMILAR_MAX_QUERY_TERMS, SIMILAR_MIN_SCORE, INQUIRY_RETENTION_DAYS, MONGO_CREATE_INDEXES
+)
+from services import (
+    ServiceError, DEFAULT_IMPACT_STATS, IMPACT_TOTAL_BUCKET, IMPACT_FIELDS, PRODUCT_PROJECTION,
+    PRODUCT_REQUIRED_FIELDS, INQUIRY_REQUIRED_FIELDS, SOLD_PROJECTION, SOLD_CHECK_PROJECTION,
+    impact_rollup_updates, impact_credit_updates, impact_summary_params, summarize_impact,
+    product_list_params, finish_product_page, require_fields, image_fields, new_product, public_product,
+    product_update, search_text_missing, apply_search_terms, sold_filter, sold_update, sold_failure,
+    check_inquiry_product, new_inquiry, inquiry_email_payload, build_inquiry_email,
+    bearer_token, decode_token, create_jwt_for_user, oauth_user_upsert, public_user, userinfo_identity,
+    PRODUCT_SORT, EXPORT_FORMATS, ImportDecoder, ImportBatch, import_format, decode_rows, import_product,
+    import_image_fields, bulk_insert_errors, export_filter, export_header, export_line,
+    dumps, dumps_bytes, json_array_chunks, geocode, seller_dashboard_params, seller_dashboard,
+    SIMILAR_SOURCE_PROJECTION, SIMILAR_PROJECTION, UNSOLD, similar_limit, similar_candidates, rank_similar,
+    similar_fallback_filter, duplicate_inquiry_filter, public_inquiry, inquiry_list_params, finish_inquiry_page,
+    INQUIRY_PROJECTION
+)
+from search import search_terms
+from outbox import EmailOutbox, SMTPConnection, STATUS_HELD, STATUS_QUEUED
+from usercache import LocalUserCache, RedisUserCache
+from responsecache import ResponseCache
+from blobstore import LocalDiskBlobStore, GridFSBlobStore, ingest_image, DATA_URL_PREFIX
+from metrics import Metrics
+from compression import negotiate, compressible, compress, compress_response
+from oidc import ProviderMetadataCache, fetch_json
+from livefeed import FeedHub, FeedFull, LiveFeed, Subscriber, format_event, parse_categories, RESET_EVENT, HEARTBEAT
+from similar import SimilarityIndex, SimilarItems
+from mongo import client_options, apply_indexes, ensure_indexes, indexes_version, is_current, pool_status, SCHEMA_COLLECTION
+from ratelimit import LocalRateLimiter, RedisRateLimiter, load_policies, client_ip, retry_after_header
+
+class ServiceJSONProvider(DefaultJSONProvider):
+    """Send jsonify through services.dumps_bytes (orjson when installed)"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
 
 app = Flask(__name__)
+app.json = ServiceJSONProvider(app)
 # Allow all origins for development to avoid CORS issues
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 app.secret_key = JWT_SECRET
 
+# Request, Mongo and SMTP/OAuth timings, exported on /metrics
+metrics = Metrics(slow_request_seconds=SLOW_REQUEST_MS / 1000, logger=app.logger)
 
-# Detect if MongoDB is local or remote (Atlas) and configure SSL accordingly
-is_local_mongo = "localhost" in MONGODB_URI or "127.0.0.1" in MONGODB_URI
-
-if is_local_mongo:
-    # Local MongoDB - no SSL
-    client = MongoClient(MONGODB_URI)
-else:
-    # Remote MongoDB (Atlas) - use SSL
-    client = MongoClient(
-        MONGODB_URI, 
-        tls=True, 
-        tlsAllowInvalidCertificates=False,
-        tlsCAFile=certifi.where()
-    )
-db = client['userinfo']
+# Pool sizing and timeouts come from config; the client connects lazily on first use,
+# after any gunicorn fork. Indexes are created by `flask create-indexes`, not at import,
+# or by each worker before its first request when MONGO_CREATE_INDEXES is set.
+client = MongoClient(MONGODB_URI, **client_options(MONGODB_URI, [metrics.command_listener(), metrics.pool_listener()]))
+db = client[MONGODB_DB]
 users_col = db['users']
 products_col = db['products']
 inquiries_col = db['inquiries']
-products_col.create_index([("created_at", ASCENDING)])
-inquiries_col.create_index([("created_at", ASCENDING)])
-
-# Impact Metrics Constants
-IMPACT_METRICS = {
-    "electronics": {"co2": 50.0, "water": 100.0, "waste": 1.5},
-    "clothing": {"co2": 15.0, "water": 2000.0, "waste": 0.5},
-    "books": {"co2": 2.0, "water": 20.0, "waste": 0.5},
-    "home": {"co2": 25.0, "water": 50.0, "waste": 10.0},
-    "accessories": {"co2": 5.0, "water": 10.0, "waste": 0.2},
-    "other": {"co2": 10.0, "water": 30.0, "waste": 1.0}
-}
-
-def calculate_impact(category, material=None):
-    """Calculate eco impact based on category and material"""
-    base = IMPACT_METRICS.get(category.lower(), IMPACT_METRICS["other"])
-    return base
+outbox_col = db['email_outbox']
+images_col = db['images']
+impact_rollups_col = db['impact_rollups']
+
+if IMAGE_STORE_BACKEND == "gridfs":
+    image_store = GridFSBlobStore(db)
+else:
+    image_store = LocalDiskBlobStore(IMAGE_STORE_PATH)
+
+if USER_CACHE_URL:
+    user_cache = RedisUserCache(USER_CACHE_URL, ttl=USER_CACHE_TTL)
+else:
+    user_cache = LocalUserCache(ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE)
+
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL)
+
+# One products watcher per worker fans out to every /api/products/live client
+live_feed = LiveFeed(
+    products_col,
+    FeedHub(buffer_size=LIVE_FEED_BUFFER_SIZE, max_subscribers=LIVE_FEED_MAX_SUBSCRIBERS),
+    mode=LIVE_FEED_MODE,
+    poll_interval=LIVE_FEED_POLL_SECONDS,
+    poll_overlap=LIVE_FEED_POLL_OVERLAP_SECONDS,
+    catch_up_limit=LIVE_FEED_CATCH_UP_LIMIT,
+    logger=app.logger
+)
+
+# Loaded on the first /similar request, then kept current from the live feed
+similar_items = SimilarItems(logger=app.logger)
+live_feed.hub.add_listener(similar_items.on_event)
+
+rate_limiter = None
+if RATE_LIMIT_ENABLED:
+    if RATE_LIMIT_URL:
+        rate_limiter = RedisRateLimiter(RATE_LIMIT_URL, load_policies(RATE_LIMITS), logger=app.logger)
+    else:
+        rate_limiter = LocalRateLimiter(load_policies(RATE_LIMITS), max_keys=RATE_LIMIT_MAX_KEYS)
+
+def record_impact_sale(category: str, impact: dict, sold_at: datetime) -> None:
+    """Add one sale to every rollup bucket it falls in, in a single round trip.
+
+    The listing is already sold when this runs, so a failure is logged rather
+    than failing the request; `flask rebuild-impact` recounts the rollups.
+    """
+    try:
+        impact_rollups_col.bulk_write(impact_rollup_updates(category, impact, sold_at), ordered=False)
+    except PyMongoError as e:
+        app.logger.error(f"Impact rollup update failed; run `flask rebuild-impact` to recount: {e}")
+
+indexes_checked = threading.Event()
+indexes_lock = threading.Lock()
+
+@app.before_request
+def create_missing_indexes():
+    # Runs before /readyz too, so a worker only reports ready once its indexes exist
+    if not MONGO_CREATE_INDEXES or indexes_checked.is_set():
+        return
+    with indexes_lock:
+        if indexes_checked.is_set():
+            return
+        try:
+            created = ensure_indexes(db)
+        except PyMongoError as e:
+            app.logger.error(f"Creating indexes failed, will retry on the next request: {e}")
+            return
+        if created:
+            app.logger.info(f"Created indexes at version {indexes_version()}: {', '.join(created)}")
+        indexes_checked.set()
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_token = metrics.start_request()
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        # Streamed responses (exports) have no length up front and count as 0 bytes
+        metrics.finish_request(
+            token, request.endpoint or "unmatched", request.method, response.status_code,
+            time.perf_counter() - g.request_started, response.calculate_content_length() or 0
+        )
+    return response
+
+@app.after_request
+def compress_api_response(response):
+    # Registered after record_request_metrics, so it runs first and metrics see wire bytes
+    return compress_response(
+        response, request.headers.get("Accept-Encoding"),
+        COMPRESS_MIN_BYTES, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY
+    )
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus scrape endpoint for this worker process"""
+    if METRICS_TOKEN and bearer_token(request.headers.get('Authorization')) != METRICS_TOKEN:
+        return jsonify({'message': 'Invalid metrics token!'}), 401
+    return Response(metrics.render(os.getpid()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the worker is serving requests; never touches Mongo"""
+    return jsonify({"status": "ok", "pid": os.getpid()}), 200
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: Mongo answers a ping within READINESS_TIMEOUT_MS and the indexes are current; also reports pool use"""
+    body = {"pid": os.getpid(), "pool": pool_status(metrics.pool_stats())}
+    try:
+        start = time.perf_counter()
+        with mongo_timeout(READINESS_TIMEOUT_MS / 1000):
+            client.admin.command("ping")
+            body["ping_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            applied = db[SCHEMA_COLLECTION].find_one({"_id": "indexes"}, {"version": 1})
+        body["indexes_current"] = is_current(applied)
+    except PyMongoError as e:
+        return jsonify({**body, "status": "unavailable", "error": str(e)}), 503
+    if not body["indexes_current"]:
+        # Without them search has no text index and inquiries lose dedup and expiry
+        error = "Indexes are missing or out of date; run `flask create-indexes` or set MONGO_CREATE_INDEXES"
+        return jsonify({**body, "status": "unavailable", "error": error}), 503
+    return jsonify({**body, "status": "ready"}), 200
+
+def cached_user(email: str):
+    """The cached user document, or None on a miss; a cache outage is treated as a miss"""
+    try:
+        return user_cache.get(email)
+    except Exception as e:
+        app.logger.warning(f"User cache read failed, loading from Mongo: {e}")
+        return None
+
+def cache_user(email: str, user: dict) -> None:
+    try:
+        user_cache.set(email, user)
+    except Exception as e:
+        app.logger.warning(f"User cache write failed: {e}")
+
+def uncache_users(*emails) -> None:
+    """Drop cached user documents; on a cache outage they stay stale until USER_CACHE_TTL"""
+    try:
+        user_cache.invalidate(*emails)
+    except Exception as e:
+        app.logger.warning(f"User cache invalidation failed: {e}")
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization')
-        
-        if auth_header:
-            try:
-                token = auth_header.split(" ")[1]
-            except IndexError:
-                return jsonify({'message': 'Token is missing!'}), 401
-        
+        token = bearer_token(request.headers.get('Authorization'))
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
-            
+
         try:
-            data = jwt.decode(token, app.secret_key, algorithms=["HS256"])
-            current_user = users_col.find_one({"email": data['email']})
-            if not current_user:
-                return jsonify({'message': 'User not found!'}), 401
+            email = decode_token(token)['email']
         except Exception as e:
             return jsonify({'message': 'Token is invalid!', 'error': str(e)}), 401
-            
+
+        current_user = cached_user(email)
+        if current_user is None:
+            current_user = users_col.find_one({"email": email})
+            if not current_user:
+                return jsonify({'message': 'User not found!'}), 401
+            cache_user(email, current_user)
+
+        return f(current_user, *args, **kwargs)
+
+    return decorated
+
+def admin_required(f):
+    @wraps(f)
+    @token_required
+    def decorated(current_user, *args, **kwargs):
+        if current_user.get("email") not in ADMIN_EMAILS:
+            return jsonify({'message': 'Admin access required!'}), 403
         return f(current_user, *args, **kwargs)
-    
+
+    return decorated
+
+def request_ip():
+    return client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"), TRUSTED_PROXY_COUNT)
+
+def request_subject():
+    """Email in the caller's JWT, or None; the signature is checked but the user is not loaded"""
+    token = bearer_token(request.headers.get('Authorization'))
+    if not token:
+        return None
+    try:
+        return decode_token(token).get('email')
+    except Exception:
+        return None
+
+def rate_limit_response(policy: str, key: str):
+    """A 429 response if key has used up its bucket for policy, otherwise None"""
+    if rate_limiter is None or not key:
+        return None
+    allowed, retry_after = rate_limiter.hit(policy, key)
+    if allowed:
+        return None
+    metrics.record_rate_limited(policy)
+    response = jsonify({"success": False, "error": "Too many requests, please try again later"})
+    response.status_code = 429
+    response.headers["Retry-After"] = retry_after_header(retry_after)
+    return response
+
+def over_soft_limit(policy: str, key: str) -> bool:
+    """Take from key's bucket for a policy that changes how a request is handled rather than refusing it"""
+    if rate_limiter is None or not key or rate_limiter.hit(policy, key)[0]:
+        return False
+    metrics.record_rate_limited(policy)
+    return True
+
+def rate_limited(*limits):
+    """Check (policy, key function) pairs before the handler runs; a None key skips its policy"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            for policy, key in limits:
+                limited = rate_limit_response(policy, key())
+                if limited is not None:
+                    return limited
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+def cached_response(f):
+    """Serve catalogue reads from the response cache with weak ETags"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        entry = response_cache.get(key)
+        if entry is None:
+            generation = response_cache.generation
+            response = make_response(f(*args, **kwargs))
+            # Streamed (very long) listings are passed through uncached
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            entry = response_cache.set(key, response.get_data(), response.mimetype, generation)
+
+        # Compressed variants are cached alongside the entry, so hits never recompress
+        encoding = None
+        if len(entry.body) >= COMPRESS_MIN_BYTES and compressible(entry.mimetype):
+            encoding = negotiate(request.headers.get("Accept-Encoding"))
+        if encoding:
+            encode = partial(compress, encoding=encoding, gzip_level=COMPRESS_GZIP_LEVEL, brotli_quality=COMPRESS_BROTLI_QUALITY)
+            response = app.response_class(response_cache.encoded(key, entry, encoding, encode), mimetype=entry.mimetype)
+            response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+        else:
+            response = app.response_class(entry.body, mimetype=entry.mimetype)
+        response.set_etag(entry.etag, weak=True)
+        # Turns into a body-less 304 when If-None-Match matches
+        return response.make_conditional(request)
+
     return decorated
 
 oauth = OAuth(app)
 
 google = oauth.register(
     name="google",
-    client_id=os.getenv("GOOGLE_CLIENT_ID"),
-    client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
+    client_id=GOOGLE_CLIENT_ID,
+    client_secret=GOOGLE_CLIENT_SECRET,
+    server_metadata_url=GOOGLE_DISCOVERY_URL,
     client_kwargs={"scope": "openid email profile"},
 )
 
-try:
-    app.logger.info("Loaded Google server_metadata keys: %s", list(google.server_metadata.keys()))
-    app.logger.info("Google userinfo_endpoint: %s", google.server_metadata.get("userinfo_endpoint"))
-except Exception:
-    app.logger.exception("Unable to read google.server_metadata (discovery may have failed)")
+def fetch_oidc_json(url: str) -> dict:
+    with metrics.external_call("oauth", "discovery"):
+        return fetch_json(url)
+
+# Discovery and JWKS come from a disk cache on first login, never from the network at import
+oidc_cache = ProviderMetadataCache(GOOGLE_DISCOVERY_URL, OIDC_CACHE_PATH, ttl=OIDC_CACHE_TTL, fetch=fetch_oidc_json, logger=app.logger)
 
 def create_default_user(user_id: str) -> dict:
     user_doc = {
@@ -135,61 +376,33 @@ def get_user(user_id: str) -> dict:
 
 def update_user(user_id: str, update_dict: dict) -> None:
     update_dict["updated_at"] = datetime.utcnow()
-    users_col.update_one({"user_id": user_id}, {"$set": update_dict})
-
-def create_jwt_for_user(user_doc: dict) -> str:
-    now = datetime.utcnow()
-    payload = {
-        "sub": str(user_doc.get("user_id", user_doc.get("username"))),
-        "email": user_doc.get("email"),
-        "name": user_doc.get("name"),
-        "iat": int(now.timestamp()),
-        "exp": int((now + timedelta(seconds=JWT_EXP_SECONDS)).timestamp()),
-        "provider": user_doc.get("provider", "oauth")
-    }
-    token = jwt.encode(payload, JWT_SECRET, algorithm="HS256")
-    if isinstance(token, bytes):
-        token = token.decode("utf-8")
-    return token
+    user = users_col.find_one_and_update({"user_id": user_id}, {"$set": update_dict}, projection={"email": 1})
+    if user:
+        uncache_users(user.get("email"))
 
 def upsert_oauth_user(email: str, name: str = None, provider: str = "google", extra: dict = None) -> dict:
-    query = {"email": email}
-    now = datetime.utcnow()
-    update = {
-        "$set": {
-            "username": name,
-            "email": email,
-            "name": name,
-            "provider": provider,
-            "updated_at": now
-        },
-        "$setOnInsert": {
-            "created_at": now,
-            "balance": 100000.0,
-            "portfolio": [],
-            "tradeHistory": []
-        }
-
-    }
+    query, update = oauth_user_upsert(email, name, provider)
     users_col.update_one(query, update, upsert=True)
-    user = users_col.find_one(query)
-    if user:
-        user["user_id"] = user.get("username")
-        user.pop("_id", None)
-    return user
+    uncache_users(email)
+    return public_user(users_col.find_one(query))
 
 @app.route("/auth/google", methods=["GET"])
 def auth_google():
     redirect_uri = url_for("auth_google_callback", _external=True)
     app.logger.info("auth_google redirect_uri: %s", redirect_uri)
+    oidc_cache.apply(google)
     return google.authorize_redirect(redirect_uri)
 
 @app.route("/auth/google/callback", methods=["GET"])
 def auth_google_callback():
-    token = google.authorize_access_token()
-    userinfo = google.get("https://www.googleapis.com/oauth2/v2/userinfo").json()
-    email = userinfo.get("email")
-    name = userinfo.get("name") or userinfo.get("given_name") or (email.split("@")[0] if email else None)
+    oidc_cache.apply(google)
+    with metrics.external_call("oauth", "token"):
+        token = google.authorize_access_token()
+    # authlib has verified the ID token against the cached JWKS; its claims are in token["userinfo"]
+    email, name = userinfo_identity(token.get("userinfo") or {})
+    if not email:
+        with metrics.external_call("oauth", "userinfo"):
+            email, name = userinfo_identity(google.get(GOOGLE_USERINFO_URL).json())
     if not email:
         return jsonify({"error": "No email returned"}), 400
     user = upsert_oauth_user(email=email, name=name, provider="google")
@@ -197,91 +410,197 @@ def auth_google_callback():
     redirect_url = FRONTEND_ORIGIN.rstrip("/") + "/auth-callback?token=" + urllib_parse.quote(jwt_token)
     return redirect(redirect_url)
 
-# Email sending function
-def send_inquiry_email(seller_email: str, product_title: str, buyer_name: str, buyer_email: str, buyer_message: str) -> bool:
-    """Send email notification to seller about buyer inquiry"""
-    if not SMTP_EMAIL or not SMTP_PASSWORD:
-        app.logger.warning("SMTP credentials not configured, skipping email")
-        return False
-    
+email_outbox = EmailOutbox(
+    outbox_col,
+    inquiries_col,
+    connection_factory=lambda: SMTPConnection(
+        SMTP_HOST, SMTP_PORT, SMTP_EMAIL, SMTP_PASSWORD,
+        observe=lambda operation, seconds, failed: metrics.observe_external("smtp", operation, seconds, failed)
+    ),
+    render=build_inquiry_email,
+    logger=app.logger,
+    workers=EMAIL_WORKERS,
+    max_attempts=EMAIL_MAX_ATTEMPTS,
+    backoff_base=EMAIL_RETRY_BASE_SECONDS
+)
+
+@app.before_request
+def start_email_outbox():
+    # Threads do not survive a fork, so each worker starts its own on its first request
+    # (health probes included) and drains jobs left queued or retrying before a restart
+    email_outbox.start()
+
+@app.cli.command("create-indexes")
+def create_indexes():
+    """Create the indexes in services.INDEXES and apply COLLECTION_OPTIONS; run once per deploy, before starting workers"""
+    for name in apply_indexes(db):
+        print(f"Ready: {name}")
+    print(f"Recorded index version {indexes_version()}")
+
+@app.cli.command("rebuild-similar")
+def rebuild_similar():
+    """Build the similar-items index from unsold listings and write the snapshot workers load"""
+    start = time.perf_counter()
+    index = SimilarityIndex.build(products_col.find({"status": UNSOLD}, SIMILAR_SOURCE_PROJECTION))
+    index.save(SIMILAR_INDEX_PATH)
+    print(f"Indexed {len(index)} listings in {time.perf_counter() - start:.1f}s to {SIMILAR_INDEX_PATH}.json")
+
+@app.cli.command("expire-inquiries")
+def expire_inquiries():
+    """Give inquiries stored before the TTL index an expires_at, so they age out like new ones"""
+    if not INQUIRY_RETENTION_DAYS:
+        print("INQUIRY_RETENTION_DAYS is 0; inquiries are kept forever")
+        return
+    result = inquiries_col.update_many(
+        {"expires_at": {"$exists": False}},
+        [{"$set": {"expires_at": {"$add": ["$created_at", INQUIRY_RETENTION_DAYS * 86400 * 1000]}}}]
+    )
+    print(f"Set expires_at on {result.modified_count} inquiries")
+
+@app.cli.command("refresh-oidc")
+def refresh_oidc():
+    """Fetch Google's discovery document and JWKS into the disk cache, e.g. at deploy"""
+    entry = oidc_cache.refresh()
+    print(f"Cached OIDC metadata with {len((entry['jwks'] or {}).get('keys', []))} signing keys at {OIDC_CACHE_PATH}")
+
+@app.cli.command("outbox-worker")
+def outbox_worker():
+    """Drain the email outbox in a dedicated process"""
+    email_outbox.workers = max(EMAIL_WORKERS, 1)
+    email_outbox.start()
+    email_outbox.join()
+
+# Image helpers
+def store_product_image(image: str) -> dict:
+    """Ingest an uploaded data URL and return the product fields that reference it"""
     try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f"EcoWave: Inquiry about '{product_title}'"
-        msg['From'] = SMTP_EMAIL
-        msg['To'] = seller_email
-        
-        # Create email body
-        html = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
-              <h2 style="color: #10b981;">New Inquiry on EcoWave! 🌊</h2>
-              <p>Someone is interested in your listing: <strong>{product_title}</strong></p>
-              
-              <div style="background-color: white; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                <h3 style="margin-top: 0;">Buyer Details:</h3>
-                <p><strong>Name:</strong> {buyer_name}</p>
-                <p><strong>Email:</strong> <a href="mailto:{buyer_email}">{buyer_email}</a></p>
-                
-                <h3>Message:</h3>
-                <p style="background-color: #f3f4f6; padding: 15px; border-radius: 4px;">{buyer_message}</p>
-              </div>
-              
-              <p>You can reply directly to <a href="mailto:{buyer_email}">{buyer_email}</a> to connect with this buyer.</p>
-              
-              <hr style="border: none; border-top: 1px solid #e5e7eb; margin: 30px 0;" />
-              <p style="font-size: 12px; color: #6b7280;">This is an automated message from EcoWave Marketplace.</p>
-            </div>
-          </body>
-        </html>
-        """
-        
-        part = MIMEText(html, 'html')
-        msg.attach(part)
-        
-        # Send email
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_EMAIL, SMTP_PASSWORD)
-            server.send_message(msg)
-        
-        app.logger.info(f"Email sent successfully to {seller_email}")
-        return True
-    except Exception as e:
-        app.logger.error(f"Failed to send email: {e}")
-        return False
+        return image_fields(ingest_image(image_store, images_col, image, MAX_IMAGE_BYTES))
+    except ValueError as e:
+        raise ServiceError(str(e))
+
+@app.route("/api/images/<digest>", methods=["GET"])
+def get_image(digest):
+    """Serve stored image bytes by content hash"""
+    meta = images_col.find_one({"hash": digest}, {"_id": 0, "content_type": 1})
+    source = image_store.open(digest) if meta else None
+    if source is None:
+        return jsonify({"success": False, "error": "Image not found"}), 404
+
+    # The hash is the content, so it doubles as a strong ETag and never changes
+    response = send_file(source, mimetype=meta["content_type"], conditional=True, etag=digest, max_age=31536000)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+@app.cli.command("migrate-images")
+def migrate_images():
+    """Move inline data URL images out of products into the blob store"""
+    migrated, failed = 0, 0
+    cursor = products_col.find({"image": {"$regex": f"^{DATA_URL_PREFIX}"}}, {"_id": 0, "id": 1, "image": 1})
+    for product in cursor:
+        try:
+            stored_image_fields = store_product_image(product["image"])
+        except ServiceError as e:
+            app.logger.error(f"Unable to migrate image for product {product['id']}: {e}")
+            failed += 1
+            continue
+        products_col.update_one({"id": product["id"]}, {"$set": stored_image_fields})
+        migrated += 1
+    print(f"Migrated {migrated} images, {failed} failed")
+
+@app.cli.command("reindex-search")
+def reindex_search():
+    """Recompute search_terms for every product"""
+    count = 0
+    for product in products_col.find({}, {"_id": 0, "id": 1, "title": 1, "description": 1}):
+        terms = search_terms(product.get("title", ""), product.get("description", ""))
+        products_col.update_one({"id": product["id"]}, {"$set": {"search_terms": terms}})
+        count += 1
+    print(f"Reindexed {count} products")
+
+@app.cli.command("geocode-products")
+def geocode_products():
+    """Recompute the geo point of every product from its seller_location.
+
+    The response cache lives in each server process, so cached list and near
+    responses stay stale until RESPONSE_CACHE_TTL runs out.
+    """
+    count = located = 0
+    for product in products_col.find({}, {"_id": 0, "id": 1, "seller_location": 1}):
+        location = geocode(product.get("seller_location", ""), product["id"])
+        products_col.update_one({"id": product["id"]}, {"$set": {"location": location}})
+        count += 1
+        located += location is not None
+    print(f"Geocoded {located} of {count} products")
 
 # Product API Endpoints
 @app.route("/api/products", methods=["GET"])
+@cached_response
 def get_products():
-    """Fetch all products from the database with optional filtering"""
+    """Fetch a page of products from the database with optional filtering"""
     try:
-        query = {}
-        
-        # Filter by Category
-        category = request.args.get("category")
-        if category and category != "all":
-            query["category"] = category
-            
-        # Filter by Search Text
-        search = request.args.get("search")
-        if search:
-            query["$or"] = [
-                {"title": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}}
-            ]
-
-        products = list(products_col.find(query, {"_id": 0}).sort("created_at", -1))
-        return jsonify({"success": True, "products": products}), 200
+        params = product_list_params(request.args)
+        if "pipeline" in params:
+            products = list(products_col.aggregate(params["pipeline"]))
+        else:
+            products = list(
+                products_col.find(params["filter"], params["projection"])
+                .sort(params["sort"])
+                .limit(params["limit"])
+            )
+        return jsonify(finish_product_page(products, params)), 200
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
     except Exception as e:
         app.logger.error(f"Error fetching products: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/products/live", methods=["GET"])
+def live_products():
+    """Server-Sent Events feed of listing inserts, updates, sales and deletions"""
+    live_feed.start()
+    subscriber = Subscriber(parse_categories(request.args.get("category")), LIVE_FEED_QUEUE_SIZE)
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        replay = live_feed.hub.subscribe(subscriber, last_event_id)
+    except FeedFull:
+        response = jsonify({"success": False, "error": "Live feed is at capacity, try again later"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+    if replay is None:
+        replay = live_feed.catch_up(subscriber, last_event_id)
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            if replay is None:
+                yield RESET_EVENT
+            for event in replay or ():
+                yield format_event(event)
+            # A dropped subscriber still drains what was queued before it was cut off
+            while True:
+                event = subscriber.get(timeout=0 if subscriber.closed else LIVE_FEED_HEARTBEAT_SECONDS)
+                if event is not None:
+                    yield format_event(event)
+                elif subscriber.closed:
+                    break
+                else:
+                    yield HEARTBEAT
+        finally:
+            live_feed.hub.unsubscribe(subscriber)
+
+    # Each open feed holds a worker thread; run gunicorn with threaded workers or use asgi.py
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 @app.route("/api/products/<product_id>", methods=["GET"])
+@cached_response
 def get_product(product_id):
     """Fetch a single product by ID"""
     try:
-        product = products_col.find_one({"id": product_id}, {"_id": 0})
+        product = products_col.find_one({"id": product_id}, PRODUCT_PROJECTION)
         if not product:
             return jsonify({"success": False, "error": "Product not found"}), 404
         return jsonify({"success": True, "product": product}), 200
@@ -289,163 +608,289 @@ def get_product(product_id):
         app.logger.error(f"Error fetching product {product_id}: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+def load_similar_index():
+    """Snapshot from `flask rebuild-similar` (or a fresh build without one), then listings changed since"""
+    try:
+        index = SimilarityIndex.load(SIMILAR_INDEX_PATH)
+        if index is None:
+            app.logger.info("No similar-items snapshot, building one in this worker; run `flask rebuild-similar`")
+            index = SimilarityIndex.build(products_col.find({"status": UNSOLD}, SIMILAR_SOURCE_PROJECTION))
+        similar_items.install(index, products_col.find({"updated_at": {"$gte": index.built_at}}, SIMILAR_SOURCE_PROJECTION))
+    except Exception as e:
+        similar_items.fail(e)
+
+def similar_index():
+    """This worker's SimilarityIndex, or None while it loads in the background"""
+    if similar_items.begin():
+        live_feed.start()
+        threading.Thread(target=load_similar_index, name="similar-index", daemon=True).start()
+    return similar_items.index
+
+@app.route("/api/products/<product_id>/similar", methods=["GET"])
+@cached_response
+def get_similar_products(product_id):
+    """Listings most like this one by title, description, category and material"""
+    try:
+        limit = similar_limit(request.args)
+        product = products_col.find_one({"id": product_id}, SIMILAR_SOURCE_PROJECTION)
+        if not product:
+            return jsonify({"success": False, "error": "Product not found"}), 404
+        index = similar_index()
+        if index is not None:
+            # Over-fetch, since some matches may have sold since the index last heard of them
+            matches = index.similar(product, limit * 2, SIMILAR_MIN_SCORE, SIMILAR_MAX_QUERY_TERMS)
+            products = rank_similar(list(products_col.find(similar_candidates(matches), SIMILAR_PROJECTION)), matches, limit)
+            source = "index"
+        else:
+            products = list(products_col.find(similar_fallback_filter(product), SIMILAR_PROJECTION).sort(PRODUCT_SORT).limit(limit))
+            source = "category"
+        return jsonify({"success": True, "products": products, "source": source}), 200
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
+    except Exception as e:
+        app.logger.error(f"Error fetching similar products for {product_id}: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route("/api/products", methods=["POST"])
+@rate_limited(("product_create_ip", request_ip), ("product_create_user", request_subject))
 def create_product():
     """Create a new product listing"""
     try:
         data = request.get_json()
-        
-        # Validate required fields
-        required_fields = ["title", "description", "price", "badge", "image"]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"success": False, "error": f"Missing field: {field}"}), 400
-        
-        # Generate unique ID
-        import uuid
-        product_id = str(uuid.uuid4())
-        
-        product = {
-            "id": product_id,
-            "title": data["title"],
-            "description": data["description"],
-            "price": float(data["price"]),
-            "badge": data["badge"],
-            "image": data["image"],
-            "category": data.get("category"),
-            "material": data.get("material", ""),
-            "eco_impact": calculate_impact(data.get("category", "other"), data.get("material")),
-            "seller_id": data.get("seller_id", "anonymous"),
-            "seller_email": data.get("seller_email", ""),
-            "seller_location": data.get("seller_location", ""),
-            "seller_phone": data.get("seller_phone", ""),
-            "created_at": datetime.utcnow(),
-            "status": "active"
-        }
-        
+        require_fields(data, PRODUCT_REQUIRED_FIELDS)
+        product = new_product(data, store_product_image(data["image"]))
+
         products_col.insert_one(product)
-        product.pop("_id", None)  # Remove MongoDB _id from response
-        
-        return jsonify({"success": True, "product": product}), 201
+        response_cache.invalidate()
+
+        return jsonify({"success": True, "product": public_product(product)}), 201
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
     except Exception as e:
         app.logger.error(f"Error creating product: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/inquiries", methods=["POST"])
+@rate_limited(("inquiry_ip", request_ip), ("inquiry_user", request_subject))
 def create_inquiry():
     """Handle buyer inquiry about a product"""
     try:
         data = request.get_json()
-        
-        # Validate required fields
-        required_fields = ["product_id", "buyer_name", "buyer_email", "buyer_message"]
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"success": False, "error": f"Missing field: {field}"}), 400
-        
+        require_fields(data, INQUIRY_REQUIRED_FIELDS)
+
         # Get product details
         product = products_col.find_one({"id": data["product_id"]}, {"_id": 0})
-        if not product:
-            return jsonify({"success": False, "error": "Product not found"}), 404
-        
-        if not product.get("seller_email"):
-            return jsonify({"success": False, "error": "Seller contact information not available"}), 400
-        
-        # Create inquiry record
-        inquiry_id = str(uuid.uuid4())
-        inquiry = {
-            "inquiry_id": inquiry_id,
-            "product_id": data["product_id"],
-            "product_title": product["title"],
-            "buyer_name": data["buyer_name"],
-            "buyer_email": data["buyer_email"],
-            "buyer_message": data["buyer_message"],
-            "seller_email": product["seller_email"],
-            "status": "sent",
-            "created_at": datetime.utcnow()
-        }
-        
-        # Save to database
-        inquiries_col.insert_one(inquiry)
-        
-        # Send email to seller
-        email_sent = send_inquiry_email(
-            seller_email=product["seller_email"],
-            product_title=product["title"],
-            buyer_name=data["buyer_name"],
-            buyer_email=data["buyer_email"],
-            buyer_message=data["buyer_message"]
-        )
-        
-        inquiry.pop("_id", None)  # Remove MongoDB _id from response
-        
+        check_inquiry_product(product)
+
+        email_configured = bool(SMTP_EMAIL and SMTP_PASSWORD)
+        if not email_configured:
+            app.logger.warning("SMTP credentials not configured, skipping email")
+
+        # Save to database, unless this is a resubmission of an inquiry already sent
+        inquiry = new_inquiry(data, product, email_configured)
+        existing = inquiries_col.find_one(duplicate_inquiry_filter(inquiry), INQUIRY_PROJECTION)
+        if existing is None:
+            # Caps how much inquiry mail any one seller is sent; past it the inquiry still reaches their inbox
+            if email_configured and over_soft_limit("inquiry_seller", product.get("seller_email")):
+                inquiry["status"] = STATUS_HELD
+            try:
+                inquiries_col.insert_one(inquiry)
+            except DuplicateKeyError:
+                # A concurrent copy won the unique idempotency key
+                existing = inquiries_col.find_one({"idempotency_key": inquiry["idempotency_key"]}, INQUIRY_PROJECTION)
+        if existing is not None:
+            if existing["status"] == STATUS_QUEUED:
+                # Covers an earlier request that saved the inquiry but failed to queue its email; a no-op otherwise
+                email_outbox.enqueue(existing["inquiry_id"], inquiry_email_payload(existing))
+            return jsonify({"success": True, "inquiry": existing, "email_queued": False, "duplicate": True}), 200
+
+        # Queue email to seller; the outbox workers send it in the background
+        email_queued = inquiry["status"] == STATUS_QUEUED
+        if email_queued:
+            email_outbox.enqueue(inquiry["inquiry_id"], inquiry_email_payload(inquiry))
+
+        public_inquiry(inquiry)
+
         return jsonify({
             "success": True,
             "inquiry": inquiry,
-            "email_sent": email_sent
-        }), 201
+            "email_queued": email_queued
+        }), 202
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
     except Exception as e:
         app.logger.error(f"Error creating inquiry: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/inquiries", methods=["GET"])
+@token_required
+def get_inquiries(current_user):
+    """A page of inquiries sent to the signed-in seller, newest first, optionally for one listing"""
+    try:
+        params = inquiry_list_params(current_user["email"], request.args)
+        inquiries = list(
+            inquiries_col.find(params["filter"], params["projection"])
+            .sort(params["sort"])
+            .limit(params["limit"])
+        )
+        return jsonify(finish_inquiry_page(inquiries, params)), 200
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
+    except Exception as e:
+        app.logger.error(f"Error fetching inquiries: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route("/api/products/seller/<email>", methods=["GET"])
+@cached_response
 def get_products_by_seller(email):
     """Fetch all products by seller email"""
     try:
-        products = list(products_col.find({"seller_email": email}, {"_id": 0}).sort("created_at", -1))
-        return jsonify({"success": True, "products": products}), 200
+        cursor = products_col.find({"seller_email": email}, PRODUCT_PROJECTION).sort("created_at", -1)
+        head = list(itertools.islice(cursor, STREAM_JSON_MIN_ITEMS + 1))
+        if len(head) <= STREAM_JSON_MIN_ITEMS:
+            return jsonify({"success": True, "products": head}), 200
+        # Long listings are streamed from the cursor rather than built as one string
+        body = json_array_chunks({"success": True}, "products", itertools.chain(head, cursor))
+        return Response(body, mimetype="application/json")
     except Exception as e:
         app.logger.error(f"Error fetching seller products: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/sellers/<email>/dashboard", methods=["GET"])
+@token_required
+def get_seller_dashboard(current_user, email):
+    """Listing counts, impact, inquiry counts and a page of listings"""
+    if current_user["email"] != email and current_user["email"] not in ADMIN_EMAILS:
+        return jsonify({"success": False, "error": "Unauthorized"}), 403
+    try:
+        params = seller_dashboard_params(email, request.args)
+        summary = list(products_col.aggregate(params["summary"]))
+        inquiries = list(inquiries_col.aggregate(params["inquiries"]))
+        products = list(products_col.aggregate(params["listings"]))
+        return jsonify(seller_dashboard(summary, inquiries, products, params["page_size"])), 200
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
+    except Exception as e:
+        app.logger.error(f"Error building seller dashboard: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def flush_import(batch: ImportBatch) -> None:
+    docs, rows = batch.take()
+    if not docs:
+        return
+    try:
+        products_col.insert_many(docs, ordered=False)
+        batch.record(len(docs))
+    except BulkWriteError as e:
+        # Unordered inserts keep going past bad rows; report just those
+        batch.record(e.details.get("nInserted", 0), bulk_insert_errors(e.details, rows))
+
+@app.route("/api/products/bulk", methods=["POST"])
+@rate_limited(("product_write_ip", request_ip), ("bulk_import_user", request_subject))
+@token_required
+def bulk_import_products(current_user):
+    """Create products from a streamed NDJSON or CSV body, reporting per-row errors"""
+    try:
+        decoder = ImportDecoder(import_format(request.content_type, request.args.get("format")))
+        batch = ImportBatch(BULK_IMPORT_CHUNK_SIZE, BULK_IMPORT_MAX_ERRORS)
+        is_admin = current_user["email"] in ADMIN_EMAILS
+
+        # Read the body line by line instead of buffering it with get_data()
+        lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+        for row_number, row in decode_rows(decoder, lines):
+            try:
+                if isinstance(row, ServiceError):
+                    raise row
+                require_fields(row, PRODUCT_REQUIRED_FIELDS)
+                stored = import_image_fields(row["image"])
+                if stored is None:
+                    stored = store_product_image(row["image"])
+                batch.add(row_number, import_product(row, current_user["email"], is_admin, stored))
+            except ServiceError as e:
+                batch.fail(row_number, e.message)
+            if batch.full:
+                flush_import(batch)
+        flush_import(batch)
+
+        if batch.inserted:
+            response_cache.invalidate()
+        return jsonify(batch.result()), 200
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
+    except Exception as e:
+        app.logger.error(f"Error importing products: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/api/products/export", methods=["GET"])
+@token_required
+def export_products(current_user):
+    """Stream matching products as NDJSON or CSV straight from a server-side cursor"""
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"success": False, "error": f"Unsupported format: {fmt}"}), 400
+
+    cursor = products_col.find(export_filter(request.args), PRODUCT_PROJECTION, batch_size=EXPORT_BATCH_SIZE).sort(PRODUCT_SORT)
+
+    def generate():
+        try:
+            yield export_header(fmt)
+            for product in cursor:
+                yield export_line(product, fmt)
+        finally:
+            cursor.close()
+
+    return Response(generate(), mimetype=EXPORT_FORMATS[fmt], headers={
+        "Content-Disposition": f'attachment; filename="products.{fmt}"'
+    })
+
 @app.route("/api/products/<product_id>", methods=["PUT"])
+@rate_limited(("product_write_ip", request_ip), ("product_write_user", request_subject))
 def update_product(product_id):
     """Update an existing product"""
     try:
         data = request.get_json()
-        
-        # Get existing product
-        existing_product = products_col.find_one({"id": product_id}, {"_id": 0})
-        if not existing_product:
+
+        # Only a freshly uploaded data URL replaces the stored image
+        stored_image_fields = {}
+        if isinstance(data, dict) and str(data.get("image", "")).startswith(DATA_URL_PREFIX):
+            stored_image_fields = store_product_image(data["image"])
+        update_data = product_update(data, stored_image_fields, product_id)
+
+        current = None
+        if search_text_missing(update_data):
+            current = products_col.find_one({"id": product_id}, {"_id": 0, "title": 1, "description": 1})
+            if not current:
+                return jsonify({"success": False, "error": "Product not found"}), 404
+        apply_search_terms(update_data, current)
+
+        # Update and read back the product in a single round trip
+        updated_product = products_col.find_one_and_update(
+            {"id": product_id},
+            {"$set": update_data},
+            projection=PRODUCT_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if not updated_product:
             return jsonify({"success": False, "error": "Product not found"}), 404
-        
-        # Prepare update data
-        update_data = {
-            "title": data.get("title", existing_product["title"]),
-            "description": data.get("description", existing_product["description"]),
-            "price": float(data.get("price", existing_product["price"])),
-            "badge": data.get("badge", existing_product["badge"]),
-            "image": data.get("image", existing_product["image"]),
-            "category": data.get("category", existing_product.get("category")),
-            "seller_email": data.get("seller_email", existing_product.get("seller_email", "")),
-            "seller_location": data.get("seller_location", existing_product.get("seller_location", "")),
-            "seller_phone": data.get("seller_phone", existing_product.get("seller_phone", "")),
-            "updated_at": datetime.utcnow()
-        }
-        
-        # Update product
-        products_col.update_one({"id": product_id}, {"$set": update_data})
-        
-        # Get updated product
-        updated_product = products_col.find_one({"id": product_id}, {"_id": 0})
-        
+        response_cache.invalidate()
+
         return jsonify({"success": True, "product": updated_product}), 200
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
     except Exception as e:
         app.logger.error(f"Error updating product {product_id}: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/products/<product_id>", methods=["DELETE"])
+@rate_limited(("product_write_ip", request_ip), ("product_write_user", request_subject))
 def delete_product(product_id):
     """Delete a product"""
     try:
-        # Check if product exists
-        product = products_col.find_one({"id": product_id}, {"_id": 0})
+        product = products_col.find_one_and_delete({"id": product_id}, projection={"_id": 1})
         if not product:
             return jsonify({"success": False, "error": "Product not found"}), 404
-        
-        # Delete product
-        products_col.delete_one({"id": product_id})
-        
+        response_cache.invalidate()
+
         return jsonify({"success": True, "message": "Product deleted successfully"}), 200
     except Exception as e:
         app.logger.error(f"Error deleting product {product_id}: {e}")
@@ -456,74 +901,122 @@ def delete_product(product_id):
 def get_user_impact(current_user):
     """Get impact stats for the logged-in user"""
     try:
-        impact_stats = current_user.get("impact_stats", {
-            "co2_saved": 0.0,
-            "water_saved": 0.0,
-            "waste_saved": 0.0,
-            "items_recycled": 0,
-            "items_purchased": 0
-        })
+        impact_stats = current_user.get("impact_stats", DEFAULT_IMPACT_STATS)
         return jsonify({"success": True, "impact": impact_stats}), 200
     except Exception as e:
         app.logger.error(f"Error fetching user impact: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/products/<product_id>/sold", methods=["POST"])
+@rate_limited(("product_write_ip", request_ip), ("product_write_user", request_subject))
 @token_required
 def mark_product_sold(current_user, product_id):
     """Mark a product as sold and credit impact to buyer/seller"""
     try:
         data = request.get_json()
         buyer_email = data.get("buyer_email")
-        
-        product = products_col.find_one({"id": product_id})
+
+        sold_at = datetime.utcnow()
+        product = products_col.find_one_and_update(
+            sold_filter(product_id, current_user["email"]),
+            sold_update(buyer_email, sold_at),
+            projection=SOLD_PROJECTION
+        )
         if not product:
-            return jsonify({"success": False, "error": "Product not found"}), 404
-            
-        # Verify ownership
-        if product.get("seller_email") != current_user["email"]:
-            return jsonify({"success": False, "error": "Unauthorized"}), 403
-            
-        if product.get("status") == "sold":
-             return jsonify({"success": False, "error": "Product already sold"}), 400
-
-        # Update product status
-        products_col.update_one({"id": product_id}, {"$set": {"status": "sold", "buyer_email": buyer_email}})
-        
-        # Credit Impact
+            # Only the failure path pays for a second read to pick the right error
+            existing = products_col.find_one({"id": product_id}, SOLD_CHECK_PROJECTION)
+            raise sold_failure(existing, current_user["email"])
+        response_cache.invalidate()
+
+        # Seller stats, plus buyer stats if email provided, in one round trip
         impact = product.get("eco_impact", {})
-        co2 = impact.get("co2", 0)
-        water = impact.get("water", 0)
-        waste = impact.get("waste", 0)
-        
-        # Update Seller Stats
-        users_col.update_one(
-            {"email": current_user["email"]},
-            {"$inc": {
-                "impact_stats.co2_saved": co2,
-                "impact_stats.water_saved": water,
-                "impact_stats.waste_saved": waste,
-                "impact_stats.items_recycled": 1
-            }}
-        )
-        
-        # Update Buyer Stats if email provided
-        if buyer_email:
-            users_col.update_one(
-                {"email": buyer_email},
-                {"$inc": {
-                    "impact_stats.co2_saved": co2,
-                    "impact_stats.water_saved": water,
-                    "impact_stats.waste_saved": waste,
-                    "impact_stats.items_purchased": 1
-                }}
-            )
-            
+        users_col.bulk_write(impact_credit_updates(current_user["email"], buyer_email, impact), ordered=False)
+        record_impact_sale(product.get("category"), impact, sold_at)
+        uncache_users(current_user["email"], buyer_email)
+
         return jsonify({"success": True, "message": "Product marked as sold"}), 200
-        
+
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
     except Exception as e:
         app.logger.error(f"Error marking product sold: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/impact/summary", methods=["GET"])
+def get_impact_summary():
+    """Platform-wide impact totals and a time series read from the rollups"""
+    try:
+        params = impact_summary_params(request.args)
+        total_rows = impact_rollups_col.find(params["totals_query"], IMPACT_FIELDS)
+        series_rows = impact_rollups_col.find(params["series_query"], IMPACT_FIELDS).sort("bucket", ASCENDING)
+        return jsonify(summarize_impact(params["granularity"], total_rows, series_rows)), 200
+    except ServiceError as e:
+        return jsonify({"success": False, "error": e.message}), e.status
+    except Exception as e:
+        app.logger.error(f"Error fetching impact summary: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.cli.command("rebuild-impact")
+def rebuild_impact():
+    """Recompute impact rollups from sold products.
+
+    Each bucket is replaced in place by $merge, so readers never see empty
+    totals, and buckets no sold product falls in any more are removed at the
+    end. A sale recorded while the aggregation runs can still be overwritten
+    in its buckets; run the command again to pick it up.
+    """
+    rebuilt_at = datetime.utcnow()
+    units = {"hour": {"$dateTrunc": {"date": "$sold_at", "unit": "hour"}},
+             "day": {"$dateTrunc": {"date": "$sold_at", "unit": "day"}},
+             "total": {"$literal": IMPACT_TOTAL_BUCKET}}
+    for granularity, bucket in units.items():
+        products_col.aggregate([
+            {"$match": {"status": "sold"}},
+            # Listings sold before sold_at was recorded fall back to their last write
+            {"$set": {
+                "sold_at": {"$ifNull": ["$sold_at", "$updated_at", "$created_at"]},
+                "category": {"$toLower": {"$ifNull": ["$category", "other"]}}
+            }},
+            {"$group": {
+                "_id": {"category": "$category", "bucket": bucket},
+                "co2": {"$sum": {"$ifNull": ["$eco_impact.co2", 0]}},
+                "water": {"$sum": {"$ifNull": ["$eco_impact.water", 0]}},
+                "waste": {"$sum": {"$ifNull": ["$eco_impact.waste", 0]}},
+                "items": {"$sum": 1}
+            }},
+            {"$project": {
+                "_id": 0,
+                "granularity": {"$literal": granularity},
+                "category": "$_id.category",
+                "bucket": "$_id.bucket",
+                "co2": 1, "water": 1, "waste": 1, "items": 1,
+                "rebuilt_at": {"$literal": rebuilt_at}
+            }},
+            {"$merge": {
+                "into": impact_rollups_col.name,
+                "on": ["granularity", "category", "bucket"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ])
+    # Left from an earlier rebuild and not produced by this one; buckets created by sales since have no rebuilt_at
+    stale = impact_rollups_col.delete_many({"rebuilt_at": {"$lt": rebuilt_at}})
+    print(f"Rebuilt {impact_rollups_col.count_documents({})} impact rollup buckets, removed {stale.deleted_count}")
+
+@app.route("/api/admin/cache", methods=["GET"])
+@admin_required
+def get_cache_stats(current_user):
+    """Report response and user cache statistics for this worker"""
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "response_cache": response_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "rate_limiter": rate_limiter.stats() if rate_limiter else None,
+        "oidc": oidc_cache.stats(),
+        "live_feed": live_feed.stats(),
+        "similar": similar_items.stats()
+    }), 200
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=PORT, debug=True)
@@ -0,0 +1,333 @@
+import time
+import bisect
+import logging
+import threading
+import contextlib
+import contextvars
+
+from pymongo import monitoring
+
+# Upper bounds (seconds / bytes); +Inf is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Filter fields per command, used to log the shape of slow queries
+_FILTER_KEYS = {
+    "find": "filter", "count": "query", "findAndModify": "query", "distinct": "query",
+    "aggregate": "pipeline", "update": "updates", "delete": "deletes"
+}
+
+_current_request = contextvars.ContextVar("ecowave_request_stats", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            # Per-bucket (non-cumulative) counts, then sum and count
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = _labels(self.labels + ("le",), values + (bound,))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {count}")
+        return lines
+
+
+class RequestStats:
+    """Mongo work attributed to the request currently being served"""
+    __slots__ = ("commands", "mongo_seconds", "queries")
+
+    def __init__(self):
+        self.commands = 0
+        self.mongo_seconds = 0.0
+        self.queries = []
+
+
+def query_shape(value, depth: int = 0):
+    """Replace literal values with '?' so a filter can be logged without its data"""
+    if depth > 6:
+        return "..."
+    if isinstance(value, dict):
+        return {k: query_shape(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(value[0], depth + 1)] if value else []
+    return "?"
+
+
+class Metrics:
+    """In-process request, Mongo and external-call metrics in Prometheus text format.
+
+    Every update is a dict lookup and a few additions under one lock, cheap
+    enough to leave on. Each worker process keeps its own series; the worker
+    pid is exported so scrapes from different gunicorn/uvicorn workers can be
+    told apart.
+    """
+
+    def __init__(self, slow_request_seconds: float = 0, logger: logging.Logger = None, max_slow_queries: int = 20):
+        self.slow_request_seconds = slow_request_seconds
+        self.logger = logger or logging.getLogger("ecowave.metrics")
+        self.max_slow_queries = max_slow_queries
+        self._lock = threading.Lock()
+        self.requests = Counter("ecowave_http_requests_total", "HTTP requests served", ("route", "method", "status"))
+        self.latency = Histogram("ecowave_http_request_duration_seconds", "HTTP request latency", ("route", "method"))
+        self.response_bytes = Histogram("ecowave_http_response_bytes", "HTTP response body size", ("route",), SIZE_BUCKETS)
+        self.mongo = Histogram("ecowave_mongo_command_duration_seconds", "MongoDB command latency", ("command", "collection"))
+        self.mongo_failures = Counter("ecowave_mongo_command_failures_total", "Failed MongoDB commands", ("command", "collection"))
+        self.external = Histogram("ecowave_external_call_duration_seconds", "SMTP and OAuth call latency", ("service", "operation"))
+        self.external_failures = Counter("ecowave_external_call_failures_total", "Failed SMTP and OAuth calls", ("service", "operation"))
+        self.slow_requests = Counter("ecowave_http_slow_requests_total", "Requests slower than the slow-request threshold", ("route",))
+        self.rate_limited = Counter("ecowave_rate_limited_total", "Requests rejected by the rate limiter", ("policy",))
+        self.pool_connections = Gauge("ecowave_mongo_pool_connections", "Pooled MongoDB connections", ("state",))
+        self.pool_checkout_failures = Counter("ecowave_mongo_pool_checkout_failures_total", "Failed connection checkouts", ("reason",))
+
+    # Request lifecycle, called by the Flask hooks / ASGI middleware
+    def start_request(self):
+        return _current_request.set(RequestStats())
+
+    def finish_request(self, token, route: str, method: str, status: int, seconds: float, size: int) -> None:
+        stats = _current_request.get()
+        _current_request.reset(token)
+        with self._lock:
+            self.requests.inc(route, method, f"{status // 100}xx")
+            self.latency.observe(seconds, route, method)
+            self.response_bytes.observe(size, route)
+            slow = self.slow_request_seconds and seconds >= self.slow_request_seconds
+            if slow:
+                self.slow_requests.inc(route)
+        if slow:
+            self.logger.warning(
+                "Slow request %s %s: %.1fms status=%s bytes=%d mongo_commands=%d mongo_ms=%.1f queries=%s",
+                method, route, seconds * 1000, status, size,
+                stats.commands if stats else 0, stats.mongo_seconds * 1000 if stats else 0.0,
+                stats.queries if stats else []
+            )
+
+    def observe_external(self, service: str, operation: str, seconds: float, failed: bool = False) -> None:
+        with self._lock:
+            self.external.observe(seconds, service, operation)
+            if failed:
+                self.external_failures.inc(service, operation)
+
+    @contextlib.contextmanager
+    def external_call(self, service: str, operation: str):
+        """Time an outbound SMTP/OAuth call"""
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.observe_external(service, operation, time.perf_counter() - start, failed)
+
+    def record_rate_limited(self, policy: str) -> None:
+        with self._lock:
+            self.rate_limited.inc(policy)
+
+    def command_listener(self) -> "MongoCommandListener":
+        return MongoCommandListener(self)
+
+    def pool_listener(self) -> "MongoPoolListener":
+        return MongoPoolListener(self)
+
+    def pool_stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": int(self.pool_connections.get("open")),
+                "in_use": int(self.pool_connections.get("in_use")),
+                "checkout_failures": dict((reason, total) for (reason,), total in self.pool_checkout_failures._values.items())
+            }
+
+    def render(self, pid: int) -> str:
+        with self._lock:
+            lines = [
+                "# HELP ecowave_process_info Worker process serving this scrape",
+                "# TYPE ecowave_process_info gauge",
+                f'ecowave_process_info{{pid="{pid}"}} 1'
+            ]
+            for metric in (self.requests, self.latency, self.response_bytes, self.slow_requests, self.rate_limited,
+                           self.pool_connections, self.pool_checkout_failures, self.mongo, self.mongo_failures, self.external, self.external_failures):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feed pymongo command events into Metrics and the current request's stats"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self._pending = {}
+
+    def started(self, event):
+        command_name = event.command_name
+        target = event.command.get(command_name)
+        collection = target if isinstance(target, str) else event.command.get("collection", "")
+        query = None
+        # Only keep the filter when slow requests are being logged
+        if self.metrics.slow_request_seconds and command_name in _FILTER_KEYS:
+            query = event.command.get(_FILTER_KEYS[command_name])
+        self._pending[(event.connection_id, event.request_id)] = (collection, query)
+
+    def _finish(self, event, failed: bool):
+        collection, query = self._pending.pop((event.connection_id, event.request_id), ("", None))
+        seconds = event.duration_micros / 1e6
+        with self.metrics._lock:
+            self.metrics.mongo.observe(seconds, event.command_name, collection)
+            if failed:
+                self.metrics.mongo_failures.inc(event.command_name, collection)
+        stats = _current_request.get()
+        if stats is not None:
+            stats.commands += 1
+            stats.mongo_seconds += seconds
+            if query is not None and len(stats.queries) < self.metrics.max_slow_queries:
+                stats.queries.append({
+                    "command": event.command_name,
+                    "collection": collection,
+                    "shape": query_shape(query),
+                    "ms": round(seconds * 1000, 2)
+                })
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Track open and checked-out pool connections for /readyz and /metrics"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def _inc(self, state: str, amount: int) -> None:
+        with self.metrics._lock:
+            self.metrics.pool_connections.inc(state, amount=amount)
+
+    def connection_created(self, event):
+        self._inc("open", 1)
+
+    def connection_closed(self, event):
+        self._inc("open", -1)
+
+    def connection_checked_out(self, event):
+        self._inc("in_use", 1)
+
+    def connection_checked_in(self, event):
+        self._inc("in_use", -1)
+
+    def connection_check_out_failed(self, event):
+        with self.metrics._lock:
+            self.metrics.pool_checkout_failures.inc(str(event.reason))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request through to the last body byte"""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = self.metrics.start_request()
+        start = time.perf_counter()
+        response = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Starlette records the matched endpoint in the scope during routing
+            route = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            self.metrics.finish_request(token, route, scope["method"], response["status"],
+                                        time.perf_counter() - start, response["bytes"])
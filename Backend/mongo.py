@@ -0,0 +1,121 @@
+import json
+import hashlib
+from datetime import datetime
+
+import certifi
+from pymongo.errors import OperationFailure
+
+from config import (
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, MONGO_MAX_CONNECTING,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS
+)
+from services import COLLECTION_OPTIONS, INDEXES
+
+SCHEMA_COLLECTION = "schema_migrations"
+
+
+def is_local(uri: str) -> bool:
+    return "localhost" in uri or "127.0.0.1" in uri
+
+
+def client_options(uri: str, event_listeners=()) -> dict:
+    """Keyword arguments for MongoClient / AsyncIOMotorClient.
+
+    connect=False defers every socket and monitor thread to the first
+    operation, so a client built at import under gunicorn --preload is first
+    opened in the worker that uses it, never in the master before the fork.
+    """
+    options = {
+        "connect": False,
+        "appname": "ecowave",
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "maxConnecting": MONGO_MAX_CONNECTING,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        # A request waiting this long for a pooled connection fails instead of queueing forever
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": list(event_listeners),
+    }
+    if not is_local(uri):
+        # Remote MongoDB (Atlas) - use SSL
+        options.update(tls=True, tlsAllowInvalidCertificates=False, tlsCAFile=certifi.where())
+    return options
+
+
+def indexes_version() -> str:
+    """Fingerprint of services.INDEXES and COLLECTION_OPTIONS, recorded when the migration has been applied"""
+    schema = [INDEXES, COLLECTION_OPTIONS]
+    return hashlib.sha1(json.dumps(schema, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+def collection_option_result(collection_name: str, option: str, error: OperationFailure = None) -> str:
+    if error is None:
+        return f"{collection_name}.{option}"
+    # Older or restricted servers lack some options; the app checks for them at runtime
+    return f"{collection_name}.{option} (skipped: {error})"
+
+
+def version_update(created: list) -> dict:
+    return {"$set": {"version": indexes_version(), "applied_at": datetime.utcnow(), "indexes": created}}
+
+
+def is_current(applied) -> bool:
+    """Whether the schema_migrations record read by readiness matches services.INDEXES"""
+    return bool(applied) and applied.get("version") == indexes_version()
+
+
+def apply_indexes(db) -> list:
+    """Create every index in services.INDEXES (a no-op for existing ones), apply COLLECTION_OPTIONS and record the version"""
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        for keys, options in indexes:
+            created.append(f"{collection_name}.{db[collection_name].create_index(keys, **options)}")
+    # After the indexes, which create the collections collMod needs
+    for collection_name, options in COLLECTION_OPTIONS.items():
+        for option, value in options.items():
+            try:
+                db.command("collMod", collection_name, **{option: value})
+                created.append(collection_option_result(collection_name, option))
+            except OperationFailure as e:
+                created.append(collection_option_result(collection_name, option, e))
+    db[SCHEMA_COLLECTION].update_one({"_id": "indexes"}, version_update(created), upsert=True)
+    return created
+
+
+def ensure_indexes(db) -> list:
+    """apply_indexes unless the recorded version is already current; returns what was applied"""
+    if is_current(db[SCHEMA_COLLECTION].find_one({"_id": "indexes"}, {"version": 1})):
+        return []
+    return apply_indexes(db)
+
+
+async def ensure_indexes_async(db) -> list:
+    """ensure_indexes over a Motor database"""
+    if is_current(await db[SCHEMA_COLLECTION].find_one({"_id": "indexes"}, {"version": 1})):
+        return []
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        for keys, options in indexes:
+            created.append(f"{collection_name}.{await db[collection_name].create_index(keys, **options)}")
+    for collection_name, options in COLLECTION_OPTIONS.items():
+        for option, value in options.items():
+            try:
+                await db.command("collMod", collection_name, **{option: value})
+                created.append(collection_option_result(collection_name, option))
+            except OperationFailure as e:
+                created.append(collection_option_result(collection_name, option, e))
+    await db[SCHEMA_COLLECTION].update_one({"_id": "indexes"}, version_update(created), upsert=True)
+    return created
+
+
+def pool_status(pool: dict) -> dict:
+    """Add configured capacity and utilization to Metrics.pool_stats()"""
+    return {
+        **pool,
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "utilization": round(pool["in_use"] / MONGO_MAX_POOL_SIZE, 3) if MONGO_MAX_POOL_SIZE else None
+    }
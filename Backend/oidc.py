@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import urllib.request
+
+
+def fetch_json(url: str, timeout: float = 10) -> dict:
+    request = urllib.request.Request(url, headers={"Accept": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+class ProviderMetadataCache:
+    """OIDC discovery document and JWKS, cached in memory and on disk.
+
+    Nothing is fetched at construction. The first use reads the disk copy, so
+    restarted workers log users in without a discovery round trip; only a cold
+    cache with no file fetches inline. Once the entry is older than ttl it is
+    still served while a single background thread refreshes it, and a failed
+    refresh keeps the old entry rather than breaking logins.
+    """
+
+    def __init__(self, discovery_url: str, path: str, ttl: float = 21600, fetch=fetch_json, logger: logging.Logger = None):
+        self.discovery_url = discovery_url
+        self.path = path
+        self.ttl = ttl
+        self.fetch = fetch
+        self.logger = logger or logging.getLogger("ecowave.oidc")
+        self.refreshes = 0
+        self._entry = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self) -> dict:
+        """{"fetched_at", "metadata", "jwks"}, fetching only if there is no copy at all"""
+        entry = self._entry
+        if entry is None:
+            with self._lock:
+                if self._entry is None:
+                    self._entry = self._read_file() or self._fetch()
+                entry = self._entry
+        if time.time() - entry["fetched_at"] >= self.ttl:
+            self.refresh_in_background()
+        return entry
+
+    def refresh(self) -> dict:
+        entry = self._fetch()
+        with self._lock:
+            self._entry = entry
+        return entry
+
+    def refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="oidc-refresh", daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            self.logger.warning(f"OIDC metadata refresh failed, keeping cached copy: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _fetch(self) -> dict:
+        metadata = self.fetch(self.discovery_url)
+        jwks = self.fetch(metadata["jwks_uri"]) if metadata.get("jwks_uri") else None
+        entry = {"fetched_at": time.time(), "metadata": metadata, "jwks": jwks}
+        self.refreshes += 1
+        self._write_file(entry)
+        return entry
+
+    def _read_file(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("discovery_url") != self.discovery_url or "metadata" not in entry:
+            return None
+        return entry
+
+    def _write_file(self, entry: dict) -> None:
+        # Write then rename, so workers sharing the file never read half of it
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({**entry, "discovery_url": self.discovery_url}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not write OIDC metadata cache {self.path}: {e}")
+
+    def apply(self, client) -> None:
+        """Hand the cached metadata to an authlib client so it never fetches discovery itself.
+
+        authlib skips its own discovery request once "_loaded_at" is set, and
+        verifies ID tokens against server_metadata["jwks"]. A client is only
+        updated when the cache has a newer entry, so keys authlib re-fetched
+        after a kid miss are not replaced with the older set on every login.
+        """
+        entry = self.get()
+        if client.server_metadata.get("_loaded_at") == entry["fetched_at"]:
+            return
+        client.server_metadata.update(entry["metadata"])
+        if entry.get("jwks"):
+            client.server_metadata["jwks"] = entry["jwks"]
+        client.server_metadata["_loaded_at"] = entry["fetched_at"]
+
+    def stats(self) -> dict:
+        entry = self._entry
+        return {
+            "loaded": entry is not None,
+            "age_seconds": round(time.time() - entry["fetched_at"], 1) if entry else None,
+            "refreshes": self.refreshes
+        }
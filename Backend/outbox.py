@@ -0,0 +1,430 @@
+import time
+import uuid
+import asyncio
+import smtplib
+import threading
+import contextlib
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Outbox job / inquiry email states
+STATUS_QUEUED = "queued"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+# Saved for the seller's inbox but not emailed: the seller's inquiry mail cap was reached
+STATUS_HELD = "held"
+
+
+def new_job(inquiry_id: str, payload: dict) -> dict:
+    now = datetime.utcnow()
+    return {
+        "job_id": str(uuid.uuid4()),
+        "inquiry_id": inquiry_id,
+        "payload": payload,
+        "status": STATUS_QUEUED,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+    }
+
+
+def claim_args(lock_timeout: float) -> tuple:
+    """(filter, update) that atomically claims the next due job and counts the attempt"""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=lock_timeout)
+    return (
+        {"$or": [
+            {"status": STATUS_QUEUED, "next_attempt_at": {"$lte": now}},
+            # Jobs whose worker died mid-send become claimable again
+            {"status": STATUS_SENDING, "locked_at": {"$lte": stale}}
+        ]},
+        {"$set": {"status": STATUS_SENDING, "locked_at": now}, "$inc": {"attempts": 1}}
+    )
+
+
+def abandoned(job: dict, max_attempts: int) -> bool:
+    """A job claimed more often than allowed was reclaimed after its last attempt never finished"""
+    return job.get("attempts", 0) > max_attempts
+
+
+def failure_update(job: dict, error: Exception, max_attempts: int, backoff_base: float) -> tuple:
+    """Return (status, $set fields) for a failed send: retry with backoff or give up"""
+    attempts = job.get("attempts", 0)
+    if attempts >= max_attempts:
+        return STATUS_FAILED, {"attempts": attempts, "last_error": str(error)}
+    delay = backoff_base * (2 ** (attempts - 1))
+    return STATUS_QUEUED, {
+        "attempts": attempts,
+        "last_error": str(error),
+        "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)
+    }
+
+
+def enqueue_args(job: dict) -> tuple:
+    """(filter, update) that inserts job unless its inquiry already has one; needs upsert=True"""
+    return {"inquiry_id": job["inquiry_id"]}, {"$setOnInsert": job}
+
+
+def success_update(job: dict) -> dict:
+    return {"sent_at": datetime.utcnow()}
+
+
+class SMTPConnection:
+    """A lazily opened, authenticated SMTP session reused across messages.
+
+    observe, if given, is called as observe(operation, seconds, failed) for
+    every connect and send so callers can export SMTP timings.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str, timeout: float = 30, observe=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.observe = observe
+        self.server = None
+
+    @contextlib.contextmanager
+    def _timed(self, operation: str):
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            if self.observe is not None:
+                self.observe(operation, time.perf_counter() - start, failed)
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.starttls()
+        server.login(self.username, self.password)
+        self.server = server
+
+    def _alive(self) -> bool:
+        try:
+            return self.server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def send(self, msg) -> None:
+        if self.server is None or not self._alive():
+            self.close()
+            with self._timed("connect"):
+                self._connect()
+        try:
+            with self._timed("send"):
+                self.server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Drop the broken session so the next message reconnects
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+class EmailOutbox:
+    """Durable email queue stored in Mongo and drained by background threads.
+
+    Jobs are claimed atomically, one at a time, so any number of threads or
+    gunicorn workers can drain the same outbox without two of them sending
+    one job at once. Delivery is at least once: a job left in 'sending' for
+    lock_timeout (its worker died mid-send) is claimed and sent again, and so
+    is one whose result could not be recorded. Every claim counts as an
+    attempt, so a job that keeps killing its worker is given up on after
+    max_attempts like one that keeps failing. An inquiry has at most one job.
+    """
+
+    def __init__(self, outbox_col, inquiries_col, connection_factory, render, logger,
+                 workers: int = 2, max_attempts: int = 5,
+                 backoff_base: float = 30, poll_interval: float = 1.0, lock_timeout: float = 300, idle_timeout: float = 60):
+        self.outbox_col = outbox_col
+        self.inquiries_col = inquiries_col
+        self.connection_factory = connection_factory
+        self.render = render
+        self.logger = logger
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.idle_timeout = idle_timeout
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def enqueue(self, inquiry_id: str, payload: dict) -> dict:
+        """Queue an email for an inquiry, unless it already has one, and make sure workers are running"""
+        job = new_job(inquiry_id, payload)
+        try:
+            self.outbox_col.update_one(*enqueue_args(job), upsert=True)
+        except DuplicateKeyError:
+            pass  # a concurrent enqueue for the same inquiry won
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def start(self) -> None:
+        """Start worker threads once per process (after any gunicorn fork)"""
+        with self._lock:
+            if self._threads or self.workers <= 0:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        self.join()
+
+    def _claim(self):
+        query, update = claim_args(self.lock_timeout)
+        return self.outbox_col.find_one_and_update(
+            query,
+            update,
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _mark(self, job: dict, status: str, **fields) -> None:
+        self.outbox_col.update_one({"_id": job["_id"]}, {"$set": {"status": status, **fields}})
+        self.inquiries_col.update_one({"inquiry_id": job["inquiry_id"]}, {"$set": {"status": status}})
+
+    def _reschedule(self, job: dict, error: Exception) -> None:
+        """Put back a job whose delivery raised; if even that fails, lock_timeout frees it"""
+        # Past max_attempts the next claim finds it abandoned and marks it failed
+        _, fields = failure_update(job, error, self.max_attempts, self.backoff_base)
+        try:
+            self.outbox_col.update_one({"_id": job["_id"]}, {"$set": {"status": STATUS_QUEUED, **fields}})
+        except Exception as e:
+            self.logger.error(f"Email job {job['job_id']} could not be rescheduled: {e}")
+
+    def _run(self) -> None:
+        connection = self.connection_factory()
+        last_sent = time.monotonic()
+        try:
+            while not self._stopping.is_set():
+                # One job per claim, so its lock is taken just before its own send
+                try:
+                    job = self._claim()
+                except Exception as e:
+                    self.logger.error(f"Email outbox claim failed: {e}")
+                    job = None
+                if job is None:
+                    # Keep the SMTP session warm between bursts, but not forever
+                    if time.monotonic() - last_sent > self.idle_timeout:
+                        connection.close()
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                try:
+                    self._deliver(connection, job)
+                except Exception as e:
+                    # Never let one job stop the worker
+                    self.logger.error(f"Email job {job['job_id']} failed unexpectedly, will retry: {e}")
+                    self._reschedule(job, e)
+                last_sent = time.monotonic()
+        finally:
+            connection.close()
+
+    def _deliver(self, connection, job: dict) -> None:
+        if abandoned(job, self.max_attempts):
+            self.logger.error(f"Giving up on email job {job['job_id']}: its last attempt never finished")
+            self._mark(job, STATUS_FAILED, last_error="worker stopped while sending")
+            return
+        try:
+            connection.send(self.render(**job["payload"]))
+        except Exception as e:
+            status, fields = failure_update(job, e, self.max_attempts, self.backoff_base)
+            if status == STATUS_FAILED:
+                self.logger.error(f"Giving up on email job {job['job_id']} after {fields['attempts']} attempts: {e}")
+                self._mark(job, status, **fields)
+            else:
+                self.logger.warning(f"Email job {job['job_id']} failed, will retry: {e}")
+                self.outbox_col.update_one({"_id": job["_id"]}, {"$set": {"status": status, **fields}})
+            return
+        self._mark(job, STATUS_SENT, **success_update(job))
+        self.logger.info(f"Email sent successfully to {job['payload']['seller_email']}")
+
+
+class AsyncSMTPConnection:
+    """aiosmtplib counterpart of SMTPConnection for the ASGI entry point"""
+
+    def __init__(self, host: str, port: int, username: str, password: str, timeout: float = 30, observe=None):
+        import aiosmtplib
+        self.aiosmtplib = aiosmtplib
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.observe = observe
+        self.server = None
+
+    _timed = SMTPConnection._timed
+
+    async def _alive(self) -> bool:
+        try:
+            return (await self.server.noop())[0] == 250
+        except (self.aiosmtplib.SMTPException, OSError):
+            return False
+
+    async def send(self, msg) -> None:
+        if self.server is None or not await self._alive():
+            await self.close()
+            with self._timed("connect"):
+                server = self.aiosmtplib.SMTP(hostname=self.host, port=self.port, timeout=self.timeout, start_tls=True)
+                await server.connect()
+                await server.login(self.username, self.password)
+            self.server = server
+        try:
+            with self._timed("send"):
+                await self.server.send_message(msg)
+        except (self.aiosmtplib.SMTPServerDisconnected, OSError):
+            await self.close()
+            raise
+
+    async def close(self) -> None:
+        if self.server is not None:
+            try:
+                await self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+class AsyncEmailOutbox:
+    """The same Mongo-backed outbox drained by asyncio tasks over Motor.
+
+    Jobs use the same schema and claim protocol as EmailOutbox, so sync and
+    async deployments can share one outbox collection.
+    """
+
+    def __init__(self, outbox_col, inquiries_col, connection_factory, render, logger,
+                 workers: int = 2, max_attempts: int = 5,
+                 backoff_base: float = 30, poll_interval: float = 1.0, lock_timeout: float = 300, idle_timeout: float = 60):
+        self.outbox_col = outbox_col
+        self.inquiries_col = inquiries_col
+        self.connection_factory = connection_factory
+        self.render = render
+        self.logger = logger
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.idle_timeout = idle_timeout
+        self._tasks = []
+        self._wakeup = None
+
+    async def enqueue(self, inquiry_id: str, payload: dict) -> dict:
+        job = new_job(inquiry_id, payload)
+        try:
+            await self.outbox_col.update_one(*enqueue_args(job), upsert=True)
+        except DuplicateKeyError:
+            pass
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def start(self) -> None:
+        """Start worker tasks on the running event loop"""
+        if self._tasks or self.workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._run()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self):
+        query, update = claim_args(self.lock_timeout)
+        return await self.outbox_col.find_one_and_update(
+            query,
+            update,
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _mark(self, job: dict, status: str, **fields) -> None:
+        await self.outbox_col.update_one({"_id": job["_id"]}, {"$set": {"status": status, **fields}})
+        await self.inquiries_col.update_one({"inquiry_id": job["inquiry_id"]}, {"$set": {"status": status}})
+
+    async def _reschedule(self, job: dict, error: Exception) -> None:
+        # Past max_attempts the next claim finds it abandoned and marks it failed
+        _, fields = failure_update(job, error, self.max_attempts, self.backoff_base)
+        try:
+            await self.outbox_col.update_one({"_id": job["_id"]}, {"$set": {"status": STATUS_QUEUED, **fields}})
+        except Exception as e:
+            self.logger.error(f"Email job {job['job_id']} could not be rescheduled: {e}")
+
+    async def _run(self) -> None:
+        connection = self.connection_factory()
+        last_sent = time.monotonic()
+        try:
+            while True:
+                try:
+                    job = await self._claim()
+                except Exception as e:
+                    self.logger.error(f"Email outbox claim failed: {e}")
+                    job = None
+                if job is None:
+                    if time.monotonic() - last_sent > self.idle_timeout:
+                        await connection.close()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                    continue
+                try:
+                    await self._deliver(connection, job)
+                except Exception as e:
+                    self.logger.error(f"Email job {job['job_id']} failed unexpectedly, will retry: {e}")
+                    await self._reschedule(job, e)
+                last_sent = time.monotonic()
+        finally:
+            await connection.close()
+
+    async def _deliver(self, connection, job: dict) -> None:
+        if abandoned(job, self.max_attempts):
+            self.logger.error(f"Giving up on email job {job['job_id']}: its last attempt never finished")
+            await self._mark(job, STATUS_FAILED, last_error="worker stopped while sending")
+            return
+        try:
+            await connection.send(self.render(**job["payload"]))
+        except Exception as e:
+            status, fields = failure_update(job, e, self.max_attempts, self.backoff_base)
+            if status == STATUS_FAILED:
+                self.logger.error(f"Giving up on email job {job['job_id']} after {fields['attempts']} attempts: {e}")
+                await self._mark(job, status, **fields)
+            else:
+                self.logger.warning(f"Email job {job['job_id']} failed, will retry: {e}")
+                await self.outbox_col.update_one({"_id": job["_id"]}, {"$set": {"status": status, **fields}})
+            return
+        await self._mark(job, STATUS_SENT, **success_update(job))
+        self.logger.info(f"Email sent successfully to {job['payload']['seller_email']}")
+
@@ -0,0 +1,165 @@
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Built-in policies as "requests/period:burst"; override with RATE_LIMITS="name=spec,..."
+# Hard limits are keyed on the client address or the signed-in user, never on
+# values from the request body, which anyone can set to someone else's.
+# inquiry_seller is soft: past it inquiries are still saved, but not emailed.
+DEFAULT_POLICIES = {
+    "inquiry_ip": "20/hour:5",
+    "inquiry_user": "10/hour:3",
+    "inquiry_seller": "60/day:10",
+    "product_create_ip": "30/hour:10",
+    "product_create_user": "30/hour:10",
+    "product_write_ip": "120/minute:30",
+    "product_write_user": "60/minute:20",
+    "bulk_import_user": "10/hour:3",
+}
+
+
+class Policy:
+    __slots__ = ("name", "rate", "burst")
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.rate = rate  # tokens refilled per second
+        self.burst = burst  # bucket capacity
+
+    @classmethod
+    def parse(cls, name: str, spec: str) -> "Policy":
+        """Parse 'N/period[:burst]', e.g. '20/hour:5'; burst defaults to N"""
+        limit, _, burst = spec.strip().partition(":")
+        count, _, period = limit.partition("/")
+        if period not in PERIODS:
+            raise ValueError(f"Invalid rate limit period in {name}={spec}")
+        count = float(count)
+        return cls(name, count / PERIODS[period], float(burst) if burst else count)
+
+
+def load_policies(overrides: str = "") -> dict:
+    specs = dict(DEFAULT_POLICIES)
+    for item in (overrides or "").split(","):
+        if item.strip():
+            name, _, spec = item.partition("=")
+            specs[name.strip()] = spec
+    return {name: Policy.parse(name, spec) for name, spec in specs.items()}
+
+
+class LocalRateLimiter:
+    """Per-process token buckets, for a single worker or development"""
+
+    def __init__(self, policies: dict, max_keys: int = 100000):
+        self.policies = policies
+        self.max_keys = max_keys
+        self.allowed = 0
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, policy_name: str, key: str, cost: float = 1) -> tuple:
+        """Take cost tokens from key's bucket; returns (allowed, retry_after_seconds)"""
+        policy = self.policies[policy_name]
+        bucket_key = (policy_name, key)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(bucket_key, (policy.burst, now))
+            tokens = min(policy.burst, tokens + (now - updated) * policy.rate)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+                self.allowed += 1
+            else:
+                retry_after = (cost - tokens) / policy.rate
+                self.limited += 1
+            self._buckets[bucket_key] = (tokens, now)
+            self._buckets.move_to_end(bucket_key)
+            # Forgetting the least recently used bucket only ever refills it
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after == 0.0, retry_after
+
+    def stats(self) -> dict:
+        return {"backend": "local", "allowed": self.allowed, "limited": self.limited, "buckets": len(self._buckets)}
+
+
+# Atomic refill-and-take on a Redis hash; uses the server clock so workers agree
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(retry)
+"""
+
+
+class RedisRateLimiter:
+    """Token buckets shared through Redis so limits hold across gunicorn workers.
+
+    If Redis is unreachable requests are allowed (fail open) and the error is
+    logged, so an outage of the limiter never takes the API down with it.
+    """
+
+    def __init__(self, url: str, policies: dict, prefix: str = "ecowave:ratelimit:", logger: logging.Logger = None):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.policies = policies
+        self.prefix = prefix
+        self.logger = logger or logging.getLogger("ecowave.ratelimit")
+        self.allowed = 0
+        self.limited = 0
+        self._script = self.redis.register_script(_TOKEN_BUCKET_LUA)
+
+    def hit(self, policy_name: str, key: str, cost: float = 1) -> tuple:
+        policy = self.policies[policy_name]
+        try:
+            retry_after = float(self._script(
+                keys=[f"{self.prefix}{policy_name}:{key}"],
+                args=[policy.rate, policy.burst, cost]
+            ))
+        except Exception as e:
+            self.logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+            return True, 0.0
+        if retry_after == 0.0:
+            self.allowed += 1
+            return True, 0.0
+        self.limited += 1
+        return False, retry_after
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "allowed": self.allowed, "limited": self.limited}
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+def client_ip(remote_addr: str, forwarded_for: str = None, trusted_proxies: int = 0) -> str:
+    """Client address, trusting X-Forwarded-For only as far as trusted_proxies hops.
+
+    Each proxy appends the address it received the request from, so with N
+    trusted proxies the client is the Nth entry from the right; anything further
+    left is client-supplied and would let callers pick their own bucket.
+    """
+    if trusted_proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if hops:
+            return hops[-min(trusted_proxies, len(hops))]
+    return remote_addr or "unknown"
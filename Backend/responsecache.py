@@ -0,0 +1,105 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CachedResponse:
+    __slots__ = ("body", "mimetype", "etag", "generation", "expires_at", "variants")
+
+    def __init__(self, body: bytes, mimetype: str, generation: int, expires_at: float):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.generation = generation
+        self.expires_at = expires_at
+        # Compressed copies of body keyed by content encoding
+        self.variants = {}
+
+
+class ResponseCache:
+    """Byte-bounded LRU of serialized responses with generation-based invalidation.
+
+    Writes bump the generation instead of hunting down affected keys; entries
+    from older generations are treated as misses and dropped lazily. The TTL
+    bounds how long another worker's writes can go unseen.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 30):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 4
+        self.ttl = ttl
+        self.generation = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.generation != self.generation or entry.expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body: bytes, mimetype: str, generation: int):
+        """Store a response built while `generation` was current; if a write has
+        happened since, the entry is already stale and will never be served"""
+        entry = CachedResponse(body, mimetype, generation, time.monotonic() + self.ttl)
+        if len(body) > self.max_entry_bytes:
+            return entry
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return entry
+
+    def encoded(self, key, entry: CachedResponse, encoding: str, encode) -> bytes:
+        """Return entry's body in `encoding`, compressing it at most once while cached"""
+        body = entry.variants.get(encoding)
+        if body is not None:
+            return body
+        body = encode(entry.body)
+        with self._lock:
+            # Only keep the copy if the entry is still live, so the byte count stays right
+            if self._entries.get(key) is entry and encoding not in entry.variants:
+                entry.variants[encoding] = body
+                self.size += len(body)
+        return body
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+
+    def _remove(self, key) -> None:
+        entry = self._entries.pop(key)
+        self.size -= len(entry.body) + sum(len(body) for body in entry.variants.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
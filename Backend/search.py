@@ -0,0 +1,79 @@
+import re
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Upper bound on stored terms per product so long descriptions stay cheap to index
+MAX_SEARCH_TERMS = 200
+
+# Shortest partial word that triggers a prefix (typeahead) match
+MIN_PREFIX_LENGTH = 2
+
+
+def tokenize(text: str) -> list:
+    """Lowercase a string and split it into alphanumeric word tokens"""
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def search_terms(title: str, description: str) -> list:
+    """Unique tokens of a listing, title first, used for prefix matching"""
+    seen = dict.fromkeys(tokenize(title) + tokenize(description))
+    return list(seen)[:MAX_SEARCH_TERMS]
+
+
+def build_search_query(search: str) -> dict:
+    """Translate user search text into an index-backed Mongo filter.
+
+    Completed words go through the stemmed $text index. The last word is
+    treated as still being typed and matched as an anchored prefix against
+    search_terms, which the multikey index can answer with a range scan. A
+    lone word may be either, so it matches through $text or as a prefix;
+    both branches are indexed, as $text inside $or requires.
+    """
+    tokens = tokenize(search)
+    if not tokens:
+        return {}
+
+    *complete, partial = tokens
+    if not complete and len(partial) >= MIN_PREFIX_LENGTH:
+        return {"$or": [
+            {"$text": {"$search": partial}},
+            {"search_terms": {"$regex": "^" + re.escape(partial)}}
+        ]}
+    query = {}
+    if len(partial) >= MIN_PREFIX_LENGTH:
+        query["search_terms"] = {"$regex": "^" + re.escape(partial)}
+    else:
+        complete.append(partial)
+    if complete:
+        query["$text"] = {"$search": " ".join(complete)}
+    return query
+
+
+def has_text_search(query: dict) -> bool:
+    """Whether a build_search_query filter scores matches, so it can sort by relevance"""
+    return "$text" in query or any("$text" in clause for clause in query.get("$or", ()))
+
+
+def regex_search_query(search: str) -> dict:
+    """The previous unindexed substring scan, kept for benchmarking"""
+    pattern = re.escape(search)
+    return {"$or": [
+        {"title": {"$regex": pattern, "$options": "i"}},
+        {"description": {"$regex": pattern, "$options": "i"}}
+    ]}
+
+
+def build_terms_query(search: str) -> dict:
+    """search_terms-only variant of build_search_query for contexts where $text
+    is not allowed, such as the query of a $geoNear stage. Words match exactly
+    (no stemming) and the last word still matches as a prefix."""
+    tokens = tokenize(search)
+    if not tokens:
+        return {}
+    *complete, partial = tokens
+    clauses = [{"search_terms": token} for token in complete]
+    if len(partial) >= MIN_PREFIX_LENGTH:
+        clauses.append({"search_terms": {"$regex": "^" + re.escape(partial)}})
+    else:
+        clauses.append({"search_terms": partial})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
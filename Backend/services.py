@@ -0,0 +1,1130 @@
+"""Request-independent marketplace logic shared by the Flask (main.py) and
+ASGI (asgi.py) entry points.
+
+Nothing here touches the network: functions build Mongo filters, updates and
+documents, validate input and shape results, and each entry point runs the
+I/O with its own driver (pymongo or Motor).
+"""
+import io
+import csv
+import json
+import uuid
+import base64
+import hashlib
+import calendar
+from datetime import datetime, date, timedelta
+from email.utils import formatdate
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+try:
+    import orjson
+except ImportError:  # optional fast path; the stdlib encoder is the fallback
+    orjson = None
+import jwt
+from pymongo import ASCENDING, DESCENDING, TEXT, GEOSPHERE, UpdateOne
+
+from config import (
+    JWT_SECRET, JWT_EXP_SECONDS, PRODUCTS_PAGE_SIZE, PRODUCTS_MAX_PAGE_SIZE,
+    IMAGE_URL_PREFIX, SMTP_EMAIL, JSON_SERIALIZER,
+    GAZETTEER_PATH, GEO_JITTER_METERS, NEAR_DEFAULT_RADIUS_KM, NEAR_MAX_RADIUS_KM,
+    SIMILAR_DEFAULT_LIMIT, SIMILAR_MAX_LIMIT, INQUIRY_DEDUP_WINDOW_SECONDS, INQUIRY_RETENTION_DAYS
+)
+from search import build_search_query, build_terms_query, has_text_search, search_terms
+from geo import get_gazetteer, point, jitter
+from outbox import STATUS_QUEUED, STATUS_SENT, STATUS_FAILED, STATUS_HELD
+
+
+class ServiceError(Exception):
+    """A client-facing failure that maps to {"success": False, "error": ...}"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# Index definitions, applied once per deploy by `flask create-indexes` (mongo.apply_indexes)
+INDEXES = {
+    "products": [
+        # Point lookups by listing id: product pages, updates and the similar-items $in fetch
+        ([("id", ASCENDING)], {}),
+        # Compound indexes serve keyset pages sorted by (created_at, id), with or without a category filter
+        ([("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        ([("category", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        # Stemmed full-text search over listings, titles weighted above descriptions
+        ([("title", TEXT), ("description", TEXT)], {"weights": {"title": 10, "description": 1}, "name": "product_text"}),
+        ([("search_terms", ASCENDING), ("created_at", DESCENDING)], {}),
+        # "near" listing queries ($geoNear) with an optional category filter
+        ([("location", GEOSPHERE), ("category", ASCENDING)], {}),
+        # Live feed polling fallback reads changes in (updated_at, id) order
+        ([("updated_at", ASCENDING), ("id", ASCENDING)], {}),
+        # Seller dashboard pages: one seller's listings newest first, all of them or one status
+        ([("seller_email", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+        ([("seller_email", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], {}),
+    ],
+    "inquiries": [
+        ([("created_at", ASCENDING)], {}),
+        # Seller dashboard inquiry counts per seller; the inbox indexes below serve the per-listing counts
+        ([("seller_email", ASCENDING), ("status", ASCENDING)], {}),
+        # Inquiry inbox pages, newest first, for a seller or for one listing
+        ([("seller_email", ASCENDING), ("created_at", DESCENDING), ("inquiry_id", DESCENDING)], {}),
+        ([("product_id", ASCENDING), ("created_at", DESCENDING), ("inquiry_id", DESCENDING)], {}),
+        # Resubmissions of the same inquiry; older rows without a key are not indexed
+        ([("idempotency_key", ASCENDING)], {"unique": True, "partialFilterExpression": {"idempotency_key": {"$type": "string"}}}),
+        # Removes inquiries once expires_at passes
+        ([("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    ],
+    "email_outbox": [
+        ([("status", ASCENDING), ("next_attempt_at", ASCENDING)], {}),
+        # One job per inquiry, so re-enqueueing a resubmitted inquiry is a no-op
+        ([("inquiry_id", ASCENDING)], {"unique": True}),
+    ],
+    "images": [
+        ([("hash", ASCENDING)], {"unique": True}),
+    ],
+    "impact_rollups": [
+        ([("granularity", ASCENDING), ("category", ASCENDING), ("bucket", ASCENDING)], {"unique": True}),
+        ([("granularity", ASCENDING), ("bucket", ASCENDING)], {}),
+    ],
+}
+
+# collMod options applied with the indexes
+COLLECTION_OPTIONS = {
+    # Pre-images give live feed delete events the product id (MongoDB 6.0+)
+    "products": {"changeStreamPreAndPostImages": {"enabled": True}},
+}
+
+
+# JSON encoding matching Flask's default provider, so both modes return identical bodies
+def json_default(o):
+    if isinstance(o, (datetime, date)):
+        return formatdate(calendar.timegm(o.timetuple()), usegmt=True)
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj, default=json_default, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(obj) -> bytes:
+    # Datetimes still go through json_default so dates keep Flask's HTTP-date format;
+    # orjson writes non-ASCII as UTF-8 where the stdlib encoder uses \u escapes
+    return orjson.dumps(obj, default=json_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+if JSON_SERIALIZER == "orjson" and orjson is None:
+    raise RuntimeError("JSON_SERIALIZER=orjson but orjson is not installed")
+dumps_bytes = _orjson_dumps if orjson is not None and JSON_SERIALIZER != "stdlib" else _stdlib_dumps
+
+
+def dumps(obj) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def json_array_parts(body: dict, key: str) -> tuple:
+    """Split the JSON for body with an empty body[key] list into the bytes before
+    and after the list contents, so the items can be streamed in between"""
+    # With sorted keys, '"key":[]' appears exactly once
+    skeleton = dumps_bytes({**body, key: []})
+    marker = dumps_bytes(key) + b":[]"
+    cut = skeleton.index(marker) + len(marker) - 1
+    return skeleton[:cut], skeleton[cut:] + b"\n"
+
+
+def json_array_chunks(body: dict, key: str, items):
+    """Yield the same bytes as jsonify(body with body[key] = items), one item at a
+    time, so items can come straight from a cursor without being listed first"""
+    prefix, suffix = json_array_parts(body, key)
+    yield prefix
+    separator = b""
+    for item in items:
+        yield separator + dumps_bytes(item)
+        separator = b","
+    yield suffix
+
+
+# Impact Metrics Constants
+IMPACT_METRICS = {
+    "electronics": {"co2": 50.0, "water": 100.0, "waste": 1.5},
+    "clothing": {"co2": 15.0, "water": 2000.0, "waste": 0.5},
+    "books": {"co2": 2.0, "water": 20.0, "waste": 0.5},
+    "home": {"co2": 25.0, "water": 50.0, "waste": 10.0},
+    "accessories": {"co2": 5.0, "water": 10.0, "waste": 0.2},
+    "other": {"co2": 10.0, "water": 30.0, "waste": 1.0}
+}
+
+DEFAULT_IMPACT_STATS = {
+    "co2_saved": 0.0,
+    "water_saved": 0.0,
+    "waste_saved": 0.0,
+    "items_recycled": 0,
+    "items_purchased": 0
+}
+
+
+def calculate_impact(category, material=None):
+    """Calculate eco impact based on category and material"""
+    base = IMPACT_METRICS.get(category.lower(), IMPACT_METRICS["other"])
+    return base
+
+
+# Impact rollup buckets; "total" is a single all-time bucket per category
+IMPACT_GRANULARITIES = ("hour", "day", "total")
+IMPACT_TOTAL_BUCKET = datetime(1970, 1, 1)
+IMPACT_FIELDS = {"_id": 0, "category": 1, "bucket": 1, "co2": 1, "water": 1, "waste": 1, "items": 1}
+
+
+def impact_bucket(granularity: str, when: datetime) -> datetime:
+    """Truncate a timestamp to the start of its rollup bucket"""
+    if granularity == "hour":
+        return when.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return when.replace(hour=0, minute=0, second=0, microsecond=0)
+    return IMPACT_TOTAL_BUCKET
+
+
+def impact_rollup_updates(category: str, impact: dict, sold_at: datetime) -> list:
+    """Bulk-write operations adding one sale to every rollup bucket it falls in"""
+    category = (category or "other").lower()
+    increments = {
+        "co2": impact.get("co2", 0),
+        "water": impact.get("water", 0),
+        "waste": impact.get("waste", 0),
+        "items": 1
+    }
+    return [
+        UpdateOne(
+            {"granularity": granularity, "category": category, "bucket": impact_bucket(granularity, sold_at)},
+            {"$inc": increments},
+            upsert=True
+        )
+        for granularity in IMPACT_GRANULARITIES
+    ]
+
+
+def impact_credit_updates(seller_email: str, buyer_email: str, impact: dict) -> list:
+    """Bulk-write operations crediting a sale to the seller and, if known, the buyer"""
+    co2 = impact.get("co2", 0)
+    water = impact.get("water", 0)
+    waste = impact.get("waste", 0)
+    credits = [UpdateOne(
+        {"email": seller_email},
+        {"$inc": {
+            "impact_stats.co2_saved": co2,
+            "impact_stats.water_saved": water,
+            "impact_stats.waste_saved": waste,
+            "impact_stats.items_recycled": 1
+        }}
+    )]
+    if buyer_email:
+        credits.append(UpdateOne(
+            {"email": buyer_email},
+            {"$inc": {
+                "impact_stats.co2_saved": co2,
+                "impact_stats.water_saved": water,
+                "impact_stats.waste_saved": waste,
+                "impact_stats.items_purchased": 1
+            }}
+        ))
+    return credits
+
+
+def impact_summary_params(args) -> dict:
+    """Validate /api/impact/summary arguments into rollup filters"""
+    granularity = args.get("granularity", "day")
+    if granularity not in ("hour", "day"):
+        raise ServiceError("granularity must be 'hour' or 'day'")
+    try:
+        end = datetime.fromisoformat(args["to"]) if args.get("to") else datetime.utcnow()
+        start = datetime.fromisoformat(args["from"]) if args.get("from") else end - timedelta(days=30)
+    except ValueError as e:
+        raise ServiceError(f"Invalid date: {e}")
+
+    category_filter = {}
+    category = args.get("category")
+    if category and category != "all":
+        category_filter["category"] = category.lower()
+    return {
+        "granularity": granularity,
+        "totals_query": {"granularity": "total", **category_filter},
+        "series_query": {
+            "granularity": granularity,
+            "bucket": {"$gte": impact_bucket(granularity, start), "$lte": end},
+            **category_filter
+        }
+    }
+
+
+def summarize_impact(granularity: str, total_rows, series_rows) -> dict:
+    """Fold rollup rows into totals, a per-category breakdown and a time series"""
+    totals = {"co2": 0.0, "water": 0.0, "waste": 0.0, "items": 0}
+    by_category = {}
+    for row in total_rows:
+        by_category[row["category"]] = {k: row.get(k, 0) for k in totals}
+        for k in totals:
+            totals[k] += row.get(k, 0)
+
+    # Categories are summed per bucket so the series has one point per period
+    series = {}
+    for row in series_rows:
+        point = series.setdefault(row["bucket"], {"bucket": row["bucket"].isoformat(), "co2": 0.0, "water": 0.0, "waste": 0.0, "items": 0})
+        for k in totals:
+            point[k] += row.get(k, 0)
+
+    return {
+        "success": True,
+        "totals": totals,
+        "by_category": by_category,
+        "granularity": granularity,
+        "series": list(series.values())
+    }
+
+
+# Pagination helpers
+PRODUCT_FIELDS = {
+    "id", "title", "description", "price", "badge", "image", "category", "material",
+    "eco_impact", "seller_id", "seller_email", "seller_location", "seller_phone",
+    "created_at", "updated_at", "status", "buyer_email", "sold_at", "image_hash", "thumbnail", "location"
+}
+
+# Internal fields that are never returned to clients
+PRODUCT_PROJECTION = {"_id": 0, "search_terms": 0}
+
+PRODUCT_SORT = [("created_at", DESCENDING), ("id", DESCENDING)]
+RELEVANCE_SORT = [("score", {"$meta": "textScore"}), ("created_at", DESCENDING)]
+
+
+def encode_cursor(product: dict, id_field: str = "id") -> str:
+    """Encode the sort key of the last product (or inquiry) on a page as an opaque cursor"""
+    payload = json.dumps({"t": product["created_at"].isoformat(), "id": product[id_field]})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, id_field: str = "id") -> dict:
+    """Turn an opaque cursor back into a query matching everything after it"""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    created_at = datetime.fromisoformat(payload["t"])
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, id_field: {"$lt": payload["id"]}}
+    ]}
+
+
+def encode_geo_cursor(product: dict) -> str:
+    """Cursor for "near" pages, keyed on distance from the search point"""
+    payload = json.dumps({"d": product["distance"], "id": product["id"]})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_geo_cursor(cursor: str) -> tuple:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    distance = float(payload["d"])
+    return distance, {"$or": [
+        {"distance": {"$gt": distance}},
+        {"distance": distance, "id": {"$gt": payload["id"]}}
+    ]}
+
+
+def geocode(location: str, seed: str):
+    """GeoJSON point for a free-text seller location via the offline gazetteer, or None"""
+    found = get_gazetteer(GAZETTEER_PATH).lookup(location) if location else None
+    if found is None:
+        return None
+    return point(*jitter(found[0], found[1], seed, GEO_JITTER_METERS))
+
+
+def parse_radius_km(value) -> float:
+    if value is None:
+        return NEAR_DEFAULT_RADIUS_KM
+    radius = float(value)
+    if radius <= 0:
+        raise ValueError("radius_km must be positive")
+    return min(radius, NEAR_MAX_RADIUS_KM)
+
+
+def near_list_params(args, query: dict, projection: dict, limit: int) -> dict:
+    """Build a $geoNear pipeline returning listings nearest to args["near"] first"""
+    center = get_gazetteer(GAZETTEER_PATH).lookup(args.get("near"))
+    if center is None:
+        raise ServiceError(f"Unknown location: {args.get('near')}")
+    geo_near = {
+        "near": point(*center),
+        "distanceField": "distance",
+        "maxDistance": parse_radius_km(args.get("radius_km")) * 1000,
+        "spherical": True,
+        "key": "location",
+        "query": query
+    }
+    pipeline = [{"$geoNear": geo_near}]
+    cursor = args.get("cursor")
+    if cursor:
+        distance, after = decode_geo_cursor(cursor)
+        # Let the index skip everything closer than the last page, then drop ties already seen
+        geo_near["minDistance"] = max(distance - 1, 0)
+        pipeline.append({"$match": after})
+    if any(value == 1 for value in projection.values()):
+        projection = {**projection, "distance": 1}
+    pipeline += [{"$limit": limit + 1}, {"$project": projection}]
+    return {"pipeline": pipeline, "limit": limit + 1, "page_size": limit, "paginated": True, "near": True}
+
+
+def parse_page_size(value) -> int:
+    """Clamp the requested page size to [1, PRODUCTS_MAX_PAGE_SIZE]"""
+    if value is None:
+        return PRODUCTS_PAGE_SIZE
+    return max(1, min(int(value), PRODUCTS_MAX_PAGE_SIZE))
+
+
+def parse_fields(value) -> dict:
+    """Build a Mongo projection from a comma-separated fields= argument"""
+    if not value:
+        return dict(PRODUCT_PROJECTION)
+    projection = {"_id": 0}
+    fields = {f.strip() for f in value.split(",") if f.strip()}
+    unknown = fields - PRODUCT_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    # The sort key is always returned so the next cursor can be built
+    for field in fields | {"id", "created_at"}:
+        projection[field] = 1
+    return projection
+
+
+def product_list_params(args) -> dict:
+    """Turn GET /api/products arguments into find() arguments.
+
+    The returned limit is one more than the page size for cursor pages, so
+    finish_product_page can tell whether another page exists.
+    """
+    query = {}
+
+    # Filter by Category
+    category = args.get("category")
+    if category and category != "all":
+        query["category"] = category
+
+    # Filter by Search Text ($text cannot run inside $geoNear, so near queries match terms only)
+    search = args.get("search")
+    if search:
+        query.update(build_terms_query(search) if args.get("near") else build_search_query(search))
+
+    try:
+        limit = parse_page_size(args.get("limit"))
+        projection = parse_fields(args.get("fields"))
+        if args.get("near"):
+            return near_list_params(args, query, projection, limit)
+        cursor = args.get("cursor")
+        if args.get("sort") == "relevance" and has_text_search(query):
+            # Relevance order has no stable cursor, so only the best page is returned
+            return {
+                "filter": query,
+                "projection": {**projection, "score": {"$meta": "textScore"}},
+                "sort": RELEVANCE_SORT,
+                "limit": limit,
+                "page_size": limit,
+                "paginated": False
+            }
+        if cursor:
+            query = {"$and": [query, decode_cursor(cursor)]} if query else decode_cursor(cursor)
+    except (ValueError, KeyError, TypeError) as e:
+        raise ServiceError(f"Invalid pagination parameters: {e}")
+
+    return {
+        "filter": query,
+        "projection": projection,
+        "sort": PRODUCT_SORT,
+        "limit": limit + 1,
+        "page_size": limit,
+        "paginated": True
+    }
+
+
+def finish_product_page(products: list, params: dict) -> dict:
+    """Trim the look-ahead row and build the response body for a product page"""
+    next_cursor = None
+    if params["paginated"] and len(products) > params["page_size"]:
+        products = products[:params["page_size"]]
+        next_cursor = (encode_geo_cursor if params.get("near") else encode_cursor)(products[-1])
+    if params.get("near"):
+        for product in products:
+            product["distance_km"] = round(product.pop("distance") / 1000, 2)
+    return {"success": True, "products": products, "next_cursor": next_cursor}
+
+
+# Similar items
+# What the similar-items index reads from a listing
+SIMILAR_SOURCE_PROJECTION = {"_id": 0, "id": 1, "title": 1, "description": 1, "category": 1, "material": 1, "status": 1}
+# Card fields returned for each similar listing
+SIMILAR_PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "price": 1, "badge": 1, "image": 1, "thumbnail": 1,
+    "category": 1, "eco_impact": 1, "seller_location": 1, "status": 1, "created_at": 1
+}
+UNSOLD = {"$ne": "sold"}
+
+
+def similar_limit(args) -> int:
+    try:
+        limit = int(args.get("limit") or SIMILAR_DEFAULT_LIMIT)
+    except ValueError:
+        raise ServiceError("limit must be an integer")
+    return max(1, min(limit, SIMILAR_MAX_LIMIT))
+
+
+def similar_candidates(matches: list) -> dict:
+    """Filter for the unsold listings among index matches; some may have sold since the index saw them"""
+    return {"id": {"$in": [product_id for product_id, _ in matches]}, "status": UNSOLD}
+
+
+def rank_similar(products: list, matches: list, limit: int) -> list:
+    """Put the fetched listings back in similarity order, each with its score"""
+    by_id = {product["id"]: product for product in products}
+    ranked = []
+    for product_id, score in matches:
+        product = by_id.get(product_id)
+        if product is not None:
+            product["similarity"] = round(score, 3)
+            ranked.append(product)
+    return ranked[:limit]
+
+
+def similar_fallback_filter(product: dict) -> dict:
+    """Newest unsold listings in the same category, served until the index has loaded"""
+    query = {"id": {"$ne": product["id"]}, "status": UNSOLD}
+    if product.get("category"):
+        query["category"] = product["category"]
+    return query
+
+
+# Seller dashboard
+DASHBOARD_STATUSES = ("active", "sold")
+INQUIRY_STATUSES = (STATUS_QUEUED, STATUS_SENT, STATUS_FAILED, STATUS_HELD)
+
+# What the dashboard reads from a listing, so full documents (and any legacy data-URL images) are never carried through
+DASHBOARD_PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "price": 1, "badge": 1, "category": 1, "status": 1,
+    "thumbnail": 1, "created_at": 1, "sold_at": 1,
+    "image": {"$cond": [{"$eq": [{"$substrCP": [{"$ifNull": ["$image", ""]}, 0, 5]}, "data:"]}, None, "$image"]},
+    "description": {"$substrCP": [{"$ifNull": ["$description", ""]}, 0, 200]},
+}
+
+
+def seller_dashboard_params(email: str, args) -> dict:
+    """Build the aggregations behind GET /api/sellers/<email>/dashboard.
+
+    "summary" counts all of the seller's listings by status and sums the
+    impact of sold ones in one $facet. "inquiries" counts inquiries by status
+    straight from the inquiries collection, so they still show once the
+    listings are deleted. "listings" is one keyset page (same cursors as GET
+    /api/products), optionally filtered by status; its $match and $sort run
+    first, on the seller indexes, so only the page is read, and each listing
+    gets an inquiry count joined from inquiries.
+    """
+    status = args.get("status", "all")
+    if status != "all" and status not in DASHBOARD_STATUSES:
+        raise ServiceError(f"status must be one of: all, {', '.join(DASHBOARD_STATUSES)}")
+    try:
+        limit = parse_page_size(args.get("limit"))
+        page_filter = {"seller_email": email}
+        if status != "all":
+            page_filter["status"] = status
+        if args.get("cursor"):
+            page_filter.update(decode_cursor(args["cursor"]))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ServiceError(f"Invalid pagination parameters: {e}")
+
+    summary = [
+        {"$match": {"seller_email": email}},
+        {"$project": {"_id": 0, "status": 1, "eco_impact": 1}},
+        {"$facet": {
+            "status_counts": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "impact": [
+                {"$match": {"status": "sold"}},
+                {"$group": {
+                    "_id": None,
+                    "co2": {"$sum": "$eco_impact.co2"},
+                    "water": {"$sum": "$eco_impact.water"},
+                    "waste": {"$sum": "$eco_impact.waste"},
+                    "items": {"$sum": 1}
+                }}
+            ]
+        }}
+    ]
+    inquiries = [
+        {"$match": {"seller_email": email}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]
+    listings = [
+        {"$match": page_filter},
+        {"$sort": {"created_at": -1, "id": -1}},
+        {"$limit": limit + 1},
+        {"$project": DASHBOARD_PROJECTION},
+        {"$lookup": {
+            "from": "inquiries",
+            "localField": "id",
+            "foreignField": "product_id",
+            "pipeline": [{"$count": "n"}],
+            "as": "inquiry_count"
+        }},
+        {"$set": {"inquiry_count": {"$ifNull": [{"$first": "$inquiry_count.n"}, 0]}}}
+    ]
+    return {"summary": summary, "inquiries": inquiries, "listings": listings, "page_size": limit}
+
+
+def seller_dashboard(summary_rows: list, inquiry_rows: list, products: list, page_size: int) -> dict:
+    """Fold the three aggregation results into the dashboard response body"""
+    facets = summary_rows[0] if summary_rows else {}
+    counts = {status: 0 for status in DASHBOARD_STATUSES}
+    for row in facets.get("status_counts", []):
+        status = row["_id"] or "active"
+        counts[status] = counts.get(status, 0) + row["count"]
+    counts["total"] = sum(counts.values())
+
+    impact = {"co2": 0.0, "water": 0.0, "waste": 0.0, "items": 0}
+    for row in facets.get("impact", []):
+        impact.update({k: row.get(k, 0) for k in impact})
+
+    inquiries = {status: 0 for status in INQUIRY_STATUSES}
+    for row in inquiry_rows:
+        inquiries[row["_id"]] = inquiries.get(row["_id"], 0) + row["count"]
+    inquiries["total"] = sum(inquiries.values())
+
+    next_cursor = None
+    if len(products) > page_size:
+        products = products[:page_size]
+        next_cursor = encode_cursor(products[-1])
+    return {
+        "success": True,
+        "counts": counts,
+        "impact": impact,
+        "inquiries": inquiries,
+        "products": products,
+        "next_cursor": next_cursor
+    }
+
+
+# Product documents
+PRODUCT_REQUIRED_FIELDS = ["title", "description", "price", "badge", "image"]
+
+# Fields a PUT may change
+UPDATABLE_PRODUCT_FIELDS = (
+    "title", "description", "price", "badge", "category",
+    "seller_email", "seller_location", "seller_phone"
+)
+
+
+def require_fields(data, fields) -> None:
+    if not isinstance(data, dict):
+        raise ServiceError("Request body must be a JSON object")
+    for field in fields:
+        if field not in data:
+            raise ServiceError(f"Missing field: {field}")
+
+
+def image_fields(stored: dict) -> dict:
+    """The product fields that reference an ingested image and its thumbnail"""
+    thumbnail = stored["thumbnails"].get("thumb", stored["hash"])
+    return {
+        "image": IMAGE_URL_PREFIX + stored["hash"],
+        "image_hash": stored["hash"],
+        "thumbnail": IMAGE_URL_PREFIX + thumbnail
+    }
+
+
+def new_product(data: dict, stored_image_fields: dict) -> dict:
+    # Generate unique ID
+    product_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    return {
+        "id": product_id,
+        "title": data["title"],
+        "description": data["description"],
+        "price": float(data["price"]),
+        "badge": data["badge"],
+        **stored_image_fields,
+        "category": data.get("category"),
+        "material": data.get("material", ""),
+        "eco_impact": calculate_impact(data.get("category", "other"), data.get("material")),
+        "seller_id": data.get("seller_id", "anonymous"),
+        "seller_email": data.get("seller_email", ""),
+        "seller_location": data.get("seller_location", ""),
+        "location": geocode(data.get("seller_location", ""), product_id),
+        "seller_phone": data.get("seller_phone", ""),
+        "search_terms": search_terms(data["title"], data["description"]),
+        "created_at": now,
+        "updated_at": now,
+        "status": "active"
+    }
+
+
+def public_product(product: dict) -> dict:
+    """Strip internal fields from a product document about to be returned"""
+    product.pop("_id", None)  # Remove MongoDB _id from response
+    product.pop("search_terms", None)
+    return product
+
+
+def product_update(data: dict, stored_image_fields: dict, product_id: str = "") -> dict:
+    """Build the $set for a PUT from the fields actually sent"""
+    if not isinstance(data, dict):
+        raise ServiceError("Request body must be a JSON object")
+    update_data = {field: data[field] for field in UPDATABLE_PRODUCT_FIELDS if field in data}
+    if "price" in update_data:
+        update_data["price"] = float(update_data["price"])
+    if "seller_location" in update_data:
+        update_data["location"] = geocode(update_data["seller_location"], product_id)
+    update_data.update(stored_image_fields)
+    update_data["updated_at"] = datetime.utcnow()
+    return update_data
+
+
+def search_text_missing(update_data: dict) -> bool:
+    """search_terms covers title and description, so a partial edit needs the other half"""
+    sent = [k for k in ("title", "description") if k in update_data]
+    return len(sent) == 1
+
+
+def apply_search_terms(update_data: dict, current: dict = None) -> dict:
+    if "title" in update_data or "description" in update_data:
+        text = {**(current or {}), **{k: update_data[k] for k in ("title", "description") if k in update_data}}
+        update_data["search_terms"] = search_terms(text.get("title", ""), text.get("description", ""))
+    return update_data
+
+
+# Mark-sold guard: ownership and the not-yet-sold check are part of the update
+# itself, so of any concurrent requests exactly one can flip the status
+def sold_filter(product_id: str, seller_email: str) -> dict:
+    return {"id": product_id, "seller_email": seller_email, "status": {"$ne": "sold"}}
+
+
+def sold_update(buyer_email: str, sold_at: datetime) -> dict:
+    return {"$set": {"status": "sold", "buyer_email": buyer_email, "sold_at": sold_at, "updated_at": sold_at}}
+
+
+SOLD_PROJECTION = {"_id": 0, "eco_impact": 1, "category": 1}
+SOLD_CHECK_PROJECTION = {"_id": 0, "seller_email": 1, "status": 1}
+
+
+def sold_failure(existing: dict, seller_email: str) -> ServiceError:
+    """Explain why the guarded mark-sold update matched nothing"""
+    if not existing:
+        return ServiceError("Product not found", 404)
+    if existing.get("seller_email") != seller_email:
+        return ServiceError("Unauthorized", 403)
+    return ServiceError("Product already sold", 400)
+
+
+# Bulk import/export
+IMPORT_FORMATS = {"application/x-ndjson": "ndjson", "application/jsonl": "ndjson", "text/csv": "csv"}
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# eco_impact is flattened into impact_* columns for CSV exports
+EXPORT_CSV_FIELDS = [
+    "id", "title", "description", "price", "badge", "category", "material", "image", "thumbnail",
+    "seller_id", "seller_email", "seller_location", "seller_phone", "status", "buyer_email",
+    "created_at", "updated_at", "sold_at", "impact_co2", "impact_water", "impact_waste"
+]
+
+
+def import_format(content_type: str, requested: str = None) -> str:
+    """Pick ndjson or csv from ?format= or the request Content-Type"""
+    if requested:
+        if requested not in EXPORT_FORMATS:
+            raise ServiceError(f"Unsupported format: {requested}")
+        return requested
+    fmt = IMPORT_FORMATS.get((content_type or "").split(";")[0].strip().lower())
+    if fmt is None:
+        raise ServiceError("Body must be application/x-ndjson or text/csv", 415)
+    return fmt
+
+
+class ImportDecoder:
+    """Turn body lines into (row number, dict) pairs as they arrive.
+
+    Lines are fed one at a time so neither entry point has to hold the body in
+    memory. CSV records spanning several lines (quoted newlines) are held back
+    until their quotes balance. A row that cannot be parsed comes back as a
+    ServiceError in place of the dict.
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.row = 0
+        self.header = None
+        self._pending = ""
+
+    def feed(self, line: str) -> list:
+        if self.fmt == "ndjson":
+            return self._ndjson(line)
+        self._pending += line
+        if self._pending.count('"') % 2:
+            return []
+        record, self._pending = self._pending, ""
+        return self._csv(record)
+
+    def close(self) -> list:
+        record, self._pending = self._pending, ""
+        return self._csv(record) if self.fmt == "csv" and record else []
+
+    def _ndjson(self, line: str) -> list:
+        if not line.strip():
+            return []
+        self.row += 1
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            return [(self.row, ServiceError(f"Invalid JSON: {e}"))]
+        if not isinstance(data, dict):
+            return [(self.row, ServiceError("Row must be a JSON object"))]
+        return [(self.row, data)]
+
+    def _csv(self, record: str) -> list:
+        if not record.strip():
+            return []
+        try:
+            values = next(csv.reader([record]))
+        except csv.Error as e:
+            values = e
+        if self.header is None:
+            if isinstance(values, Exception):
+                raise ServiceError(f"Invalid CSV header: {values}")
+            self.header = [name.strip().lstrip("\ufeff") for name in values]
+            return []
+        self.row += 1
+        if isinstance(values, Exception):
+            return [(self.row, ServiceError(f"Invalid CSV: {values}"))]
+        if len(values) > len(self.header):
+            return [(self.row, ServiceError("Row has more columns than the header"))]
+        # Empty cells count as missing, so required-field checks behave as for JSON
+        return [(self.row, {k: v for k, v in zip(self.header, values) if v != ""})]
+
+
+def decode_rows(decoder: ImportDecoder, lines):
+    for line in lines:
+        yield from decoder.feed(line)
+    yield from decoder.close()
+
+
+class ImportBatch:
+    """Collect validated import rows into insert_many chunks and tally the outcome"""
+
+    def __init__(self, chunk_size: int, max_errors: int):
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self._docs = []
+        self._rows = []
+
+    @property
+    def full(self) -> bool:
+        return len(self._docs) >= self.chunk_size
+
+    def add(self, row: int, product: dict) -> None:
+        self._docs.append(product)
+        self._rows.append(row)
+
+    def fail(self, row: int, error: str) -> None:
+        self.failed += 1
+        # Every failure is counted, but only the first max_errors are reported
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "error": error})
+
+    def take(self) -> tuple:
+        docs, rows = self._docs, self._rows
+        self._docs, self._rows = [], []
+        return docs, rows
+
+    def record(self, inserted: int, errors: list = ()) -> None:
+        self.inserted += inserted
+        for error in errors:
+            self.fail(error["row"], error["error"])
+
+    def result(self) -> dict:
+        return {
+            "success": True,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda e: e["row"]),
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+
+def import_product(row: dict, user_email: str, is_admin: bool, stored_image_fields: dict) -> dict:
+    """Validate one import row like create_product and build its document"""
+    require_fields(row, PRODUCT_REQUIRED_FIELDS)
+    # Sellers import their own listings; admins may import on behalf of others
+    if not is_admin or not row.get("seller_email"):
+        row["seller_email"] = user_email
+    try:
+        return new_product(row, stored_image_fields)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise ServiceError(f"Invalid value: {e}")
+
+
+def import_image_fields(image) -> dict:
+    """Image fields for an import row whose image is a plain URL, or None for a
+    data URL that still has to be ingested"""
+    image = str(image)
+    if image.startswith("data:"):
+        return None
+    if image.startswith(("http://", "https://", IMAGE_URL_PREFIX)):
+        return {"image": image, "thumbnail": image}
+    raise ServiceError("Image must be a data URL or an http(s) URL")
+
+
+def bulk_insert_errors(details: dict, rows: list) -> list:
+    """Map BulkWriteError writeErrors back to the import row numbers in the chunk"""
+    return [
+        {"row": rows[error["index"]], "error": error.get("errmsg", "Write failed")}
+        for error in details.get("writeErrors", [])
+    ]
+
+
+def export_filter(args) -> dict:
+    query = {}
+    category = args.get("category")
+    if category and category != "all":
+        query["category"] = category
+    for field in ("seller_email", "status"):
+        if args.get(field):
+            query[field] = args.get(field)
+    return query
+
+
+def export_csv_row(product: dict) -> dict:
+    impact = product.get("eco_impact") or {}
+    row = {field: product.get(field) for field in EXPORT_CSV_FIELDS}
+    for metric in ("co2", "water", "waste"):
+        row[f"impact_{metric}"] = impact.get(metric)
+    for field in ("created_at", "updated_at", "sold_at"):
+        if isinstance(row[field], datetime):
+            row[field] = row[field].isoformat()
+    return row
+
+
+def _csv_line(row) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(row)
+    return buffer.getvalue()
+
+
+def export_header(fmt: str) -> str:
+    return _csv_line(EXPORT_CSV_FIELDS) if fmt == "csv" else ""
+
+
+def export_line(product: dict, fmt: str) -> str:
+    if fmt == "ndjson":
+        return dumps(product) + "\n"
+    row = export_csv_row(product)
+    return _csv_line([row[field] for field in EXPORT_CSV_FIELDS])
+
+
+# Inquiries
+INQUIRY_REQUIRED_FIELDS = ["product_id", "buyer_name", "buyer_email", "buyer_message"]
+
+
+def check_inquiry_product(product: dict) -> None:
+    if not product:
+        raise ServiceError("Product not found", 404)
+    if not product.get("seller_email"):
+        raise ServiceError("Seller contact information not available")
+
+
+def inquiry_key(buyer_email: str, product_id: str, message: str, when: datetime, window_offset: int = 0) -> str:
+    """Idempotency key: hash of buyer, listing, normalized message and dedup window.
+
+    window_offset=-1 gives the key the same inquiry had in the previous window.
+    """
+    window = int(calendar.timegm(when.utctimetuple()) // INQUIRY_DEDUP_WINDOW_SECONDS) + window_offset
+    message = " ".join(str(message).lower().split())
+    parts = [str(buyer_email).strip().lower(), str(product_id), message, str(window)]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+def new_inquiry(data: dict, product: dict, email_configured: bool) -> dict:
+    now = datetime.utcnow()
+    inquiry = {
+        "inquiry_id": str(uuid.uuid4()),
+        "product_id": data["product_id"],
+        "product_title": product["title"],
+        "buyer_name": data["buyer_name"],
+        "buyer_email": data["buyer_email"],
+        "buyer_message": data["buyer_message"],
+        "seller_email": product["seller_email"],
+        "status": STATUS_QUEUED if email_configured else STATUS_FAILED,
+        "created_at": now,
+        "idempotency_key": inquiry_key(data["buyer_email"], data["product_id"], data["buyer_message"], now)
+    }
+    if INQUIRY_RETENTION_DAYS:
+        inquiry["expires_at"] = now + timedelta(days=INQUIRY_RETENTION_DAYS)
+    return inquiry
+
+
+def duplicate_inquiry_filter(inquiry: dict) -> dict:
+    """An earlier copy of inquiry sent within the dedup window.
+
+    The unique key only covers one fixed window, so the previous window's key
+    is checked too, limited to copies newer than the window length.
+    """
+    previous = inquiry_key(inquiry["buyer_email"], inquiry["product_id"], inquiry["buyer_message"], inquiry["created_at"], -1)
+    return {"$or": [
+        {"idempotency_key": inquiry["idempotency_key"]},
+        {"idempotency_key": previous,
+         "created_at": {"$gt": inquiry["created_at"] - timedelta(seconds=INQUIRY_DEDUP_WINDOW_SECONDS)}}
+    ]}
+
+
+# Internal fields that are never returned to clients
+INQUIRY_PROJECTION = {"_id": 0, "idempotency_key": 0}
+INQUIRY_SORT = [("created_at", DESCENDING), ("inquiry_id", DESCENDING)]
+
+
+def public_inquiry(inquiry: dict) -> dict:
+    inquiry.pop("_id", None)  # Remove MongoDB _id from response
+    inquiry.pop("idempotency_key", None)
+    return inquiry
+
+
+def inquiry_list_params(seller_email: str, args) -> dict:
+    """find() arguments for one keyset page of a seller's inquiries, optionally for one listing"""
+    query = {"seller_email": seller_email}
+    if args.get("product_id"):
+        query["product_id"] = args["product_id"]
+    try:
+        limit = parse_page_size(args.get("limit"))
+        if args.get("cursor"):
+            query.update(decode_cursor(args["cursor"], "inquiry_id"))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ServiceError(f"Invalid pagination parameters: {e}")
+    return {"filter": query, "projection": INQUIRY_PROJECTION, "sort": INQUIRY_SORT, "limit": limit + 1, "page_size": limit}
+
+
+def finish_inquiry_page(inquiries: list, params: dict) -> dict:
+    next_cursor = None
+    if len(inquiries) > params["page_size"]:
+        inquiries = inquiries[:params["page_size"]]
+        next_cursor = encode_cursor(inquiries[-1], "inquiry_id")
+    return {"success": True, "inquiries": inquiries, "next_cursor": next_cursor}
+
+
+def inquiry_email_payload(inquiry: dict) -> dict:
+    return {
+        "seller_email": inquiry["seller_email"],
+        "product_title": inquiry["product_title"],
+        "buyer_name": inquiry["buyer_name"],
+        "buyer_email": inquiry["buyer_email"],
+        "buyer_message": inquiry["buyer_message"]
+    }
+
+
+# Email functions
+def build_inquiry_email(seller_email: str, product_title: str, buyer_name: str, buyer_email: str, buyer_message: str) -> MIMEMultipart:
+    """Build the email notifying a seller about a buyer inquiry"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = f"EcoWave: Inquiry about '{product_title}'"
+    msg['From'] = SMTP_EMAIL
+    msg['To'] = seller_email
+
+    # Create email body
+    html = f"""
+    <html>
+      <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
+          <h2 style="color: #10b981;">New Inquiry on EcoWave! 🌊</h2>
+          <p>Someone is interested in your listing: <strong>{product_title}</strong></p>
+
+          <div style="background-color: white; padding: 20px; border-radius: 8px; margin: 20px 0;">
+            <h3 style="margin-top: 0;">Buyer Details:</h3>
+            <p><strong>Name:</strong> {buyer_name}</p>
+            <p><strong>Email:</strong> <a href="mailto:{buyer_email}">{buyer_email}</a></p>
+
+            <h3>Message:</h3>
+            <p style="background-color: #f3f4f6; padding: 15px; border-radius: 4px;">{buyer_message}</p>
+          </div>
+
+          <p>You can reply directly to <a href="mailto:{buyer_email}">{buyer_email}</a> to connect with this buyer.</p>
+
+          <hr style="border: none; border-top: 1px solid #e5e7eb; margin: 30px 0;" />
+          <p style="font-size: 12px; color: #6b7280;">This is an automated message from EcoWave Marketplace.</p>
+        </div>
+      </body>
+    </html>
+    """
+
+    part = MIMEText(html, 'html')
+    msg.attach(part)
+    return msg
+
+
+# Users and tokens
+def bearer_token(auth_header: str):
+    """Extract the token from an Authorization header, or None"""
+    if not auth_header:
+        return None
+    try:
+        return auth_header.split(" ")[1]
+    except IndexError:
+        return None
+
+
+def decode_token(token: str) -> dict:
+    return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+
+
+def create_jwt_for_user(user_doc: dict) -> str:
+    now = datetime.utcnow()
+    payload = {
+        "sub": str(user_doc.get("user_id", user_doc.get("username"))),
+        "email": user_doc.get("email"),
+        "name": user_doc.get("name"),
+        "iat": int(now.timestamp()),
+        "exp": int((now + timedelta(seconds=JWT_EXP_SECONDS)).timestamp()),
+        "provider": user_doc.get("provider", "oauth")
+    }
+    token = jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+    if isinstance(token, bytes):
+        token = token.decode("utf-8")
+    return token
+
+
+def oauth_user_upsert(email: str, name: str = None, provider: str = "google") -> tuple:
+    """The (filter, update) pair that creates or refreshes an OAuth user"""
+    now = datetime.utcnow()
+    update = {
+        "$set": {
+            "username": name,
+            "email": email,
+            "name": name,
+            "provider": provider,
+            "updated_at": now
+        },
+        "$setOnInsert": {
+            "created_at": now,
+            "balance": 100000.0,
+            "portfolio": [],
+            "tradeHistory": []
+        }
+
+    }
+    return {"email": email}, update
+
+
+def public_user(user: dict) -> dict:
+    if user:
+        user["user_id"] = user.get("username")
+        user.pop("_id", None)
+    return user
+
+
+def userinfo_identity(userinfo: dict) -> tuple:
+    """Pick (email, display name) out of an OIDC userinfo/claims dict"""
+    email = userinfo.get("email")
+    name = userinfo.get("name") or userinfo.get("given_name") or (email.split("@")[0] if email else None)
+    return email, name
@@ -0,0 +1,359 @@
+import os
+import json
+import math
+import time
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:  # without numpy the similar endpoint serves same-category listings
+    np = None
+
+from search import tokenize
+
+# Weight of one occurrence of a word per field; category and material are a single
+# tag each, so they are weighted above any one description word
+FIELD_WEIGHTS = (("title", 2.0), ("description", 1.0))
+CATEGORY_WEIGHT = 3.0
+MATERIAL_WEIGHT = 2.0
+
+# Events buffered while a worker is still loading its index; older ones are covered by the catch-up read
+MAX_PENDING_EVENTS = 10000
+
+# Retry a failed load on the next request after this long
+RETRY_SECONDS = 60
+
+
+def features(product: dict) -> dict:
+    """Weighted term counts of a listing: title and description words plus category and material tags"""
+    counts = {}
+    for field, weight in FIELD_WEIGHTS:
+        for token in tokenize(product.get(field)):
+            counts[token] = counts.get(token, 0.0) + weight
+    if product.get("category"):
+        counts["category:" + product["category"]] = CATEGORY_WEIGHT
+    material = (product.get("material") or "").strip().lower()
+    if material:
+        counts["material:" + material] = MATERIAL_WEIGHT
+    return counts
+
+
+def idf(documents: int, df: int) -> float:
+    return math.log((1 + documents) / (1 + df)) + 1
+
+
+def _csr(terms, rows, weights, term_count: int) -> tuple:
+    """Group (term, row, weight) postings by term into indptr/rows/weights arrays"""
+    order = np.argsort(terms, kind="stable")
+    indptr = np.zeros(term_count + 1, np.int64)
+    np.cumsum(np.bincount(terms, minlength=term_count), out=indptr[1:])
+    return indptr, rows[order].astype(np.int32), weights[order].astype(np.float32)
+
+
+class SimilarityIndex:
+    """Unit-length TF-IDF vectors of unsold listings, stored as an inverted index.
+
+    The cosine similarity of two listings is the dot product of their vectors,
+    so scoring the catalogue against one listing only reads the postings of
+    that listing's terms: a gather and a bincount, not a pass over every row.
+    Only the query's max_terms heaviest terms are scored; common words weigh
+    little and have the longest postings, so they cost the most and matter
+    least. Postings of the snapshot are CSR arrays (term -> rows, weights) that
+    workers memory-map and share. Listings added or edited since go to a small
+    private delta, and edits and removals leave a dead row until the next
+    rebuild. Document frequencies are fixed at build time, so a word first
+    seen later is weighted as the rarest word.
+    """
+
+    def __init__(self, terms=(), df=(), documents: int = 0, indptr=None, rows=None, weights=None,
+                 ids=(), built_at: datetime = None):
+        if np is None:
+            raise RuntimeError("numpy is required for the similar-items index")
+        self.terms = list(terms)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.df = list(df)
+        self.documents = documents
+        self.built_at = built_at or datetime.utcnow()
+        self.indptr = indptr if indptr is not None else np.zeros(len(self.terms) + 1, np.int64)
+        self.rows = rows if rows is not None else np.zeros(0, np.int32)
+        self.weights = weights if weights is not None else np.zeros(0, np.float32)
+        self.ids = list(ids)
+        self.base_rows = len(self.ids)
+        self.row_of = {product_id: row for row, product_id in enumerate(self.ids)}
+        self.alive = np.ones(self.base_rows, bool)
+        # term id -> ([rows], [weights]) of listings indexed since the snapshot
+        self.delta = {}
+        self.delta_rows = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, products, built_at: datetime = None) -> "SimilarityIndex":
+        """Index an iterable of listings, e.g. a cursor; built_at defaults to before the first read"""
+        built_at = built_at or datetime.utcnow()
+        ids, docs, df = [], [], {}
+        for product in products:
+            counts = features(product)
+            for token in counts:
+                df[token] = df.get(token, 0) + 1
+            ids.append(product["id"])
+            docs.append(counts)
+        index = cls(list(df), list(df.values()), len(docs), ids=ids, built_at=built_at)
+        terms, rows, weights = [], [], []
+        for row, counts in enumerate(docs):
+            for term, weight in index._vector(counts).items():
+                terms.append(term)
+                rows.append(row)
+                weights.append(weight)
+        index.indptr, index.rows, index.weights = _csr(
+            np.array(terms, np.int64), np.array(rows, np.int64), np.array(weights, np.float32), len(index.terms)
+        )
+        return index
+
+    def _vector(self, counts: dict, register: bool = False) -> dict:
+        """{term id: weight} of a unit-length TF-IDF vector; unknown words are added only if register"""
+        weighted = {token: tf * idf(self.documents, self.df[self.term_ids[token]] if token in self.term_ids else 0)
+                    for token, tf in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weighted.values()))
+        vector = {}
+        for token, weight in weighted.items():
+            term = self.term_ids.get(token)
+            if term is None:
+                if not register:
+                    continue  # no listing has it, so it cannot add to any score
+                term = self.term_ids[token] = len(self.terms)
+                self.terms.append(token)
+                self.df.append(0)
+            vector[term] = weight / norm
+        return vector
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def upsert(self, product: dict) -> None:
+        counts = features(product)
+        with self._lock:
+            vector = self._vector(counts, register=True)
+            old = self.row_of.get(product["id"])
+            if old is not None:
+                self.alive[old] = False
+            row = self.base_rows + self.delta_rows
+            if row == len(self.alive):
+                # Grow into a new array, so a query holding the old one is unaffected
+                alive = np.zeros(max(self.base_rows + 64, 2 * len(self.alive)), bool)
+                alive[:row] = self.alive
+                self.alive = alive
+            self.alive[row] = True
+            for term, weight in vector.items():
+                postings = self.delta.setdefault(term, ([], []))
+                postings[0].append(row)
+                postings[1].append(weight)
+            self.ids.append(product["id"])
+            self.row_of[product["id"]] = row
+            self.delta_rows += 1
+
+    def remove(self, product_id: str) -> None:
+        with self._lock:
+            row = self.row_of.pop(product_id, None)
+            if row is not None:
+                self.alive[row] = False
+
+    def apply(self, product: dict) -> None:
+        """Index a listing in its current state: unsold listings are (re)indexed, sold ones dropped"""
+        if product.get("status") == "sold":
+            self.remove(product["id"])
+        else:
+            self.upsert(product)
+
+    def apply_event(self, event: dict) -> None:
+        """Apply a live feed event ({"type", "product"}); replays are harmless"""
+        if event["type"] in ("sold", "delete"):
+            self.remove(event["product"]["id"])
+        else:
+            self.apply(event["product"])
+
+    def similar(self, product: dict, limit: int, min_score: float = 0.0, max_terms: int = 24) -> list:
+        """[(product id, cosine similarity)] of the closest listings, best first.
+
+        product needs "id" plus the indexed fields and is vectorized from them,
+        so a listing that is not in the index (sold, or created moments ago)
+        works too.
+        """
+        counts = features(product)
+        with self._lock:
+            vector = self._vector(counts)
+            terms = sorted(vector, key=vector.get, reverse=True)[:max_terms]
+            total = self.base_rows + self.delta_rows
+            alive = self.alive[:total].copy()
+            ids = self.ids
+            row = self.row_of.get(product["id"])
+            delta = [(np.array(self.delta[t][0], np.int64), np.array(self.delta[t][1], np.float32) * vector[t])
+                     for t in terms if t in self.delta]
+        base_terms = len(self.indptr) - 1
+        postings = [
+            (self.rows[self.indptr[t]:self.indptr[t + 1]], self.weights[self.indptr[t]:self.indptr[t + 1]] * vector[t])
+            for t in terms if t < base_terms
+        ] + delta
+        if not postings or total == 0:
+            return []
+        scores = np.bincount(
+            np.concatenate([rows for rows, _ in postings]),
+            np.concatenate([weights for _, weights in postings]),
+            minlength=total
+        )
+        scores[~alive] = 0
+        if row is not None:
+            scores[row] = 0
+        k = min(limit, total)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top if scores[i] > 0 and scores[i] >= min_score]
+
+    def save(self, path: str) -> None:
+        """Write the live rows to <path>.<stamp>.{indptr,rows,weights}.npy and metadata to <path>.json.
+
+        The metadata file is replaced last and names its arrays, so a worker
+        loading concurrently sees either the old snapshot or the new one.
+        """
+        with self._lock:
+            total = self.base_rows + self.delta_rows
+            alive = self.alive[:total].copy()
+            ids = [product_id for product_id, live in zip(self.ids, alive) if live]
+            terms, df = list(self.terms), list(self.df)
+            base_terms = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+            parts = [(base_terms, np.asarray(self.rows, np.int64), np.asarray(self.weights, np.float32))]
+            for term, (rows, weights) in self.delta.items():
+                parts.append((np.full(len(rows), term, np.int64), np.array(rows, np.int64), np.array(weights, np.float32)))
+        posting_terms, rows, weights = (np.concatenate(column) for column in zip(*parts))
+        keep = alive[rows]
+        # Renumber the surviving rows 0..n-1
+        new_row = np.cumsum(alive) - 1
+        indptr, rows, weights = _csr(posting_terms[keep], new_row[rows[keep]], weights[keep], len(terms))
+
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        previous = _read_meta(path)
+        snapshot = f"{os.path.basename(path)}.{time.time_ns()}"
+        for name, array in (("indptr", indptr), ("rows", rows), ("weights", weights)):
+            np.save(os.path.join(directory, f"{snapshot}.{name}.npy"), array)
+        meta = {
+            "built_at": self.built_at.isoformat(),
+            "documents": self.documents,
+            "snapshot": snapshot,
+            "ids": ids,
+            "terms": terms,
+            "df": df
+        }
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path + ".json")
+        # Workers still mapping the old arrays keep them until they exit
+        if previous and previous["snapshot"] != snapshot:
+            for name in ("indptr", "rows", "weights"):
+                try:
+                    os.remove(os.path.join(directory, f"{previous['snapshot']}.{name}.npy"))
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, path: str):
+        """The snapshot at path with its arrays memory-mapped read-only, or None if there is no usable one"""
+        meta = _read_meta(path)
+        if not meta:
+            return None
+        prefix = os.path.join(os.path.dirname(path) or ".", meta["snapshot"])
+        try:
+            indptr, rows, weights = (np.load(f"{prefix}.{name}.npy", mmap_mode="r") for name in ("indptr", "rows", "weights"))
+        except (OSError, ValueError):
+            return None
+        if len(indptr) != len(meta["terms"]) + 1 or len(rows) != len(weights) or indptr[-1] != len(rows):
+            return None
+        return cls(meta["terms"], meta["df"], meta["documents"], indptr, rows, weights, meta["ids"],
+                   datetime.fromisoformat(meta["built_at"]))
+
+    def stats(self) -> dict:
+        total = self.base_rows + self.delta_rows
+        return {
+            "listings": len(self.row_of),
+            "terms": len(self.terms),
+            "postings": len(self.rows),
+            "delta_rows": self.delta_rows,
+            "dead_rows": total - len(self.row_of),
+            "mapped": isinstance(self.rows, np.memmap),
+            "built_at": self.built_at.isoformat()
+        }
+
+
+def _read_meta(path: str):
+    try:
+        with open(path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if "snapshot" in meta and "ids" in meta else None
+
+
+class SimilarItems:
+    """A worker's SimilarityIndex: loaded once in the background, then kept current.
+
+    Register on_event as a live feed listener before loading starts. Events
+    that arrive while the index loads are held and applied after the
+    caller's catch-up read of listings changed since the snapshot was built.
+    Until then index is None and callers fall back to something cheaper.
+    """
+
+    def __init__(self, logger: logging.Logger = None):
+        self.logger = logger or logging.getLogger("ecowave.similar")
+        self.index = None
+        self.state = "idle" if np is not None else "unavailable"
+        self.failed_at = None
+        self._pending = deque(maxlen=MAX_PENDING_EVENTS)
+        self._lock = threading.Lock()
+
+    def begin(self) -> bool:
+        """True exactly once per load attempt; the caller then loads and calls install() or fail()"""
+        with self._lock:
+            retry = self.state == "failed" and time.monotonic() - self.failed_at >= RETRY_SECONDS
+            if self.state != "idle" and not retry:
+                return False
+            self.state = "loading"
+            return True
+
+    def on_event(self, event: dict) -> None:
+        try:
+            with self._lock:
+                if self.index is None:
+                    if self.state == "loading":
+                        self._pending.append(event)
+                    return
+                index = self.index
+            index.apply_event(event)
+        except Exception as e:
+            # Never let a bad event stop the feed thread; the next rebuild corrects the index
+            self.logger.warning(f"Similar-items index could not apply {event.get('type')} event: {e}")
+
+    def install(self, index: SimilarityIndex, changed=()) -> None:
+        """Bring a loaded index up to date with listings changed since it was built and start serving it"""
+        with self._lock:
+            for product in changed:
+                index.apply(product)
+            while self._pending:
+                index.apply_event(self._pending.popleft())
+            self.index = index
+            self.state = "ready"
+        self.logger.info(f"Similar-items index ready with {len(index)} listings")
+
+    def fail(self, error: Exception) -> None:
+        with self._lock:
+            self.state = "failed"
+            self.failed_at = time.monotonic()
+            self._pending.clear()
+        self.logger.error(f"Similar-items index failed to load: {error}")
+
+    def stats(self) -> dict:
+        index = self.index
+        return {"state": self.state, **(index.stats() if index is not None else {})}
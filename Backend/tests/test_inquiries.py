@@ -0,0 +1,163 @@
+"""Inquiry dedup: the sliding window across a key bucket boundary, and the unique-key race in POST /api/inquiries"""
+import calendar
+from datetime import datetime, timedelta
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+pytest.importorskip("flask")
+
+import main  # noqa: E402
+from config import INQUIRY_DEDUP_WINDOW_SECONDS as WINDOW  # noqa: E402
+from outbox import STATUS_QUEUED  # noqa: E402
+from services import INDEXES, duplicate_inquiry_filter, inquiry_key, new_inquiry  # noqa: E402
+
+PRODUCT = {"id": "p-1", "title": "Bamboo desk lamp", "seller_email": "seller@example.com"}
+DATA = {"product_id": "p-1", "buyer_name": "Sam", "buyer_email": "sam@example.com", "buyer_message": "Is this still available?"}
+
+
+def boundary() -> datetime:
+    """The start of the next dedup window"""
+    now = calendar.timegm(datetime.utcnow().utctimetuple())
+    return datetime.utcfromtimestamp((now // WINDOW + 1) * WINDOW)
+
+
+def sent_at(when: datetime, **fields) -> dict:
+    """An inquiry as it would have been saved at when"""
+    inquiry = {**new_inquiry({**DATA, **fields}, PRODUCT, email_configured=False), "created_at": when}
+    inquiry["idempotency_key"] = inquiry_key(inquiry["buyer_email"], inquiry["product_id"], inquiry["buyer_message"], when)
+    return inquiry
+
+
+@pytest.fixture
+def inquiries():
+    collection = mongomock.MongoClient().ecowave.inquiries
+    for keys, options in INDEXES["inquiries"]:
+        collection.create_index(keys, **options)
+    return collection
+
+
+def test_key_ignores_case_and_spacing_within_a_window():
+    start = boundary()
+    key = inquiry_key("Sam@Example.com ", "p-1", "Is this  still\navailable?", start)
+    assert key == inquiry_key("sam@example.com", "p-1", "is this still available?", start + timedelta(seconds=WINDOW - 1))
+    assert key != inquiry_key("sam@example.com", "p-1", "is this still available?", start + timedelta(seconds=WINDOW))
+    assert key == inquiry_key("sam@example.com", "p-1", "is this still available?", start + timedelta(seconds=WINDOW), -1)
+
+
+def test_resubmission_just_after_a_boundary_is_a_duplicate(inquiries):
+    start = boundary()
+    inquiries.insert_one(sent_at(start - timedelta(minutes=1)))
+    resubmitted = sent_at(start + timedelta(minutes=1))
+    # Different fixed-window keys, so only the previous-window check catches it
+    assert resubmitted["idempotency_key"] != inquiries.find_one()["idempotency_key"]
+    assert inquiries.find_one(duplicate_inquiry_filter(resubmitted)) is not None
+
+
+def test_copy_older_than_the_window_is_not_a_duplicate(inquiries):
+    start = boundary()
+    # Same previous-window key, but sent more than a window length before the resubmission
+    inquiries.insert_one(sent_at(start - timedelta(seconds=WINDOW) + timedelta(minutes=1)))
+    assert inquiries.find_one(duplicate_inquiry_filter(sent_at(start + timedelta(minutes=2)))) is None
+    assert inquiries.find_one(duplicate_inquiry_filter(sent_at(start - timedelta(minutes=1)))) is not None
+
+
+def test_different_message_is_not_a_duplicate(inquiries):
+    start = boundary()
+    inquiries.insert_one(sent_at(start - timedelta(minutes=1)))
+    assert inquiries.find_one(duplicate_inquiry_filter(sent_at(start + timedelta(minutes=1), buyer_message="Still for sale?"))) is None
+
+
+def test_unique_key_rejects_a_second_copy(inquiries):
+    inquiry = sent_at(datetime.utcnow())
+    inquiries.insert_one(dict(inquiry))
+    with pytest.raises(main.DuplicateKeyError):
+        inquiries.insert_one({**inquiry, "inquiry_id": "other"})
+
+
+class RacingInquiries:
+    """A collection where another request saves the same inquiry between the dedup lookup and the insert"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.raced = False
+
+    def find_one(self, filter, *args, **kwargs):
+        if "$or" in filter and not self.raced:
+            self.raced = True
+            copy = sent_at(datetime.utcnow())
+            self.collection.insert_one({**copy, "inquiry_id": "concurrent"})
+            return None
+        return self.collection.find_one(filter, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+@pytest.fixture
+def client(inquiries, monkeypatch):
+    products = mongomock.MongoClient().ecowave.products
+    products.insert_one(dict(PRODUCT))
+    monkeypatch.setattr(main, "products_col", products)
+    monkeypatch.setattr(main, "inquiries_col", inquiries)
+    monkeypatch.setattr(main, "rate_limiter", None)
+    monkeypatch.setattr(main, "SMTP_PASSWORD", None)
+    # Outbox workers would poll the configured Mongo, not these collections
+    monkeypatch.setattr(main.email_outbox, "workers", 0)
+    return main.app.test_client()
+
+
+def test_resubmitted_inquiry_returns_the_saved_one(client, inquiries):
+    first = client.post("/api/inquiries", json=DATA)
+    assert first.status_code == 202
+    again = client.post("/api/inquiries", json={**DATA, "buyer_message": "is this still AVAILABLE?"})
+    assert again.status_code == 200
+    assert again.json["duplicate"]
+    assert again.json["inquiry"]["inquiry_id"] == first.json["inquiry"]["inquiry_id"]
+    assert "idempotency_key" not in again.json["inquiry"]
+    assert inquiries.count_documents({}) == 1
+
+
+def test_concurrent_copy_that_wins_the_unique_key_is_returned(client, inquiries, monkeypatch):
+    racing = RacingInquiries(inquiries)
+    monkeypatch.setattr(main, "inquiries_col", racing)
+    response = client.post("/api/inquiries", json=DATA)
+    assert racing.raced
+    assert response.status_code == 200
+    assert response.json["duplicate"]
+    assert not response.json["email_queued"]
+    assert response.json["inquiry"]["inquiry_id"] == "concurrent"
+    assert inquiries.count_documents({}) == 1
+
+
+class FailingOutbox:
+    """An outbox collection whose first job write raises"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.failures = 1
+
+    def update_one(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("connection reset")
+        return self.collection.update_one(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_retry_queues_the_email_a_failed_request_left_out(client, inquiries, monkeypatch):
+    outbox = mongomock.MongoClient().ecowave.email_outbox
+    outbox.create_index("inquiry_id", unique=True)
+    monkeypatch.setattr(main, "SMTP_EMAIL", "outbox@example.com")
+    monkeypatch.setattr(main, "SMTP_PASSWORD", "secret")
+    monkeypatch.setattr(main.email_outbox, "outbox_col", FailingOutbox(outbox))
+    assert client.post("/api/inquiries", json=DATA).status_code == 500
+    assert inquiries.find_one()["status"] == STATUS_QUEUED
+    assert outbox.count_documents({}) == 0
+    # The client's retry is a duplicate, but the inquiry's email is queued now
+    for _ in range(2):
+        again = client.post("/api/inquiries", json=DATA)
+        assert again.status_code == 200 and again.json["duplicate"]
+    assert outbox.count_documents({"inquiry_id": inquiries.find_one()["inquiry_id"]}) == 1
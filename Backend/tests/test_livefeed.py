@@ -0,0 +1,72 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from livefeed import FeedHub, LiveFeed, PollWindow
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def product(product_id: str, seconds: float) -> dict:
+    stamp = START + timedelta(seconds=seconds)
+    return {"id": product_id, "updated_at": stamp, "created_at": stamp, "category": "home"}
+
+
+def test_pass_starts_overlap_before_the_newest_change():
+    window = PollWindow(30, start=START)
+    assert window.start() == (START - timedelta(seconds=30), "")
+    window.fresh([product("a", 100)])
+    assert window.start() == (START + timedelta(seconds=70), "")
+
+
+def test_late_commit_with_an_earlier_stamp_is_published():
+    window = PollWindow(30, start=START)
+    assert window.fresh([product("b", 10)]) == [product("b", 10)]
+    window.end_pass()
+    # "a" was stamped before "b" but only became visible on the next pass
+    assert [p["id"] for p in window.fresh([product("a", 5), product("b", 10)])] == ["a"]
+
+
+def test_each_change_is_published_once_and_edits_again():
+    window = PollWindow(30, start=START)
+    window.fresh([product("a", 1)])
+    window.end_pass()
+    assert window.fresh([product("a", 1)]) == []
+    assert window.fresh([product("a", 2)]) == [product("a", 2)]
+
+
+def test_changes_before_the_start_are_not_published():
+    window = PollWindow(30, start=START)
+    assert window.fresh([product("old", -5), product("new", 1)]) == [product("new", 1)]
+
+
+def test_seen_pairs_are_pruned_outside_the_window():
+    window = PollWindow(30, start=START)
+    window.fresh([product("a", 1), product("b", 100)])
+    window.end_pass()
+    assert set(window.seen) == {("b", START + timedelta(seconds=100))}
+
+
+def test_polling_feed_publishes_a_late_commit():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().ecowave.products
+    hub = FeedHub()
+    published = []
+    hub.add_listener(published.append)
+    feed = LiveFeed(collection, hub, mode="polling", poll_interval=0.02, poll_overlap=30)
+    now = datetime.utcnow()
+    collection.insert_one({"id": "b", "updated_at": now + timedelta(seconds=2), "created_at": now, "category": "home"})
+    feed.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not published and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Stamped before "b", committed after it was read
+        collection.insert_one({"id": "a", "updated_at": now + timedelta(seconds=1), "created_at": now, "category": "home"})
+        while len(published) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+    finally:
+        feed.stop()
+    assert [event["product"]["id"] for event in published] == ["b", "a"]
@@ -0,0 +1,122 @@
+"""POST /api/products/<id>/sold against mongomock collections"""
+import threading
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+pytest.importorskip("flask")
+
+import main  # noqa: E402
+from services import create_jwt_for_user  # noqa: E402
+
+SELLER = {"user_id": "u-1", "email": "seller@example.com", "name": "Sam"}
+PRODUCT = {
+    "id": "p-1", "title": "Bamboo desk lamp", "category": "home", "status": "available",
+    "seller_email": SELLER["email"], "eco_impact": {"co2": 2.0, "water": 10.0, "waste": 0.5}
+}
+
+
+class Collection:
+    """A mongomock collection whose bulk_write applies each UpdateOne on its own; mongomock's
+    bulk API does not accept the UpdateOne of current pymongo"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def bulk_write(self, requests, ordered=True):
+        for op in requests:
+            self.collection.update_one(op._filter, op._doc, upsert=op._upsert)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class RacingProducts(Collection):
+    """Holds every find_one_and_update until all parallel requests have reached it, then runs
+    them one at a time, as Mongo does for updates to one document"""
+
+    def __init__(self, collection, parties: int):
+        super().__init__(collection)
+        self.barrier = threading.Barrier(parties, timeout=10)
+        self.lock = threading.Lock()
+
+    def find_one_and_update(self, *args, **kwargs):
+        self.barrier.wait()
+        with self.lock:
+            return self.collection.find_one_and_update(*args, **kwargs)
+
+
+class BrokenCache:
+    """A user cache whose backend is down"""
+
+    def get(self, email):
+        raise ConnectionError("cache down")
+
+    def set(self, email, user):
+        raise ConnectionError("cache down")
+
+    def invalidate(self, *emails):
+        raise ConnectionError("cache down")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient().ecowave
+    db.users.insert_one(dict(SELLER))
+    db.products.insert_one(dict(PRODUCT))
+    for name in ("users", "products", "impact_rollups"):
+        monkeypatch.setattr(main, f"{name}_col", Collection(db[name]))
+    monkeypatch.setattr(main, "rate_limiter", None)
+    monkeypatch.setattr(main.email_outbox, "workers", 0)
+    return db
+
+
+@pytest.fixture
+def client(db):
+    return main.app.test_client()
+
+
+def mark_sold(client, buyer_email: str = "buyer@example.com"):
+    return client.post(
+        "/api/products/p-1/sold", json={"buyer_email": buyer_email},
+        headers={"Authorization": f"Bearer {create_jwt_for_user(SELLER)}"}
+    )
+
+
+def test_sale_completes_while_the_user_cache_is_down(client, db, monkeypatch):
+    monkeypatch.setattr(main, "user_cache", BrokenCache())
+    response = mark_sold(client)
+    assert response.status_code == 200
+    assert db.products.find_one({"id": "p-1"})["status"] == "sold"
+    assert db.users.find_one({"email": SELLER["email"]})["impact_stats"]["items_recycled"] == 1
+    assert db.impact_rollups.count_documents({}) > 0
+
+
+def test_oauth_login_works_while_the_user_cache_is_down(db, monkeypatch):
+    monkeypatch.setattr(main, "user_cache", BrokenCache())
+    user = main.upsert_oauth_user("new@example.com", "New")
+    assert user["email"] == "new@example.com"
+
+
+def test_parallel_requests_sell_the_item_once(db, monkeypatch):
+    parallel = 8
+    db.users.insert_many([{"user_id": f"b-{i}", "email": f"buyer{i}@example.com"} for i in range(parallel)])
+    monkeypatch.setattr(main, "products_col", RacingProducts(db.products, parallel))
+    statuses = []
+
+    def attempt(i):
+        statuses.append(mark_sold(main.app.test_client(), f"buyer{i}@example.com").status_code)
+
+    threads = [threading.Thread(target=attempt, args=(i,)) for i in range(parallel)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200] + [400] * (parallel - 1)
+    assert db.users.find_one({"email": SELLER["email"]})["impact_stats"]["items_recycled"] == 1
+    # Only the winning request's buyer is credited
+    assert db.users.count_documents({"impact_stats.items_purchased": 1}) == 1
+    # One increment in each rollup bucket the sale falls in
+    rollups = list(db.impact_rollups.find())
+    assert rollups and all(rollup["items"] == 1 for rollup in rollups)
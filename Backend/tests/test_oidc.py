@@ -0,0 +1,189 @@
+"""ProviderMetadataCache against a local stand-in OIDC provider (http.server serving discovery and JWKS)"""
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from oidc import ProviderMetadataCache
+
+
+class Provider:
+    """Serves /.well-known/openid-configuration and /jwks; set down to answer 503"""
+
+    def __init__(self):
+        self.requests = []
+        self.down = False
+        self.kid = "key-1"
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                provider.requests.append(path)
+                if provider.down:
+                    self.send_error(503)
+                    return
+                if path == "/.well-known/openid-configuration":
+                    body = {"issuer": provider.url, "jwks_uri": provider.url + "/jwks",
+                            "authorization_endpoint": provider.url + "/auth"}
+                elif path == "/jwks":
+                    body = {"keys": [{"kid": provider.kid, "kty": "RSA"}]}
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.discovery_url = self.url + "/.well-known/openid-configuration"
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def provider():
+    provider = Provider()
+    try:
+        yield provider
+    finally:
+        provider.close()
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "oidc" / "google.json")
+
+
+def wait_for(predicate, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+class Client:
+    """The part of an authlib OAuth client that apply() touches"""
+
+    def __init__(self):
+        self.server_metadata = {}
+
+
+def test_nothing_is_fetched_at_construction(provider, cache_path):
+    cache = ProviderMetadataCache(provider.discovery_url, cache_path)
+    assert provider.requests == []
+    assert cache.stats() == {"loaded": False, "age_seconds": None, "refreshes": 0}
+
+
+def test_cold_cache_fetches_once_and_writes_the_file(provider, cache_path):
+    cache = ProviderMetadataCache(provider.discovery_url, cache_path)
+    entry = cache.get()
+    assert entry["jwks"]["keys"][0]["kid"] == "key-1"
+    assert provider.requests == ["/.well-known/openid-configuration", "/jwks"]
+    cache.get()
+    assert len(provider.requests) == 2
+    with open(cache_path, encoding="utf-8") as f:
+        assert json.load(f)["discovery_url"] == provider.discovery_url
+
+
+def test_cold_cache_reads_from_disk(provider, cache_path):
+    ProviderMetadataCache(provider.discovery_url, cache_path).get()
+    provider.requests.clear()
+    # A restarted worker, with the provider unreachable
+    provider.down = True
+    entry = ProviderMetadataCache(provider.discovery_url, cache_path).get()
+    assert entry["metadata"]["jwks_uri"] == provider.url + "/jwks"
+    assert provider.requests == []
+
+
+def test_file_for_another_provider_is_ignored(provider, cache_path):
+    ProviderMetadataCache(provider.discovery_url, cache_path).get()
+    provider.requests.clear()
+    ProviderMetadataCache(provider.discovery_url + "?v=2", cache_path).get()
+    assert provider.requests == ["/.well-known/openid-configuration", "/jwks"]
+
+
+def test_stale_entry_is_served_while_refreshing_in_background(provider, cache_path):
+    cache = ProviderMetadataCache(provider.discovery_url, cache_path, ttl=60)
+    first = cache.get()
+    cache._entry = {**first, "fetched_at": first["fetched_at"] - 120}
+    provider.kid = "key-2"
+    # The stale copy is returned at once; the refresh happens on another thread
+    assert cache.get()["jwks"]["keys"][0]["kid"] == "key-1"
+    wait_for(lambda: cache.get()["jwks"]["keys"][0]["kid"] == "key-2")
+    assert cache.refreshes == 2
+    with open(cache_path, encoding="utf-8") as f:
+        assert json.load(f)["jwks"]["keys"][0]["kid"] == "key-2"
+
+
+def test_only_one_background_refresh_at_a_time(provider, cache_path):
+    started = threading.Event()
+    release = threading.Event()
+    fetches = []
+
+    def slow_fetch(url):
+        fetches.append(url)
+        started.set()
+        release.wait(5)
+        return {"jwks_uri": None}
+
+    cache = ProviderMetadataCache(provider.discovery_url, cache_path, ttl=0, fetch=slow_fetch)
+    cache._entry = {"fetched_at": 0, "metadata": {}, "jwks": None}
+    for _ in range(5):
+        cache.get()
+    started.wait(5)
+    release.set()
+    wait_for(lambda: not cache._refreshing)
+    assert fetches == [provider.discovery_url]
+
+
+def test_provider_outage_keeps_the_cached_copy(provider, cache_path):
+    cache = ProviderMetadataCache(provider.discovery_url, cache_path, ttl=60)
+    first = cache.get()
+    cache._entry = {**first, "fetched_at": first["fetched_at"] - 120}
+    provider.down = True
+    cache.get()
+    wait_for(lambda: not cache._refreshing and len(provider.requests) == 3)
+    assert cache.get()["jwks"] == first["jwks"]
+    assert cache.refreshes == 1
+    # Logins keep working off the old copy, and a refresh is retried once the provider is back
+    provider.down = False
+    cache.get()
+    wait_for(lambda: cache.refreshes == 2)
+
+
+def test_cold_cache_without_file_fails_while_provider_is_down(provider, cache_path):
+    provider.down = True
+    cache = ProviderMetadataCache(provider.discovery_url, cache_path)
+    with pytest.raises(OSError):
+        cache.get()
+    provider.down = False
+    assert cache.get()["jwks"]["keys"]
+
+
+def test_apply_hands_metadata_to_the_client_once_per_entry(provider, cache_path):
+    cache = ProviderMetadataCache(provider.discovery_url, cache_path)
+    client = Client()
+    cache.apply(client)
+    assert client.server_metadata["jwks"]["keys"][0]["kid"] == "key-1"
+    assert client.server_metadata["_loaded_at"] == cache.get()["fetched_at"]
+    # Keys the client re-fetched itself after a kid miss are not overwritten by the same entry
+    client.server_metadata["jwks"] = {"keys": [{"kid": "rotated"}]}
+    cache.apply(client)
+    assert client.server_metadata["jwks"]["keys"][0]["kid"] == "rotated"
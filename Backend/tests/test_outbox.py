@@ -0,0 +1,265 @@
+"""EmailOutbox against a local aiosmtpd server that requires STARTTLS and AUTH, like the real relay"""
+import ssl
+import time
+import shutil
+import socket
+import logging
+import subprocess
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+controller = pytest.importorskip("aiosmtpd.controller")
+smtp = pytest.importorskip("aiosmtpd.smtp")
+
+from outbox import (  # noqa: E402
+    EmailOutbox, SMTPConnection, STATUS_FAILED, STATUS_QUEUED, STATUS_SENDING, STATUS_SENT,
+    abandoned, claim_args, failure_update, new_job
+)
+
+USERNAME = "outbox@example.com"
+PASSWORD = "secret"
+
+
+class Relay:
+    """Records delivered messages and the connection each arrived on; can refuse the first few"""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+        self.refuse = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.refuse:
+            self.refuse -= 1
+            return "451 Try again later"
+        self.messages.append(envelope.content.decode("utf-8", "replace"))
+        self.sessions.add(id(session))
+        return "250 OK"
+
+
+def authenticate(server, session, envelope, mechanism, auth_data):
+    ok = auth_data.login == USERNAME.encode() and auth_data.password == PASSWORD.encode()
+    return smtp.AuthResult(success=ok)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def tls_context(tmp_path_factory):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is needed to make the relay's certificate")
+    directory = tmp_path_factory.mktemp("smtp-tls")
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(str(cert), str(key))
+    return context
+
+
+@pytest.fixture
+def relay(tls_context):
+    handler = Relay()
+    server = controller.Controller(
+        handler, hostname="127.0.0.1", port=free_port(), tls_context=tls_context,
+        require_starttls=True, authenticator=authenticate, auth_require_tls=True
+    )
+    server.start()
+    try:
+        yield handler, server
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().ecowave
+
+
+def render(seller_email: str, subject: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = USERNAME
+    msg["To"] = seller_email
+    msg["Subject"] = subject
+    msg.set_content("Is this still available?")
+    return msg
+
+
+def make_outbox(db, server, **kwargs) -> EmailOutbox:
+    options = {"workers": 1, "backoff_base": 0, "poll_interval": 0.05, **kwargs}
+    return EmailOutbox(
+        db.email_outbox, db.inquiries,
+        connection_factory=lambda: SMTPConnection(server.hostname, server.port, USERNAME, PASSWORD, timeout=5),
+        render=render, logger=logging.getLogger("test-outbox"), **options
+    )
+
+
+def queue_inquiry(db, outbox, inquiry_id: str) -> dict:
+    db.inquiries.insert_one({"inquiry_id": inquiry_id, "status": STATUS_QUEUED})
+    return outbox.enqueue(inquiry_id, {"seller_email": "seller@example.com", "subject": f"Inquiry {inquiry_id}"})
+
+
+def wait_for(predicate, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.02)
+    raise AssertionError("timed out")
+
+
+def statuses(db) -> dict:
+    return {i["inquiry_id"]: i["status"] for i in db.inquiries.find()}
+
+
+def test_claim_counts_the_attempt():
+    job = new_job("inq-1", {})
+    query, update = claim_args(lock_timeout=300)
+    assert update["$inc"] == {"attempts": 1}
+    assert update["$set"]["status"] == STATUS_SENDING
+    assert query["$or"][0]["status"] == STATUS_QUEUED
+    assert job["attempts"] == 0
+
+
+def test_failure_update_backs_off_then_gives_up():
+    status, fields = failure_update({"attempts": 1}, OSError("down"), max_attempts=3, backoff_base=10)
+    assert status == STATUS_QUEUED
+    assert fields["next_attempt_at"] > datetime.utcnow() + timedelta(seconds=9)
+    status, fields = failure_update({"attempts": 3}, OSError("down"), max_attempts=3, backoff_base=10)
+    assert status == STATUS_FAILED
+    assert fields["last_error"] == "down"
+
+
+def test_abandoned_only_after_max_attempts():
+    assert not abandoned({"attempts": 3}, max_attempts=3)
+    assert abandoned({"attempts": 4}, max_attempts=3)
+
+
+def test_queued_jobs_are_sent_over_one_session(db, relay):
+    handler, server = relay
+    outbox = make_outbox(db, server)
+    try:
+        for i in range(3):
+            queue_inquiry(db, outbox, f"inq-{i}")
+        wait_for(lambda: set(statuses(db).values()) == {STATUS_SENT})
+    finally:
+        outbox.stop()
+    assert len(handler.messages) == 3
+    assert len(handler.sessions) == 1
+    assert all(job["attempts"] == 1 for job in db.email_outbox.find())
+
+
+def test_refused_message_is_retried(db, relay):
+    handler, server = relay
+    handler.refuse = 1
+    outbox = make_outbox(db, server)
+    try:
+        queue_inquiry(db, outbox, "inq-retry")
+        wait_for(lambda: statuses(db)["inq-retry"] == STATUS_SENT)
+    finally:
+        outbox.stop()
+    job = db.email_outbox.find_one({"inquiry_id": "inq-retry"})
+    assert job["attempts"] == 2
+    assert "451" in job["last_error"]
+    assert len(handler.messages) == 1
+
+
+def test_gives_up_after_max_attempts(db, relay):
+    handler, server = relay
+    handler.refuse = 10
+    outbox = make_outbox(db, server, max_attempts=2)
+    try:
+        queue_inquiry(db, outbox, "inq-fail")
+        wait_for(lambda: statuses(db)["inq-fail"] == STATUS_FAILED)
+    finally:
+        outbox.stop()
+    assert db.email_outbox.find_one({"inquiry_id": "inq-fail"})["attempts"] == 2
+    assert handler.messages == []
+
+
+def test_jobs_from_before_a_restart_are_drained(db, relay):
+    handler, server = relay
+    # Queued by a previous process that exited before sending
+    job = new_job("inq-old", {"seller_email": "seller@example.com", "subject": "Left behind"})
+    db.email_outbox.insert_one(job)
+    db.inquiries.insert_one({"inquiry_id": "inq-old", "status": STATUS_QUEUED})
+    outbox = make_outbox(db, server)
+    outbox.start()
+    try:
+        wait_for(lambda: statuses(db)["inq-old"] == STATUS_SENT)
+    finally:
+        outbox.stop()
+    assert len(handler.messages) == 1
+
+
+class FlakyInquiries:
+    """An inquiries collection whose first status update raises"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.failures = 1
+
+    def update_one(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("connection reset")
+        return self.collection.update_one(*args, **kwargs)
+
+
+def test_enqueue_keeps_one_job_per_inquiry(db, relay):
+    _, server = relay
+    db.email_outbox.create_index("inquiry_id", unique=True)
+    outbox = make_outbox(db, server, workers=0)
+    queue_inquiry(db, outbox, "inq-once")
+    outbox.enqueue("inq-once", {"seller_email": "seller@example.com", "subject": "Again"})
+    assert db.email_outbox.count_documents({"inquiry_id": "inq-once"}) == 1
+    assert db.email_outbox.find_one()["payload"]["subject"] == "Inquiry inq-once"
+
+
+def test_worker_survives_a_failed_status_update(db, relay):
+    handler, server = relay
+    outbox = make_outbox(db, server)
+    outbox.inquiries_col = FlakyInquiries(db.inquiries)
+    try:
+        queue_inquiry(db, outbox, "inq-flaky")
+        wait_for(lambda: statuses(db)["inq-flaky"] == STATUS_SENT)
+        # The same worker thread carries on with later jobs
+        queue_inquiry(db, outbox, "inq-next")
+        wait_for(lambda: statuses(db)["inq-next"] == STATUS_SENT)
+        assert all(thread.is_alive() for thread in outbox._threads)
+    finally:
+        outbox.stop()
+    # At least once: the send whose result was lost goes out again
+    assert db.email_outbox.find_one({"inquiry_id": "inq-flaky"})["attempts"] == 2
+    assert len(handler.messages) == 3
+
+
+def test_stale_send_is_reclaimed_and_sent_again(db, relay):
+    handler, server = relay
+    stale = datetime.utcnow() - timedelta(seconds=600)
+    for inquiry_id, attempts in (("inq-crashed", 1), ("inq-poison", 2)):
+        job = new_job(inquiry_id, {"seller_email": "seller@example.com", "subject": inquiry_id})
+        job.update(status=STATUS_SENDING, locked_at=stale, attempts=attempts)
+        db.email_outbox.insert_one(job)
+        db.inquiries.insert_one({"inquiry_id": inquiry_id, "status": STATUS_QUEUED})
+    outbox = make_outbox(db, server, max_attempts=2, lock_timeout=300)
+    outbox.start()
+    try:
+        wait_for(lambda: STATUS_QUEUED not in statuses(db).values())
+    finally:
+        outbox.stop()
+    # At least once: the interrupted send goes out again, counted as a second attempt
+    assert statuses(db) == {"inq-crashed": STATUS_SENT, "inq-poison": STATUS_FAILED}
+    assert db.email_outbox.find_one({"inquiry_id": "inq-crashed"})["attempts"] == 2
+    # A job whose last allowed attempt never finished is not sent again
+    assert len(handler.messages) == 1
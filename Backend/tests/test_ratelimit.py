@@ -0,0 +1,119 @@
+import pytest
+
+import ratelimit
+from ratelimit import DEFAULT_POLICIES, LocalRateLimiter, Policy, client_ip, load_policies, retry_after_header
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_parse_rate_and_burst():
+    policy = Policy.parse("p", "20/hour:5")
+    assert policy.rate == pytest.approx(20 / 3600)
+    assert policy.burst == 5
+
+
+def test_parse_burst_defaults_to_count():
+    policy = Policy.parse("p", " 120/minute ")
+    assert policy.rate == 2
+    assert policy.burst == 120
+
+
+@pytest.mark.parametrize("spec", ["10/week", "10", "ten/hour", "10/hour:x"])
+def test_parse_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        Policy.parse("p", spec)
+
+
+def test_load_policies_applies_overrides():
+    policies = load_policies("inquiry_ip=1/second, extra=5/day:1")
+    assert set(policies) == set(DEFAULT_POLICIES) | {"extra"}
+    assert policies["inquiry_ip"].rate == 1
+    assert policies["extra"].burst == 1
+
+
+def test_bucket_starts_full_then_limits(clock):
+    limiter = LocalRateLimiter({"p": Policy.parse("p", "60/minute:3")})
+    assert [limiter.hit("p", "a")[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.hit("p", "a")
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+    assert limiter.stats()["limited"] == 1
+
+
+def test_refill_is_proportional_to_elapsed_time(clock):
+    limiter = LocalRateLimiter({"p": Policy.parse("p", "60/minute:3")})
+    for _ in range(3):
+        limiter.hit("p", "a")
+    clock.now += 0.5
+    allowed, retry_after = limiter.hit("p", "a")
+    assert not allowed
+    # Half a token came back, so the other half is 0.5s away
+    assert retry_after == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.hit("p", "a") == (True, 0.0)
+
+
+def test_refill_is_capped_at_burst(clock):
+    limiter = LocalRateLimiter({"p": Policy.parse("p", "60/minute:2")})
+    limiter.hit("p", "a")
+    clock.now += 3600
+    assert [limiter.hit("p", "a")[0] for _ in range(3)] == [True, True, False]
+
+
+def test_keys_and_policies_have_separate_buckets(clock):
+    limiter = LocalRateLimiter({"p": Policy.parse("p", "1/hour:1"), "q": Policy.parse("q", "1/hour:1")})
+    assert limiter.hit("p", "a")[0]
+    assert not limiter.hit("p", "a")[0]
+    assert limiter.hit("p", "b")[0]
+    assert limiter.hit("q", "a")[0]
+
+
+def test_evicted_bucket_starts_full(clock):
+    limiter = LocalRateLimiter({"p": Policy.parse("p", "1/hour:1")}, max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.hit("p", key)
+    assert limiter.stats()["buckets"] == 2
+    assert limiter.hit("p", "a")[0]
+
+
+def test_cost_above_tokens_waits_for_the_difference(clock):
+    limiter = LocalRateLimiter({"p": Policy.parse("p", "1/second:4")})
+    limiter.hit("p", "a", cost=3)
+    allowed, retry_after = limiter.hit("p", "a", cost=3)
+    assert not allowed
+    assert retry_after == pytest.approx(2.0)
+
+
+def test_retry_after_header_rounds_up_to_a_second():
+    assert retry_after_header(0.01) == "1"
+    assert retry_after_header(2.1) == "3"
+
+
+def test_client_ip_ignores_forwarded_for_without_trusted_proxies():
+    assert client_ip("10.0.0.1", "1.2.3.4") == "10.0.0.1"
+
+
+def test_client_ip_takes_the_hop_added_by_the_outermost_trusted_proxy():
+    # The client sent a made-up first hop; the two trusted proxies appended the real addresses
+    forwarded = "6.6.6.6, 203.0.113.7, 10.0.0.2"
+    assert client_ip("10.0.0.3", forwarded, trusted_proxies=1) == "10.0.0.2"
+    assert client_ip("10.0.0.3", forwarded, trusted_proxies=2) == "203.0.113.7"
+
+
+def test_client_ip_with_fewer_hops_than_trusted_proxies():
+    assert client_ip("10.0.0.3", "203.0.113.7", trusted_proxies=3) == "203.0.113.7"
+    assert client_ip("10.0.0.3", " , ", trusted_proxies=1) == "10.0.0.3"
+    assert client_ip(None) == "unknown"
@@ -0,0 +1,35 @@
+from search import build_search_query, build_terms_query, has_text_search
+
+
+def test_lone_word_matches_text_or_prefix():
+    query = build_search_query("Chairs")
+    assert query == {"$or": [
+        {"$text": {"$search": "chairs"}},
+        {"search_terms": {"$regex": "^chairs"}}
+    ]}
+    assert has_text_search(query)
+
+
+def test_completed_words_use_text_and_last_word_is_a_prefix():
+    query = build_search_query("oak dining ta")
+    assert query == {"$text": {"$search": "oak dining"}, "search_terms": {"$regex": "^ta"}}
+    assert has_text_search(query)
+
+
+def test_short_last_word_is_searched_as_a_word():
+    assert build_search_query("oak t") == {"$text": {"$search": "oak t"}}
+    assert build_search_query("t") == {"$text": {"$search": "t"}}
+
+
+def test_empty_search_has_no_filter():
+    assert build_search_query("  ?! ") == {}
+    assert not has_text_search({})
+
+
+def test_terms_query_never_uses_text():
+    assert build_terms_query("chairs") == {"search_terms": {"$regex": "^chairs"}}
+    assert build_terms_query("oak ta") == {"$and": [
+        {"search_terms": "oak"},
+        {"search_terms": {"$regex": "^ta"}}
+    ]}
+    assert not has_text_search(build_terms_query("oak ta"))
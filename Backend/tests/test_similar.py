@@ -0,0 +1,156 @@
+import os
+import logging
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from similar import SimilarItems, SimilarityIndex  # noqa: E402
+
+LISTINGS = [
+    {"id": "lamp", "title": "Bamboo desk lamp", "description": "Warm light", "category": "home", "material": "bamboo"},
+    {"id": "shelf", "title": "Bamboo wall shelf", "description": "Holds books", "category": "home", "material": "bamboo"},
+    {"id": "bowl", "title": "Bamboo salad bowl", "description": "Oiled finish", "category": "kitchen", "material": "bamboo"},
+    {"id": "jacket", "title": "Denim jacket", "description": "Worn twice", "category": "clothing", "material": "cotton"},
+]
+
+
+def listing(product_id: str, **fields) -> dict:
+    return {**next(p for p in LISTINGS if p["id"] == product_id), **fields}
+
+
+def ids(results) -> list:
+    return [product_id for product_id, _ in results]
+
+
+@pytest.fixture
+def index():
+    return SimilarityIndex.build(LISTINGS)
+
+
+def test_closest_listings_rank_first_and_exclude_the_query(index):
+    results = index.similar(listing("lamp"), limit=10)
+    # Same category and material beats same material alone; nothing shared scores nothing
+    assert ids(results) == ["shelf", "bowl"]
+    assert results[0][1] > results[1][1] > 0
+    assert all(score <= 1.0 + 1e-6 for _, score in results)
+
+
+def test_limit_and_min_score(index):
+    assert ids(index.similar(listing("lamp"), limit=1)) == ["shelf"]
+    top = index.similar(listing("lamp"), limit=10)[0][1]
+    assert ids(index.similar(listing("lamp"), limit=10, min_score=top)) == ["shelf"]
+
+
+def test_listing_not_in_the_index_is_vectorized_from_its_fields(index):
+    query = {"id": "new", "title": "Denim shorts", "category": "clothing", "material": "cotton"}
+    assert ids(index.similar(query, limit=10)) == ["jacket"]
+    assert index.similar({"id": "new", "title": "Unheard of"}, limit=10) == []
+
+
+def test_upsert_adds_a_delta_row(index):
+    index.upsert({"id": "tray", "title": "Bamboo serving tray", "category": "kitchen", "material": "bamboo"})
+    assert ids(index.similar(listing("bowl"), limit=1)) == ["tray"]
+    stats = index.stats()
+    assert (stats["listings"], stats["delta_rows"], stats["dead_rows"]) == (5, 1, 0)
+
+
+def test_edit_leaves_a_dead_row_and_scores_the_new_version(index):
+    index.upsert(listing("shelf", category="kitchen", title="Bamboo spice rack"))
+    stats = index.stats()
+    assert (stats["listings"], stats["delta_rows"], stats["dead_rows"]) == (4, 1, 1)
+    # Only the new row is scored; the old one would have been the lamp's best match
+    assert ids(index.similar(listing("lamp"), limit=10)).count("shelf") == 1
+    assert ids(index.similar(listing("bowl"), limit=1)) == ["shelf"]
+
+
+def test_remove_and_sold_events_drop_the_listing(index):
+    index.remove("shelf")
+    index.apply_event({"type": "sold", "product": listing("bowl")})
+    assert index.similar(listing("lamp"), limit=10) == []
+    assert index.stats()["dead_rows"] == 2
+    # Replays are harmless
+    index.remove("shelf")
+    index.apply_event({"type": "delete", "product": listing("bowl")})
+    assert len(index) == 2
+
+
+def test_save_and_load_round_trip_is_memory_mapped(index, tmp_path):
+    path = str(tmp_path / "similar" / "index")
+    index.upsert({"id": "tray", "title": "Bamboo serving tray", "category": "kitchen", "material": "bamboo"})
+    index.remove("jacket")
+    before = {p["id"]: index.similar(p, limit=10) for p in LISTINGS}
+    index.save(path)
+
+    loaded = SimilarityIndex.load(path)
+    stats = loaded.stats()
+    assert stats["mapped"]
+    assert (stats["listings"], stats["delta_rows"], stats["dead_rows"]) == (4, 0, 0)
+    assert not loaded.rows.flags.writeable
+    for product in LISTINGS:
+        after = loaded.similar(product, limit=10)
+        assert ids(after) == ids(before[product["id"]])
+        assert [s for _, s in after] == pytest.approx([s for _, s in before[product["id"]]], rel=1e-5)
+    # A loaded index still takes live updates, into its delta
+    loaded.upsert({"id": "stool", "title": "Denim stool", "category": "home", "material": "cotton"})
+    assert "stool" in ids(loaded.similar(listing("jacket"), limit=10))
+
+
+def test_saving_again_replaces_the_previous_arrays(index, tmp_path):
+    path = str(tmp_path / "index")
+    index.save(path)
+    index.save(path)
+    arrays = sorted(name for name in os.listdir(tmp_path) if name.endswith(".npy"))
+    assert len(arrays) == 3
+    assert SimilarityIndex.load(path) is not None
+
+
+def test_load_without_a_usable_snapshot(tmp_path):
+    path = str(tmp_path / "index")
+    assert SimilarityIndex.load(path) is None
+    SimilarityIndex.build(LISTINGS).save(path)
+    for name in os.listdir(tmp_path):
+        if name.endswith(".rows.npy"):
+            os.remove(tmp_path / name)
+    assert SimilarityIndex.load(path) is None
+
+
+def test_events_during_load_are_replayed_after_the_catch_up(index):
+    items = SimilarItems(logging.getLogger("test-similar"))
+    tray = {"id": "tray", "title": "Bamboo serving tray", "category": "kitchen", "material": "bamboo", "status": "available"}
+    # Before loading starts there is nothing to catch up with, so events are dropped
+    items.on_event({"type": "create", "product": tray})
+    assert items.begin()
+    assert not items.begin()
+    items.on_event({"type": "sold", "product": listing("shelf")})
+    items.on_event({"type": "create", "product": tray})
+    assert items.index is None
+    # The catch-up read saw the bowl edited; the held events are applied after it
+    items.install(index, changed=[listing("bowl", category="home")])
+    assert items.state == "ready"
+    assert ids(items.index.similar(listing("lamp"), limit=10)) == ["bowl", "tray"]
+    # Once ready, events go straight to the index
+    items.on_event({"type": "delete", "product": tray})
+    assert ids(items.index.similar(listing("lamp"), limit=10)) == ["bowl"]
+
+
+def test_failed_load_drops_held_events(index):
+    items = SimilarItems(logging.getLogger("test-similar"))
+    assert items.begin()
+    items.on_event({"type": "sold", "product": listing("shelf")})
+    items.fail(OSError("disk full"))
+    assert items.state == "failed"
+    # Not retried until RETRY_SECONDS have passed
+    assert not items.begin()
+    items.failed_at -= 3600
+    assert items.begin()
+    items.install(index)
+    assert "shelf" in ids(items.index.similar(listing("lamp"), limit=10))
+
+
+def test_bad_event_does_not_raise(index):
+    items = SimilarItems(logging.getLogger("test-similar"))
+    items.begin()
+    items.install(index)
+    items.on_event({"type": "create", "product": {"title": "No id"}})
+    assert items.stats()["state"] == "ready"
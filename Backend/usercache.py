@@ -0,0 +1,75 @@
+import time
+import threading
+from collections import OrderedDict
+
+from bson import json_util
+
+
+class LocalUserCache:
+    """Per-process TTL + LRU cache of user documents keyed by email"""
+
+    def __init__(self, ttl: float = 60, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, email: str):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[email]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            return dict(entry[1])
+
+    def set(self, email: str, user: dict) -> None:
+        with self._lock:
+            self._entries[email] = (time.monotonic() + self.ttl, dict(user))
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *emails) -> None:
+        with self._lock:
+            for email in emails:
+                self._entries.pop(email, None)
+
+    def stats(self) -> dict:
+        return {"backend": "local", "hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class RedisUserCache:
+    """User cache shared through Redis so every gunicorn worker sees invalidations"""
+
+    def __init__(self, url: str, ttl: float = 60, prefix: str = "ecowave:user:"):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email: str):
+        raw = self.redis.get(self.prefix + email)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json_util.loads(raw)
+
+    def set(self, email: str, user: dict) -> None:
+        self.redis.set(self.prefix + email, json_util.dumps(user), ex=max(1, int(self.ttl)))
+
+    def invalidate(self, *emails) -> None:
+        keys = [self.prefix + email for email in emails if email]
+        if keys:
+            self.redis.delete(*keys)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
@@ -29,10 +29,17 @@ export default function ContactSellerDialog({ open, onOpenChange, product }: Con
     const inquiryMutation = useMutation({
         mutationFn: inquiriesApi.create,
         onSuccess: (data) => {
+            if (data.duplicate) {
+                toast.info("You already sent this message", {
+                    description: "The seller has it; there is no need to send it again."
+                });
+                onOpenChange(false);
+                return;
+            }
             toast.success("Message sent successfully!", {
-                description: data.email_sent
-                    ? "The seller has been notified via email."
-                    : "Your inquiry was saved, but email notification failed."
+                description: data.email_queued
+                    ? "The seller will be notified via email shortly."
+                    : "Your inquiry was saved, but email notification is unavailable."
             });
             onOpenChange(false);
             // Reset form
@@ -0,0 +1,84 @@
+import { Card, CardContent } from "@/components/ui/card";
+import { Button } from "@/components/ui/button";
+import { Badge } from "@/components/ui/badge";
+import { useInfiniteQuery } from "@tanstack/react-query";
+import { inquiriesApi } from "@/lib/api";
+import { Loader2, Mail } from "lucide-react";
+
+interface InquiryInboxProps {
+    productId?: string; // Only this listing's inquiries
+}
+
+export default function InquiryInbox({ productId }: InquiryInboxProps) {
+    const { data, isLoading, error, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
+        queryKey: ['inquiries', productId ?? "all"],
+        queryFn: ({ pageParam }) =>
+            inquiriesApi.list(localStorage.getItem("token") || "", { product_id: productId, cursor: pageParam }),
+        initialPageParam: null as string | null,
+        getNextPageParam: (lastPage) => lastPage.next_cursor,
+    });
+    const inquiries = data?.pages.flatMap((page) => page.inquiries) ?? [];
+
+    if (isLoading) {
+        return (
+            <div className="flex items-center justify-center py-12">
+                <Loader2 className="h-8 w-8 animate-spin text-primary" />
+            </div>
+        );
+    }
+
+    if (error) {
+        return <p className="text-center py-8 text-red-500">{(error as Error).message}</p>;
+    }
+
+    if (inquiries.length === 0) {
+        return (
+            <div className="text-center py-12">
+                <Mail className="h-16 w-16 text-muted-foreground mx-auto mb-4" />
+                <p className="text-xl font-semibold mb-2">No inquiries yet</p>
+                <p className="text-muted-foreground">Messages from buyers about your listings will show up here.</p>
+            </div>
+        );
+    }
+
+    return (
+        <>
+            <div className="space-y-3">
+                {inquiries.map((inquiry) => (
+                    <Card key={inquiry.inquiry_id}>
+                        <CardContent className="p-4 space-y-2">
+                            <div className="flex items-start justify-between gap-2">
+                                <div>
+                                    <p className="font-semibold">{inquiry.product_title}</p>
+                                    <p className="text-sm text-muted-foreground">
+                                        {inquiry.buyer_name} &middot;{" "}
+                                        <a href={`mailto:${inquiry.buyer_email}`} className="underline">
+                                            {inquiry.buyer_email}
+                                        </a>
+                                    </p>
+                                </div>
+                                <div className="text-right shrink-0">
+                                    <Badge variant={inquiry.status === "failed" ? "destructive" : "secondary"}>
+                                        {inquiry.status === "sent" ? "emailed" : inquiry.status === "held" ? "not emailed" : inquiry.status}
+                                    </Badge>
+                                    <p className="text-xs text-muted-foreground mt-1">
+                                        {new Date(inquiry.created_at).toLocaleString()}
+                                    </p>
+                                </div>
+                            </div>
+                            <p className="text-sm whitespace-pre-line">{inquiry.buyer_message}</p>
+                        </CardContent>
+                    </Card>
+                ))}
+            </div>
+
+            {hasNextPage && (
+                <div className="flex justify-center mt-6">
+                    <Button variant="outline" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                        {isFetchingNextPage ? <Loader2 className="h-4 w-4 animate-spin" /> : "Load more"}
+                    </Button>
+                </div>
+            )}
+        </>
+    );
+}
@@ -2,8 +2,8 @@ import { useState } from "react";
 import { Card, CardContent } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Badge } from "@/components/ui/badge";
-import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
-import { productApi, Product } from "@/lib/api";
+import { useInfiniteQuery, useMutation, useQueryClient } from "@tanstack/react-query";
+import { productApi, sellerApi, Product } from "@/lib/api";
 import { Pencil, Trash2, Loader2, Package } from "lucide-react";
 import { toast } from "sonner";
 import {
@@ -27,11 +27,25 @@ export default function MyListings({ sellerEmail }: MyListingsProps) {
     const [deleteId, setDeleteId] = useState<string | null>(null);
     const [editProduct, setEditProduct] = useState<Product | null>(null);
 
-    const { data: listings = [], isLoading } = useQuery({
+    const { data, isLoading, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
         queryKey: ['seller-listings', sellerEmail],
-        queryFn: () => productApi.getBySellerEmail(sellerEmail),
+        queryFn: ({ pageParam }) =>
+            sellerApi.getDashboard(sellerEmail, localStorage.getItem("token") || "", { cursor: pageParam }),
+        initialPageParam: null as string | null,
+        getNextPageParam: (lastPage) => lastPage.next_cursor,
         enabled: !!sellerEmail,
     });
+    const summary = data?.pages[0];
+    const listings = data?.pages.flatMap((page) => page.products) ?? [];
+
+    // Dashboard rows carry a truncated description, so edit the full product
+    const openEditor = async (id: string) => {
+        try {
+            setEditProduct(await productApi.getById(id));
+        } catch (error) {
+            toast.error("Failed to load listing", { description: (error as Error).message });
+        }
+    };
 
     const deleteMutation = useMutation({
         mutationFn: productApi.delete,
@@ -76,12 +90,20 @@ export default function MyListings({ sellerEmail }: MyListingsProps) {
 
     return (
         <>
+            {summary && (
+                <div className="flex flex-wrap gap-2 mb-4">
+                    <Badge variant="secondary">{summary.counts.active} active</Badge>
+                    <Badge variant="secondary">{summary.counts.sold} sold</Badge>
+                    <Badge variant="secondary">{summary.inquiries.total} inquiries</Badge>
+                    <Badge variant="outline">{summary.impact.co2.toFixed(1)} kg CO₂ saved</Badge>
+                </div>
+            )}
             <div className="grid gap-4 md:grid-cols-2 lg:grid-cols-3">
                 {listings.map((product) => (
                     <Card key={product.id} className="overflow-hidden hover:shadow-lg transition-shadow">
                         <div className="aspect-square overflow-hidden bg-muted">
                             <img
-                                src={product.image || "/placeholder.jpg"}
+                                src={product.thumbnail || product.image || "/placeholder.jpg"}
                                 alt={product.title}
                                 className="w-full h-full object-cover"
                             />
@@ -105,7 +127,7 @@ export default function MyListings({ sellerEmail }: MyListingsProps) {
                                     variant="outline"
                                     size="sm"
                                     className="flex-1"
-                                    onClick={() => setEditProduct(product)}
+                                    onClick={() => openEditor(product.id)}
                                 >
                                     <Pencil className="h-4 w-4 mr-1" />
                                     Edit
@@ -125,6 +147,14 @@ export default function MyListings({ sellerEmail }: MyListingsProps) {
                 ))}
             </div>
 
+            {hasNextPage && (
+                <div className="flex justify-center mt-6">
+                    <Button variant="outline" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                        {isFetchingNextPage ? <Loader2 className="h-4 w-4 animate-spin" /> : "Load more"}
+                    </Button>
+                </div>
+            )}
+
             {/* Delete Confirmation Dialog */}
             <AlertDialog open={!!deleteId} onOpenChange={() => setDeleteId(null)}>
                 <AlertDialogContent>
@@ -1,4 +1,5 @@
 const API_BASE_URL = import.meta.env.VITE_API_ORIGIN || "http://localhost:5001/api";
+const API_ORIGIN = API_BASE_URL.replace(/\/api\/?$/, "");
 export const GOOGLE_AUTH_URL = API_BASE_URL ? API_BASE_URL.replace('/api', '') + "/auth/google" : "http://localhost:5001/auth/google";
 
 export interface ImpactStats {
@@ -16,6 +17,8 @@ export interface Product {
     price: number;
     badge: string;
     image: string;
+    image_hash?: string;
+    thumbnail?: string;
     category?: string;
     material?: string;
     eco_impact?: {
@@ -26,11 +29,48 @@ export interface Product {
     seller_id?: string;
     seller_email?: string;
     seller_location?: string;
+    distance_km?: number; // Only set on "near" results
     seller_phone?: string;
     created_at?: string;
     status?: string;
 }
 
+export interface ProductFilters {
+    category?: string;
+    search?: string;
+    limit?: number;
+    cursor?: string | null;
+    fields?: (keyof Product)[];
+    near?: string; // City name or "lat,lon"; results are sorted nearest first
+    radius_km?: number;
+}
+
+export interface ProductPage {
+    products: Product[];
+    next_cursor: string | null;
+}
+
+export type LiveEventType = "insert" | "update" | "sold" | "delete";
+
+export interface LiveEvent {
+    type: LiveEventType;
+    product: Product; // Only id and category on "delete"
+}
+
+// Card fields only; similarity is absent while the server falls back to same-category listings
+export type SimilarProduct = Pick<Product, "id" | "title" | "price" | "badge" | "image" | "thumbnail" | "category" | "status"> & {
+    similarity?: number;
+};
+
+export interface SellerDashboard {
+    counts: { active: number; sold: number; total: number };
+    impact: { co2: number; water: number; waste: number; items: number };
+    inquiries: { queued: number; sent: number; failed: number; held: number; total: number };
+    // Lightweight rows: description is truncated, so fetch the full product before editing
+    products: (Product & { inquiry_count: number })[];
+    next_cursor: string | null;
+}
+
 export interface Inquiry {
     inquiry_id: string;
     product_id: string;
@@ -39,21 +79,59 @@ export interface Inquiry {
     buyer_email: string;
     buyer_message: string;
     seller_email: string;
-    status: string;
+    // held: saved but not emailed, because the seller's daily inquiry mail cap was reached
+    status: "queued" | "sent" | "failed" | "held";
     created_at: string;
+    expires_at?: string;
 }
 
+export interface InquiryPage {
+    inquiries: Inquiry[];
+    next_cursor: string | null;
+}
+
+// Signed-in callers send their token so write rate limits count against their account
+const authHeaders = (): Record<string, string> => {
+    const token = localStorage.getItem("token");
+    return token ? { "Authorization": `Bearer ${token}` } : {};
+};
+
+// Stored images are served by the backend under /api/images/<hash>
+const resolveImageUrl = (url?: string) => (url && url.startsWith("/api/") ? API_ORIGIN + url : url);
+
+const withImageUrls = (product: Product): Product =>
+    product && {
+        ...product,
+        image: resolveImageUrl(product.image),
+        thumbnail: resolveImageUrl(product.thumbnail),
+    };
+
+// Apply a live event to a cached listing. Replayed events are harmless: an
+// insert for a product already shown just updates it.
+export const applyLiveEvent = (products: Product[] | undefined, event: LiveEvent, acceptInserts: boolean): Product[] | undefined => {
+    if (!products) return products;
+    const shown = products.some((p) => p.id === event.product.id);
+    if (event.type === "delete") return products.filter((p) => p.id !== event.product.id);
+    if (shown) return products.map((p) => (p.id === event.product.id ? { ...p, ...event.product } : p));
+    return acceptInserts && event.type === "insert" ? [event.product, ...products] : products;
+};
+
 export const productApi = {
-    // Fetch all products
-    getAll: async (filters?: { category?: string; search?: string }): Promise<Product[]> => {
+    // Fetch one page of products, pass next_cursor back in to get the following page
+    getPage: async (filters?: ProductFilters): Promise<ProductPage> => {
         const params = new URLSearchParams();
         if (filters?.category && filters.category !== "all") params.append("category", filters.category);
         if (filters?.search) params.append("search", filters.search);
+        if (filters?.limit) params.append("limit", String(filters.limit));
+        if (filters?.cursor) params.append("cursor", filters.cursor);
+        if (filters?.fields?.length) params.append("fields", filters.fields.join(","));
+        if (filters?.near) params.append("near", filters.near);
+        if (filters?.radius_km) params.append("radius_km", String(filters.radius_km));
 
         const response = await fetch(`${API_BASE_URL}/products?${params.toString()}`);
         if (!response.ok) throw new Error("Failed to fetch products");
         const data = await response.json();
-        return data.products;
+        return { products: data.products.map(withImageUrls), next_cursor: data.next_cursor ?? null };
     },
 
     // Fetch single product
@@ -61,19 +139,27 @@ export const productApi = {
         const response = await fetch(`${API_BASE_URL}/products/${id}`);
         if (!response.ok) throw new Error("Failed to fetch product");
         const data = await response.json();
-        return data.product;
+        return withImageUrls(data.product);
+    },
+
+    // Listings most like this one, best match first ("similarity" is the cosine score)
+    getSimilar: async (id: string, limit = 8): Promise<SimilarProduct[]> => {
+        const response = await fetch(`${API_BASE_URL}/products/${id}/similar?limit=${limit}`);
+        if (!response.ok) throw new Error("Failed to fetch similar products");
+        const data = await response.json();
+        return data.products.map(withImageUrls);
     },
 
     // Create new product
     create: async (product: Omit<Product, "id">): Promise<Product> => {
         const response = await fetch(`${API_BASE_URL}/products`, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
+            headers: { "Content-Type": "application/json", ...authHeaders() },
             body: JSON.stringify(product),
         });
         if (!response.ok) throw new Error("Failed to create product");
         const data = await response.json();
-        return data.product;
+        return withImageUrls(data.product);
     },
 
     // Get products by seller email
@@ -81,7 +167,7 @@ export const productApi = {
         const response = await fetch(`${API_BASE_URL}/products/seller/${encodeURIComponent(email)}`);
         if (!response.ok) throw new Error("Failed to fetch seller products");
         const data = await response.json();
-        return data.products;
+        return data.products.map(withImageUrls);
     },
 
     // Update product
@@ -93,7 +179,7 @@ export const productApi = {
         });
         if (!response.ok) throw new Error("Failed to update product");
         const data = await response.json();
-        return data.product;
+        return withImageUrls(data.product);
     },
 
     // Delete product
@@ -104,6 +190,22 @@ export const productApi = {
         if (!response.ok) throw new Error("Failed to delete product");
     },
 
+    // Stream listing changes over Server-Sent Events; returns a function that closes the stream.
+    // EventSource reconnects by itself and the server resumes from the last event id it sent.
+    subscribe: (filters: { category?: string }, onEvent: (event: LiveEvent) => void, onReset?: () => void): (() => void) => {
+        const params = new URLSearchParams();
+        if (filters.category && filters.category !== "all") params.append("category", filters.category);
+        const source = new EventSource(`${API_BASE_URL}/products/live?${params.toString()}`);
+        const handle = (message: MessageEvent) => {
+            const data = JSON.parse(message.data);
+            onEvent({ type: data.type, product: withImageUrls(data.product) });
+        };
+        for (const type of ["insert", "update", "sold", "delete"]) source.addEventListener(type, handle);
+        // Sent when the server could not replay what was missed; the listing should be refetched
+        if (onReset) source.addEventListener("reset", onReset);
+        return () => source.close();
+    },
+
     // Mark product as sold
     markSold: async (id: string, buyerEmail: string, token: string): Promise<void> => {
         const response = await fetch(`${API_BASE_URL}/products/${id}/sold`, {
@@ -121,6 +223,26 @@ export const productApi = {
     },
 };
 
+export const sellerApi = {
+    // Counts, impact, inquiry totals and one page of the seller's listings
+    getDashboard: async (
+        email: string,
+        token: string,
+        options?: { status?: "all" | "active" | "sold"; cursor?: string | null; limit?: number }
+    ): Promise<SellerDashboard> => {
+        const params = new URLSearchParams();
+        if (options?.status) params.append("status", options.status);
+        if (options?.cursor) params.append("cursor", options.cursor);
+        if (options?.limit) params.append("limit", String(options.limit));
+        const response = await fetch(`${API_BASE_URL}/sellers/${encodeURIComponent(email)}/dashboard?${params.toString()}`, {
+            headers: { "Authorization": `Bearer ${token}` }
+        });
+        if (!response.ok) throw new Error("Failed to fetch seller dashboard");
+        const data = await response.json();
+        return { ...data, products: data.products.map(withImageUrls) };
+    },
+};
+
 export const userApi = {
     getImpactStats: async (token: string): Promise<ImpactStats> => {
         const response = await fetch(`${API_BASE_URL}/user/impact`, {
@@ -141,10 +263,10 @@ export const inquiriesApi = {
         buyer_name: string;
         buyer_email: string;
         buyer_message: string;
-    }): Promise<{ inquiry: Inquiry; email_sent: boolean }> => {
+    }): Promise<{ inquiry: Inquiry; email_queued: boolean; duplicate: boolean }> => {
         const response = await fetch(`${API_BASE_URL}/inquiries`, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
+            headers: { "Content-Type": "application/json", ...authHeaders() },
             body: JSON.stringify(inquiry),
         });
         if (!response.ok) {
@@ -152,7 +274,22 @@ export const inquiriesApi = {
             throw new Error(error.error || "Failed to submit inquiry");
         }
         const data = await response.json();
-        return { inquiry: data.inquiry, email_sent: data.email_sent };
+        // duplicate: the same message was already sent recently, so nothing new was queued
+        return { inquiry: data.inquiry, email_queued: data.email_queued, duplicate: !!data.duplicate };
+    },
+
+    // One page of inquiries sent to the signed-in seller, newest first
+    list: async (token: string, options?: { product_id?: string; cursor?: string | null; limit?: number }): Promise<InquiryPage> => {
+        const params = new URLSearchParams();
+        if (options?.product_id) params.append("product_id", options.product_id);
+        if (options?.cursor) params.append("cursor", options.cursor);
+        if (options?.limit) params.append("limit", String(options.limit));
+        const response = await fetch(`${API_BASE_URL}/inquiries?${params.toString()}`, {
+            headers: { "Authorization": `Bearer ${token}` }
+        });
+        if (!response.ok) throw new Error("Failed to fetch inquiries");
+        const data = await response.json();
+        return { inquiries: data.inquiries, next_cursor: data.next_cursor ?? null };
     },
 };
 
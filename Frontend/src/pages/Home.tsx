@@ -4,15 +4,18 @@ import ProductCard from "@/components/ProductCard";
 import { Badge } from "@/components/ui/badge";
 import { Button } from "@/components/ui/button";
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogDescription } from "@/components/ui/dialog";
-import { Leaf, Filter, X } from "lucide-react";
+import { Leaf, Filter, X, Loader2 } from "lucide-react";
 import { toast } from "sonner";
-import { useState } from "react";
-import { useQuery } from "@tanstack/react-query";
-import { productApi } from "@/lib/api";
+import { useState, useEffect } from "react";
+import { InfiniteData, useInfiniteQuery, useQueryClient } from "@tanstack/react-query";
+import { productApi, applyLiveEvent, Product, ProductPage } from "@/lib/api";
 import { useSearchParams } from "react-router-dom";
 import ContactSellerDialog from "@/components/ContactSellerDialog";
 import { useCartStore } from "@/lib/store";
 
+// What the grid, cart and contact dialog use; the detail dialog loads the full listing
+const CARD_FIELDS: (keyof Product)[] = ["id", "title", "price", "badge", "image", "thumbnail", "category", "status", "seller_email"];
+
 const Home = () => {
   const [selectedProduct, setSelectedProduct] = useState(null);
   const [isDialogOpen, setIsDialogOpen] = useState(false);
@@ -23,14 +26,44 @@ const Home = () => {
   const currentCategory = searchParams.get("category") || "all";
   const currentSearch = searchParams.get("search") || "";
 
-  const { data: products = [], isLoading, error } = useQuery({
+  const { data, isLoading, error, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
     queryKey: ['products', currentCategory, currentSearch],
-    queryFn: () => productApi.getAll({ category: currentCategory, search: currentSearch }),
+    queryFn: ({ pageParam }) =>
+      productApi.getPage({ category: currentCategory, search: currentSearch, fields: CARD_FIELDS, cursor: pageParam }),
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.next_cursor,
   });
+  const products = data?.pages.flatMap((page) => page.products) ?? [];
+
+  // Keep the listing current from the live feed instead of refetching it
+  const queryClient = useQueryClient();
+  useEffect(() => {
+    const queryKey = ['products', currentCategory, currentSearch];
+    return productApi.subscribe(
+      { category: currentCategory },
+      // New listings can't be matched against a search here, so they only appear in unsearched views
+      (event) => queryClient.setQueryData<InfiniteData<ProductPage>>(queryKey, (current) => current && {
+        ...current,
+        // Inserts go to the top of the first page; updates and removals apply wherever the listing is shown
+        pages: current.pages.map((page, i) => ({
+          ...page,
+          products: applyLiveEvent(page.products, event, i === 0 && !currentSearch) ?? page.products,
+        })),
+      }),
+      () => queryClient.invalidateQueries({ queryKey })
+    );
+  }, [currentCategory, currentSearch, queryClient]);
 
-  const handleProductClick = (product) => {
+  const handleProductClick = async (product) => {
     setSelectedProduct(product);
     setIsDialogOpen(true);
+    // Grid rows carry card fields only, so fetch the description for the dialog
+    try {
+      const full = await productApi.getById(product.id);
+      setSelectedProduct((current) => (current?.id === full.id ? full : current));
+    } catch (error) {
+      toast.error("Failed to load listing", { description: (error as Error).message });
+    }
   };
 
   const handleContactSeller = (product) => {
@@ -160,7 +193,7 @@ const Home = () => {
                     : "Top Eco-Friendly Items"}
                 </h2>
                 <p className="text-muted-foreground">
-                  {products.length} {products.length === 1 ? 'product' : 'products'} found
+                  {products.length}{hasNextPage ? "+" : ""} {products.length === 1 && !hasNextPage ? 'product' : 'products'} found
                 </p>
               </div>
               <Badge
@@ -188,7 +221,7 @@ const Home = () => {
                 {products.map((product) => (
                   <ProductCard
                     key={product.id}
-                    image={product.image || "/placeholder.jpg"}
+                    image={product.thumbnail || product.image || "/placeholder.jpg"}
                     title={product.title}
                     price={product.price}
                     badge={product.badge}
@@ -202,6 +235,14 @@ const Home = () => {
                 ))}
               </div>
             )}
+
+            {hasNextPage && (
+              <div className="flex justify-center mt-8">
+                <Button variant="outline" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                  {isFetchingNextPage ? <Loader2 className="h-4 w-4 animate-spin" /> : "Load more"}
+                </Button>
+              </div>
+            )}
           </div>
         </section>
 
@@ -35,6 +35,14 @@ export default function ProductDetail() {
         enabled: !!id,
     });
 
+    // Loads alongside the product; a failure just leaves the section out
+    const { data: similar } = useQuery({
+        queryKey: ['similar', id],
+        queryFn: () => productApi.getSimilar(id!),
+        enabled: !!id,
+        staleTime: 60_000,
+    });
+
     const markSoldMutation = useMutation({
         mutationFn: async () => {
             const token = localStorage.getItem("token");
@@ -258,6 +266,37 @@ export default function ProductDetail() {
                 </div>
             </div>
 
+            {similar && similar.length > 0 && (
+                <Card className="mt-6">
+                    <CardHeader>
+                        <CardTitle className="text-lg">Similar items</CardTitle>
+                    </CardHeader>
+                    <CardContent>
+                        <div className="grid grid-cols-2 sm:grid-cols-4 gap-4">
+                            {similar.map((item) => (
+                                <button
+                                    key={item.id}
+                                    type="button"
+                                    onClick={() => navigate(`/product/${item.id}`)}
+                                    className="text-left rounded-lg border hover:shadow-md transition-shadow overflow-hidden"
+                                >
+                                    <img
+                                        src={item.thumbnail || item.image || "/placeholder.jpg"}
+                                        alt={item.title}
+                                        loading="lazy"
+                                        className="w-full h-32 object-cover bg-muted/20"
+                                    />
+                                    <div className="p-2">
+                                        <p className="text-sm font-medium line-clamp-2">{item.title}</p>
+                                        <p className="text-sm font-bold text-primary">₹{item.price}</p>
+                                    </div>
+                                </button>
+                            ))}
+                        </div>
+                    </CardContent>
+                </Card>
+            )}
+
             {product && (
                 <ContactSellerDialog
                     open={isContactDialogOpen}
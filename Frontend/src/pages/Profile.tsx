@@ -3,10 +3,11 @@ import Footer from "@/components/Footer";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { Button } from "@/components/ui/button";
-import { User, Mail, Package, LogOut } from "lucide-react";
+import { User, Mail, Package, LogOut, Inbox } from "lucide-react";
 import { useAuthStore } from "@/lib/store";
 import { useNavigate } from "react-router-dom";
 import MyListings from "@/components/MyListings";
+import InquiryInbox from "@/components/InquiryInbox";
 import { useState } from "react";
 import { useQuery } from "@tanstack/react-query";
 import { userApi } from "@/lib/api";
@@ -18,6 +19,7 @@ const Profile = () => {
     const logout = useAuthStore((state) => state.logout);
     const navigate = useNavigate();
     const [showListings, setShowListings] = useState(false);
+    const [showInquiries, setShowInquiries] = useState(false);
 
     const { data: impactStats } = useQuery({
         queryKey: ['impact-stats'],
@@ -140,6 +142,29 @@ const Profile = () => {
                             )}
                         </Card>
 
+                        {/* Inquiries Section */}
+                        <Card>
+                            <CardHeader>
+                                <div className="flex items-center justify-between">
+                                    <CardTitle className="flex items-center gap-2">
+                                        <Inbox className="h-5 w-5 text-secondary" />
+                                        Inquiries
+                                    </CardTitle>
+                                    <Button
+                                        variant="outline"
+                                        onClick={() => setShowInquiries(!showInquiries)}
+                                    >
+                                        {showInquiries ? "Hide" : "Show"} Inquiries
+                                    </Button>
+                                </div>
+                            </CardHeader>
+                            {showInquiries && (
+                                <CardContent>
+                                    <InquiryInbox />
+                                </CardContent>
+                            )}
+                        </Card>
+
                         {/* Quick Actions */}
                         <Card>
                             <CardContent className="pt-6">
@@ -14,6 +14,8 @@ echo "Starting EcoWave..."
 # Start Backend
 echo "Starting Backend on port 5001..."
 cd Backend
+# Search, inquiry dedup and expiry need the indexes; a no-op when they already exist
+flask --app main create-indexes || { echo "Could not create MongoDB indexes; is MongoDB running?"; exit 1; }
 python3 main.py &
 BACKEND_PID=$!
 cd ..